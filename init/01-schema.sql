@@ -33,6 +33,9 @@ CREATE TABLE Customer (
     Debt DECIMAL(15, 2) DEFAULT 0
 );
 
+-- Customers are matched by email when loading data
+CREATE INDEX idx_customer_email ON Customer (Email);
+
 -- 4. WALLET (1:1 with Customer)
 CREATE TABLE Wallet (
     CustomerID INT PRIMARY KEY,
@@ -56,7 +59,7 @@ CREATE TABLE Product (
     Name VARCHAR(255) NOT NULL,
     Category VARCHAR(100),
     SubCategory VARCHAR(100),
-    BaseInfo TEXT,
+    BaseInfo JSONB,
     TaxAmount DECIMAL(10, 2) DEFAULT 0.10
 );
 
@@ -130,6 +133,7 @@ CREATE TABLE OrderItem (
     Quantity INT NOT NULL,
     CalculatedItemPrice DECIMAL(15, 2),
     ItemStatus VARCHAR(50) CHECK (ItemStatus IN ('awaiting payment', 'item procurement', 'shipped', 'received', 'unknown', 'Pending Return Review', 'Return Approved', 'Return Rejected')),
+    OrderDate TIMESTAMP NOT NULL,  -- the order's OrderDate (copied by trigger), for date filters on items
     PRIMARY KEY (OrderID, ProductID),
     CONSTRAINT FK_Item_Order FOREIGN KEY (OrderID) REFERENCES Order_Header(OrderID),
     CONSTRAINT FK_Item_Product FOREIGN KEY (ProductID) REFERENCES Product(ProductID)
@@ -180,9 +184,182 @@ CREATE TABLE BranchSupplyOffer (
     LeadTime INT,
     Discount DECIMAL(5, 2),
     IsAvailable BOOLEAN DEFAULT TRUE,
-    TechnicalSpecs_JSON TEXT,
+    TechnicalSpecs_JSON JSONB,
     PRIMARY KEY (BranchID, ProductID, SupplierID),
     CONSTRAINT FK_Offer_Branch FOREIGN KEY (BranchID) REFERENCES Branch(BranchID),
     CONSTRAINT FK_Offer_Product FOREIGN KEY (ProductID) REFERENCES Product(ProductID),
     CONSTRAINT FK_Offer_Supplier FOREIGN KEY (SupplierID) REFERENCES Supplier(SupplierID)
 );
+
+-- 17. OPTIONAL TIME-RANGE PARTITIONING
+-- Order_Header and OrderItem by OrderDate, WalletTransaction by Date, in monthly or yearly
+-- partitions. Off by default; chosen when the database is created, e.g.
+--   PGOPTIONS="-c bdbkala.partition_interval=month" psql ... -f init/01-schema.sql
+-- (PGOPTIONS in the postgres service environment does the same for docker-compose).
+-- Keys of a partitioned table must contain its partition key: the primary keys gain the
+-- date, and Shipment, RepaymentHistory and ReturnRequest get the order's OrderDate for
+-- their foreign keys (copied by trigger, see 03-constraints-triggers.sql). OrderID stays
+-- unique through OrderKey, an unpartitioned table holding every OrderID once.
+CREATE TABLE PartitionScheme (
+    ParentTable TEXT PRIMARY KEY,  -- lower-case table name
+    KeyColumn TEXT NOT NULL,       -- lower-case column name
+    Granularity TEXT NOT NULL CHECK (Granularity IN ('month', 'year'))
+);
+
+-- Create the missing partitions covering [lo, hi] of parent (lower-case name), or of every
+-- partitioned table when parent is NULL; the load scripts call it before writing. Returns
+-- the number created (0 when not partitioned).
+CREATE OR REPLACE FUNCTION ensure_time_partitions(lo TIMESTAMP, hi TIMESTAMP, parent TEXT DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+  s RECORD;
+  step INTERVAL;
+  bound TIMESTAMP;
+  part TEXT;
+  locked BOOLEAN := FALSE;
+  created INT := 0;
+BEGIN
+  FOR s IN
+    SELECT * FROM PartitionScheme
+    WHERE lo IS NOT NULL AND hi IS NOT NULL AND (parent IS NULL OR ParentTable = parent)
+    ORDER BY ParentTable
+  LOOP
+    step := ('1 ' || s.Granularity)::interval;
+    bound := date_trunc(s.Granularity, lo);
+    WHILE bound <= hi LOOP
+      part := s.ParentTable || '_p' || to_char(bound, CASE s.Granularity WHEN 'month' THEN 'YYYYMM' ELSE 'YYYY' END);
+      IF to_regclass(part) IS NULL THEN
+        IF NOT locked THEN
+          -- concurrent loaders: the first creates, the others wait for it to commit
+          PERFORM pg_advisory_xact_lock(hashtext('ensure_time_partitions'));
+          locked := TRUE;
+        END IF;
+        IF to_regclass(part) IS NULL THEN
+          EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                         part, s.ParentTable, bound, bound + step);
+          created := created + 1;
+        END IF;
+      END IF;
+      bound := bound + step;
+    END LOOP;
+  END LOOP;
+  RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach the partitions holding only rows before cutoff (items before their orders) and
+-- return their names. They stay as standalone archive tables without the foreign keys to
+-- the partitioned tables. Shipments, repayments and return requests of those orders must
+-- be removed first, or the detach fails. Summary tables (02-views.sql) keep their totals,
+-- and OrderKey keeps the archived OrderIDs so they are not given out again.
+CREATE OR REPLACE FUNCTION detach_time_partitions(cutoff TIMESTAMP)
+RETURNS SETOF TEXT AS $$
+DECLARE
+  p RECORD;
+  fk RECORD;
+BEGIN
+  FOR p IN
+    SELECT s.ParentTable, i.inhrelid::regclass AS part
+    FROM PartitionScheme s
+    JOIN pg_inherits i ON i.inhparent = s.ParentTable::regclass
+    JOIN pg_class k ON k.oid = i.inhrelid
+    WHERE substring(pg_get_expr(k.relpartbound, k.oid) FROM 'TO \(''([^'']+)''\)')::timestamp <= cutoff
+    ORDER BY s.ParentTable = 'order_header', k.relname
+  LOOP
+    EXECUTE format('ALTER TABLE %I DETACH PARTITION %s', p.ParentTable, p.part);
+    FOR fk IN
+      SELECT conname FROM pg_constraint
+      WHERE conrelid = p.part AND contype = 'f'
+        AND confrelid IN (SELECT ParentTable::regclass FROM PartitionScheme)
+    LOOP
+      EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', p.part, fk.conname);
+    END LOOP;
+    RETURN NEXT p.part::text;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Keeps OrderKey in step with a partitioned Order_Header. Inserting an OrderID that is
+-- already there fails on OrderKey's primary key, also when two loaders insert it at once
+-- (the second waits for the first to commit), which the partition-local keys cannot catch.
+CREATE OR REPLACE FUNCTION fn_order_key_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO OrderKey (OrderID) SELECT OrderID FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- only the OrderIDs the statement changed
+    DELETE FROM OrderKey
+    WHERE OrderID IN (SELECT OrderID FROM old_rows EXCEPT ALL SELECT OrderID FROM new_rows);
+    INSERT INTO OrderKey (OrderID) SELECT OrderID FROM new_rows EXCEPT ALL SELECT OrderID FROM old_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    DELETE FROM OrderKey k USING old_rows o WHERE k.OrderID = o.OrderID;
+  ELSE
+    DELETE FROM OrderKey;  -- TRUNCATE
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  g TEXT := COALESCE(NULLIF(current_setting('bdbkala.partition_interval', true), ''), 'none');
+BEGIN
+  IF g = 'none' THEN
+    RETURN;
+  END IF;
+  IF g NOT IN ('month', 'year') THEN
+    RAISE EXCEPTION 'bdbkala.partition_interval must be month, year or none, not %', g;
+  END IF;
+
+  -- The tables are still empty: recreate them partitioned (columns, defaults and checks kept)
+  ALTER TABLE Order_Header RENAME TO order_header_unpartitioned;
+  ALTER TABLE OrderItem RENAME TO orderitem_unpartitioned;
+  ALTER TABLE WalletTransaction RENAME TO wallettransaction_unpartitioned;
+  CREATE TABLE Order_Header (LIKE order_header_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (OrderDate);
+  CREATE TABLE OrderItem (LIKE orderitem_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (OrderDate);
+  CREATE TABLE WalletTransaction (LIKE wallettransaction_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (Date);
+  DROP TABLE orderitem_unpartitioned, order_header_unpartitioned, wallettransaction_unpartitioned CASCADE;
+
+  -- A row is routed to its partition before trg_order_date_now sets OrderDate, so an insert
+  -- without one needs this default (the same value the trigger gives it) to find a partition
+  ALTER TABLE Order_Header
+    ALTER COLUMN OrderDate SET DEFAULT CURRENT_TIMESTAMP,
+    ADD PRIMARY KEY (OrderID, OrderDate),
+    ADD CONSTRAINT FK_Order_Customer FOREIGN KEY (CustomerID) REFERENCES Customer(CustomerID),
+    ADD CONSTRAINT FK_Order_Branch FOREIGN KEY (BranchID) REFERENCES Branch(BranchID);
+  CREATE TABLE OrderKey (OrderID INT PRIMARY KEY);
+  CREATE TRIGGER trg_order_key_ins AFTER INSERT ON Order_Header
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_order_key_sync();
+  CREATE TRIGGER trg_order_key_upd AFTER UPDATE ON Order_Header
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_order_key_sync();
+  CREATE TRIGGER trg_order_key_del AFTER DELETE ON Order_Header
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_order_key_sync();
+  CREATE TRIGGER trg_order_key_truncate AFTER TRUNCATE ON Order_Header
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_order_key_sync();
+  ALTER TABLE OrderItem
+    ADD PRIMARY KEY (OrderID, ProductID, OrderDate),
+    ADD CONSTRAINT FK_Item_Order FOREIGN KEY (OrderID, OrderDate) REFERENCES Order_Header(OrderID, OrderDate),
+    ADD CONSTRAINT FK_Item_Product FOREIGN KEY (ProductID) REFERENCES Product(ProductID);
+  ALTER TABLE WalletTransaction
+    ADD PRIMARY KEY (TransactionID, Date),
+    ADD CONSTRAINT FK_WTrans_Wallet FOREIGN KEY (CustomerID) REFERENCES Wallet(CustomerID);
+
+  ALTER TABLE Shipment
+    ADD COLUMN OrderDate TIMESTAMP NOT NULL,
+    ADD CONSTRAINT FK_Shipment_Order FOREIGN KEY (OrderID, OrderDate) REFERENCES Order_Header(OrderID, OrderDate);
+  ALTER TABLE RepaymentHistory
+    ADD COLUMN OrderDate TIMESTAMP NOT NULL,
+    ADD CONSTRAINT FK_Repayment_Order FOREIGN KEY (OrderID, OrderDate) REFERENCES Order_Header(OrderID, OrderDate);
+  ALTER TABLE ReturnRequest
+    ADD COLUMN OrderDate TIMESTAMP NOT NULL,
+    ADD CONSTRAINT FK_Return_OrderItem FOREIGN KEY (OrderID, ProductID, OrderDate)
+      REFERENCES OrderItem(OrderID, ProductID, OrderDate);
+
+  INSERT INTO PartitionScheme (ParentTable, KeyColumn, Granularity)
+  VALUES ('order_header', 'orderdate', g), ('orderitem', 'orderdate', g), ('wallettransaction', 'date', g);
+  PERFORM ensure_time_partitions(LOCALTIMESTAMP, LOCALTIMESTAMP + ('1 ' || g)::interval);
+END $$;
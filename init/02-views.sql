@@ -12,29 +12,750 @@ WHERE oi.ItemStatus IN ('awaiting payment', 'item procurement')
 GROUP BY p.ProductID, p.Name, p.Category, p.SubCategory
 ORDER BY TotalQuantity DESC;
 
-CREATE MATERIALIZED VIEW mv_daily_sales_profit AS
-SELECT
-    DATE(oh.OrderDate) AS sale_date,
-    SUM(oh.TotalAmount) AS total_sales,
-    SUM(oh.TotalAmount) - SUM(
-        oi.Quantity * COALESCE(
-            (SELECT MIN(bso.SupplyPrice)
-             FROM BranchSupplyOffer bso
-             WHERE bso.BranchID = oh.BranchID
-               AND bso.ProductID = oi.ProductID),
-            0
-        )
-    ) AS total_profit
-FROM Order_Header oh
-JOIN OrderItem oi ON oh.OrderID = oi.OrderID
-GROUP BY DATE(oh.OrderDate)
+-- Cheapest offer per (branch, product), derived from BranchSupplyOffer and kept current by
+-- triggers, so reports look up one row instead of scanning the offers of a pair.
+-- OfferCount, MarginSum and LeadTimeSum/LeadTimeCount let per-offer sums and averages
+-- (queries/1.sql, queries/11.sql) be computed from one row per pair.
+CREATE TABLE IF NOT EXISTS BranchProductBestOffer (
+    BranchID INT NOT NULL,
+    ProductID INT NOT NULL,
+    MinSupplyPrice DECIMAL(15, 2),
+    MinSellingPrice DECIMAL(15, 2),
+    BestSupplierID INT,               -- supplier with the lowest SupplyPrice (lowest SupplierID on ties)
+    MinLeadTime INT,
+    OfferCount INT NOT NULL,
+    MarginSum DECIMAL(15, 2),         -- SUM(SellingPrice - SupplyPrice) over the pair's offers
+    LeadTimeSum BIGINT,
+    LeadTimeCount INT NOT NULL,
+    PRIMARY KEY (BranchID, ProductID)
+);
+
+CREATE OR REPLACE FUNCTION fn_best_offer_recompute(pairs INT[][])
+RETURNS VOID AS $$
+  DELETE FROM BranchProductBestOffer bp
+  USING (SELECT pairs[i][1] AS BranchID, pairs[i][2] AS ProductID FROM generate_subscripts(pairs, 1) AS i) k
+  WHERE bp.BranchID = k.BranchID AND bp.ProductID = k.ProductID;
+  INSERT INTO BranchProductBestOffer
+      (BranchID, ProductID, MinSupplyPrice, MinSellingPrice, BestSupplierID, MinLeadTime,
+       OfferCount, MarginSum, LeadTimeSum, LeadTimeCount)
+  SELECT
+      bso.BranchID,
+      bso.ProductID,
+      MIN(bso.SupplyPrice),
+      MIN(bso.SellingPrice),
+      (array_agg(bso.SupplierID ORDER BY bso.SupplyPrice NULLS LAST, bso.SupplierID))[1],
+      MIN(bso.LeadTime),
+      COUNT(*),
+      SUM(bso.SellingPrice - bso.SupplyPrice),
+      SUM(bso.LeadTime),
+      COUNT(bso.LeadTime)
+  FROM BranchSupplyOffer bso
+  JOIN (SELECT DISTINCT pairs[i][1] AS BranchID, pairs[i][2] AS ProductID FROM generate_subscripts(pairs, 1) AS i) k
+    ON k.BranchID = bso.BranchID AND k.ProductID = bso.ProductID
+  GROUP BY bso.BranchID, bso.ProductID;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_best_offer_touch()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fn_best_offer_recompute(ARRAY(SELECT ARRAY[BranchID, ProductID] FROM new_rows));
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fn_best_offer_recompute(ARRAY(SELECT ARRAY[BranchID, ProductID] FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_best_offer_ins ON BranchSupplyOffer;
+CREATE TRIGGER trg_best_offer_ins AFTER INSERT ON BranchSupplyOffer
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_best_offer_touch();
+DROP TRIGGER IF EXISTS trg_best_offer_upd ON BranchSupplyOffer;
+CREATE TRIGGER trg_best_offer_upd AFTER UPDATE ON BranchSupplyOffer
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_best_offer_touch();
+DROP TRIGGER IF EXISTS trg_best_offer_del ON BranchSupplyOffer;
+CREATE TRIGGER trg_best_offer_del AFTER DELETE ON BranchSupplyOffer
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_best_offer_touch();
+
+-- Offers already in the database when this file is applied
+SELECT fn_best_offer_recompute(ARRAY(SELECT DISTINCT ARRAY[BranchID, ProductID] FROM BranchSupplyOffer));
+
+-- Daily sales and profit, maintained incrementally instead of a full REFRESH MATERIALIZED VIEW.
+-- Statement-level triggers on Order_Header, OrderItem and BranchSupplyOffer mark the sale dates
+-- they touch; refresh_daily_sales_profit() re-aggregates only those dates. Numbers are the same
+-- as the former materialized view (one row per Order_Header x OrderItem join row).
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'mv_daily_sales_profit') THEN
+    DROP MATERIALIZED VIEW mv_daily_sales_profit;
+  END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS DailySalesProfit (
+    sale_date DATE PRIMARY KEY,
+    total_sales NUMERIC NOT NULL,
+    total_profit NUMERIC NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS DailySalesProfitDirty (
+    sale_date DATE PRIMARY KEY,
+    MarkedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_header_orderdate ON Order_Header (OrderDate);
+
+-- Marks dates; DO UPDATE locks an already-marked date, so a refresh running meanwhile
+-- waits for this transaction and then sees its rows
+CREATE OR REPLACE FUNCTION fn_daily_sales_mark(dates DATE[])
+RETURNS VOID AS $$
+  INSERT INTO DailySalesProfitDirty (sale_date)
+  SELECT DISTINCT d FROM unnest(dates) AS d WHERE d IS NOT NULL
+  ON CONFLICT (sale_date) DO UPDATE SET MarkedAt = EXCLUDED.MarkedAt;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_daily_sales_touch_order()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(SELECT DISTINCT DATE(OrderDate) FROM new_rows));
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(SELECT DISTINCT DATE(OrderDate) FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_daily_sales_touch_item()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(
+      SELECT DISTINCT DATE(oh.OrderDate) FROM Order_Header oh WHERE oh.OrderID IN (SELECT OrderID FROM new_rows)));
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(
+      SELECT DISTINCT DATE(oh.OrderDate) FROM Order_Header oh WHERE oh.OrderID IN (SELECT OrderID FROM old_rows)));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A supply price change moves the profit of every date with an item of that branch and product
+CREATE OR REPLACE FUNCTION fn_daily_sales_touch_offer()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(
+      SELECT DISTINCT DATE(oh.OrderDate)
+      FROM (SELECT DISTINCT BranchID, ProductID FROM new_rows) c
+      JOIN Order_Header oh ON oh.BranchID = c.BranchID
+      JOIN OrderItem oi ON oi.OrderID = oh.OrderID AND oi.ProductID = c.ProductID));
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fn_daily_sales_mark(ARRAY(
+      SELECT DISTINCT DATE(oh.OrderDate)
+      FROM (SELECT DISTINCT BranchID, ProductID FROM old_rows) c
+      JOIN Order_Header oh ON oh.BranchID = c.BranchID
+      JOIN OrderItem oi ON oi.OrderID = oh.OrderID AND oi.ProductID = c.ProductID));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_sales_order_ins ON Order_Header;
+CREATE TRIGGER trg_daily_sales_order_ins AFTER INSERT ON Order_Header
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_order();
+DROP TRIGGER IF EXISTS trg_daily_sales_order_upd ON Order_Header;
+CREATE TRIGGER trg_daily_sales_order_upd AFTER UPDATE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_order();
+DROP TRIGGER IF EXISTS trg_daily_sales_order_del ON Order_Header;
+CREATE TRIGGER trg_daily_sales_order_del AFTER DELETE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_order();
+
+DROP TRIGGER IF EXISTS trg_daily_sales_item_ins ON OrderItem;
+CREATE TRIGGER trg_daily_sales_item_ins AFTER INSERT ON OrderItem
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_item();
+DROP TRIGGER IF EXISTS trg_daily_sales_item_upd ON OrderItem;
+CREATE TRIGGER trg_daily_sales_item_upd AFTER UPDATE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_item();
+DROP TRIGGER IF EXISTS trg_daily_sales_item_del ON OrderItem;
+CREATE TRIGGER trg_daily_sales_item_del AFTER DELETE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_item();
+
+DROP TRIGGER IF EXISTS trg_daily_sales_offer_ins ON BranchSupplyOffer;
+CREATE TRIGGER trg_daily_sales_offer_ins AFTER INSERT ON BranchSupplyOffer
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_offer();
+DROP TRIGGER IF EXISTS trg_daily_sales_offer_upd ON BranchSupplyOffer;
+CREATE TRIGGER trg_daily_sales_offer_upd AFTER UPDATE ON BranchSupplyOffer
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_offer();
+DROP TRIGGER IF EXISTS trg_daily_sales_offer_del ON BranchSupplyOffer;
+CREATE TRIGGER trg_daily_sales_offer_del AFTER DELETE ON BranchSupplyOffer
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_daily_sales_touch_offer();
+
+-- Re-aggregate the marked dates (run at end of day, or after a load). Returns the number of dates.
+CREATE OR REPLACE FUNCTION refresh_daily_sales_profit()
+RETURNS INT AS $$
+DECLARE
+  dates DATE[];
+BEGIN
+  WITH d AS (DELETE FROM DailySalesProfitDirty RETURNING sale_date)
+  SELECT array_agg(sale_date) INTO dates FROM d;
+  IF dates IS NULL THEN
+    RETURN 0;
+  END IF;
+  -- New statement, new snapshot: includes writers that held a marked date above
+  DELETE FROM DailySalesProfit WHERE sale_date = ANY(dates);
+  INSERT INTO DailySalesProfit (sale_date, total_sales, total_profit)
+  SELECT
+      DATE(oh.OrderDate),
+      SUM(oh.TotalAmount),
+      SUM(oh.TotalAmount) - SUM(oi.Quantity * COALESCE(bp.MinSupplyPrice, 0))
+  FROM unnest(dates) AS d(day)
+  JOIN Order_Header oh ON oh.OrderDate >= d.day AND oh.OrderDate < d.day + 1
+  JOIN OrderItem oi ON oi.OrderID = oh.OrderID
+                   AND oi.OrderDate >= d.day AND oi.OrderDate < d.day + 1  -- prunes a partitioned OrderItem
+  LEFT JOIN BranchProductBestOffer bp ON bp.BranchID = oh.BranchID AND bp.ProductID = oi.ProductID
+  GROUP BY DATE(oh.OrderDate);
+  RETURN cardinality(dates);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rows already in the database when this file is applied
+INSERT INTO DailySalesProfitDirty (sale_date)
+SELECT DISTINCT DATE(OrderDate) FROM Order_Header
+ON CONFLICT DO NOTHING;
+SELECT refresh_daily_sales_profit();
+
+-- Same name and columns as the former materialized view
+CREATE OR REPLACE VIEW mv_daily_sales_profit AS
+SELECT sale_date, total_sales, total_profit
+FROM DailySalesProfit
 ORDER BY sale_date DESC;
 
--- Index for efficient refresh and query
-CREATE UNIQUE INDEX idx_mv_daily_sales_profit_date ON mv_daily_sales_profit (sale_date);
+-- Market-basket co-occurrence (queries/4.sql), kept current by triggers on OrderItem and Product.
+-- CategoryCooccurrence: per ordered pair of different categories, the orders holding items of
+-- both (OrderCount) and the item pairs across them (PairCount); stored in both directions.
+-- ProductCooccurrence: the same per pair of products. NULL categories are left out.
+CREATE TABLE IF NOT EXISTS CategoryCooccurrence (
+    Category VARCHAR(100) NOT NULL,
+    OtherCategory VARCHAR(100) NOT NULL,
+    OrderCount INT NOT NULL,
+    PairCount BIGINT NOT NULL,
+    PRIMARY KEY (Category, OtherCategory)
+);
+CREATE INDEX IF NOT EXISTS idx_category_cooccurrence_count ON CategoryCooccurrence (Category, OrderCount);
+
+CREATE TABLE IF NOT EXISTS ProductCooccurrence (
+    ProductID INT NOT NULL,
+    OtherProductID INT NOT NULL,
+    OrderCount INT NOT NULL,
+    PRIMARY KEY (ProductID, OtherProductID)
+);
+CREATE INDEX IF NOT EXISTS idx_product_cooccurrence_count ON ProductCooccurrence (ProductID, OrderCount);
+
+-- Adds (delta = 1) or removes (delta = -1) the pairs of whole orders given as parallel arrays
+-- of their items; pairs whose count drops to zero are deleted
+CREATE OR REPLACE FUNCTION fn_basket_apply(order_ids INT[], product_ids INT[], categories TEXT[], delta INT)
+RETURNS VOID AS $$
+  INSERT INTO CategoryCooccurrence AS cc (Category, OtherCategory, OrderCount, PairCount)
+  SELECT a.Category, b.Category, delta * COUNT(*), delta * SUM(a.n * b.n)
+  FROM (SELECT OrderID, Category, COUNT(*) AS n
+        FROM unnest(order_ids, categories) AS t(OrderID, Category)
+        WHERE Category IS NOT NULL GROUP BY OrderID, Category) a
+  JOIN (SELECT OrderID, Category, COUNT(*) AS n
+        FROM unnest(order_ids, categories) AS t(OrderID, Category)
+        WHERE Category IS NOT NULL GROUP BY OrderID, Category) b
+    ON b.OrderID = a.OrderID AND b.Category <> a.Category
+  GROUP BY a.Category, b.Category
+  ON CONFLICT (Category, OtherCategory) DO UPDATE
+  SET OrderCount = cc.OrderCount + EXCLUDED.OrderCount, PairCount = cc.PairCount + EXCLUDED.PairCount;
+
+  INSERT INTO ProductCooccurrence AS pc (ProductID, OtherProductID, OrderCount)
+  SELECT a.ProductID, b.ProductID, delta * COUNT(*)
+  FROM unnest(order_ids, product_ids) AS a(OrderID, ProductID)
+  JOIN unnest(order_ids, product_ids) AS b(OrderID, ProductID)
+    ON b.OrderID = a.OrderID AND b.ProductID <> a.ProductID
+  GROUP BY a.ProductID, b.ProductID
+  ON CONFLICT (ProductID, OtherProductID) DO UPDATE SET OrderCount = pc.OrderCount + EXCLUDED.OrderCount;
+
+  DELETE FROM CategoryCooccurrence WHERE delta < 0 AND OrderCount <= 0;
+  DELETE FROM ProductCooccurrence
+  WHERE delta < 0 AND OrderCount <= 0 AND ProductID IN (SELECT unnest(product_ids));
+$$ LANGUAGE sql;
+
+-- Replaces the orders a statement touched: their pairs as they were before it are removed
+-- and their pairs now are added
+CREATE OR REPLACE FUNCTION fn_basket_touch_item()
+RETURNS TRIGGER AS $$
+DECLARE
+  new_o INT[] := '{}';
+  new_p INT[] := '{}';
+  old_o INT[] := '{}';
+  old_p INT[] := '{}';
+  o INT[];
+  p INT[];
+  c TEXT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT COALESCE(array_agg(OrderID), '{}'), COALESCE(array_agg(ProductID), '{}') INTO new_o, new_p FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT COALESCE(array_agg(OrderID), '{}'), COALESCE(array_agg(ProductID), '{}') INTO old_o, old_p FROM old_rows;
+  ELSE
+    -- only a changed key moves an item between orders or products (quantity and status updates do not)
+    SELECT COALESCE(array_agg(OrderID), '{}'), COALESCE(array_agg(ProductID), '{}') INTO new_o, new_p
+    FROM (SELECT OrderID, ProductID FROM new_rows EXCEPT SELECT OrderID, ProductID FROM old_rows) k;
+    SELECT COALESCE(array_agg(OrderID), '{}'), COALESCE(array_agg(ProductID), '{}') INTO old_o, old_p
+    FROM (SELECT OrderID, ProductID FROM old_rows EXCEPT SELECT OrderID, ProductID FROM new_rows) k;
+  END IF;
+  IF cardinality(new_o) = 0 AND cardinality(old_o) = 0 THEN
+    RETURN NULL;
+  END IF;
+
+  -- before the statement: the orders' items now, without the new rows, plus the old rows
+  SELECT array_agg(s.OrderID), array_agg(s.ProductID), array_agg(pr.Category) INTO o, p, c
+  FROM (SELECT oi.OrderID, oi.ProductID FROM OrderItem oi WHERE oi.OrderID = ANY(new_o || old_o)
+        EXCEPT SELECT * FROM unnest(new_o, new_p)
+        UNION SELECT * FROM unnest(old_o, old_p)) s(OrderID, ProductID)
+  JOIN Product pr ON pr.ProductID = s.ProductID;
+  PERFORM fn_basket_apply(o, p, c, -1);
+
+  SELECT array_agg(oi.OrderID), array_agg(oi.ProductID), array_agg(pr.Category) INTO o, p, c
+  FROM OrderItem oi JOIN Product pr ON pr.ProductID = oi.ProductID
+  WHERE oi.OrderID = ANY(new_o || old_o);
+  PERFORM fn_basket_apply(o, p, c, 1);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A product moved to another category moves the category pairs of every order holding it
+CREATE OR REPLACE FUNCTION fn_basket_touch_product()
+RETURNS TRIGGER AS $$
+DECLARE
+  orders INT[];
+  o INT[];
+  p INT[];
+  c TEXT[];
+BEGIN
+  orders := ARRAY(
+    SELECT DISTINCT oi.OrderID FROM OrderItem oi
+    WHERE oi.ProductID IN (SELECT n.ProductID FROM new_rows n JOIN old_rows od ON od.ProductID = n.ProductID
+                           WHERE n.Category IS DISTINCT FROM od.Category));
+  IF cardinality(orders) = 0 THEN
+    RETURN NULL;
+  END IF;
+  SELECT array_agg(oi.OrderID), array_agg(oi.ProductID),
+         array_agg(CASE WHEN od.ProductID IS NULL THEN pr.Category ELSE od.Category END) INTO o, p, c
+  FROM OrderItem oi
+  JOIN Product pr ON pr.ProductID = oi.ProductID
+  LEFT JOIN old_rows od ON od.ProductID = oi.ProductID
+  WHERE oi.OrderID = ANY(orders);
+  PERFORM fn_basket_apply(o, p, c, -1);
+  SELECT array_agg(oi.OrderID), array_agg(oi.ProductID), array_agg(pr.Category) INTO o, p, c
+  FROM OrderItem oi JOIN Product pr ON pr.ProductID = oi.ProductID
+  WHERE oi.OrderID = ANY(orders);
+  PERFORM fn_basket_apply(o, p, c, 1);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_basket_item_ins ON OrderItem;
+CREATE TRIGGER trg_basket_item_ins AFTER INSERT ON OrderItem
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_basket_touch_item();
+DROP TRIGGER IF EXISTS trg_basket_item_upd ON OrderItem;
+CREATE TRIGGER trg_basket_item_upd AFTER UPDATE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_basket_touch_item();
+DROP TRIGGER IF EXISTS trg_basket_item_del ON OrderItem;
+CREATE TRIGGER trg_basket_item_del AFTER DELETE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_basket_touch_item();
+DROP TRIGGER IF EXISTS trg_basket_product_upd ON Product;
+CREATE TRIGGER trg_basket_product_upd AFTER UPDATE ON Product
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_basket_touch_product();
+
+-- Recount every order (when this file is applied, or to repair the tables)
+CREATE OR REPLACE FUNCTION rebuild_basket_cooccurrence()
+RETURNS VOID AS $$
+  TRUNCATE CategoryCooccurrence, ProductCooccurrence;
+  SELECT fn_basket_apply(array_agg(oi.OrderID), array_agg(oi.ProductID), array_agg(pr.Category), 1)
+  FROM OrderItem oi JOIN Product pr ON pr.ProductID = oi.ProductID;
+$$ LANGUAGE sql;
 
+SELECT rebuild_basket_cooccurrence();
+
+-- Wallet turnover per customer and year (queries/8.sql): SUM(ABS(Amount)) and the number of
+-- transactions, kept current by statement-level triggers on WalletTransaction (including the
+-- bulk rewrites of scripts/reconstruct_wallet.py)
+CREATE TABLE IF NOT EXISTS WalletTurnoverYearly (
+    CustomerID INT NOT NULL,
+    Year INT NOT NULL,
+    Turnover DECIMAL(17, 2) NOT NULL,
+    TxnCount INT NOT NULL,
+    PRIMARY KEY (CustomerID, Year)
+);
+
+-- Adds the transactions of new_rows and subtracts those of old_rows
+CREATE OR REPLACE FUNCTION fn_wallet_turnover_touch()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO WalletTurnoverYearly AS w (CustomerID, Year, Turnover, TxnCount)
+    SELECT CustomerID, EXTRACT(YEAR FROM Date)::int, SUM(ABS(Amount)), COUNT(*)
+    FROM new_rows GROUP BY CustomerID, EXTRACT(YEAR FROM Date)::int
+    ON CONFLICT (CustomerID, Year) DO UPDATE
+    SET Turnover = w.Turnover + EXCLUDED.Turnover, TxnCount = w.TxnCount + EXCLUDED.TxnCount;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    UPDATE WalletTurnoverYearly w
+    SET Turnover = w.Turnover - d.Turnover, TxnCount = w.TxnCount - d.TxnCount
+    FROM (SELECT CustomerID, EXTRACT(YEAR FROM Date)::int AS Year, SUM(ABS(Amount)) AS Turnover, COUNT(*) AS TxnCount
+          FROM old_rows GROUP BY CustomerID, EXTRACT(YEAR FROM Date)::int) d
+    WHERE w.CustomerID = d.CustomerID AND w.Year = d.Year;
+    DELETE FROM WalletTurnoverYearly w
+    USING (SELECT DISTINCT CustomerID, EXTRACT(YEAR FROM Date)::int AS Year FROM old_rows) d
+    WHERE w.CustomerID = d.CustomerID AND w.Year = d.Year AND w.TxnCount = 0;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_wallet_turnover_ins ON WalletTransaction;
+CREATE TRIGGER trg_wallet_turnover_ins AFTER INSERT ON WalletTransaction
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_wallet_turnover_touch();
+DROP TRIGGER IF EXISTS trg_wallet_turnover_upd ON WalletTransaction;
+CREATE TRIGGER trg_wallet_turnover_upd AFTER UPDATE ON WalletTransaction
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_wallet_turnover_touch();
+DROP TRIGGER IF EXISTS trg_wallet_turnover_del ON WalletTransaction;
+CREATE TRIGGER trg_wallet_turnover_del AFTER DELETE ON WalletTransaction
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_wallet_turnover_touch();
+
+-- Transactions already in the database when this file is applied
+TRUNCATE WalletTurnoverYearly;
+INSERT INTO WalletTurnoverYearly (CustomerID, Year, Turnover, TxnCount)
+SELECT CustomerID, EXTRACT(YEAR FROM Date)::int, SUM(ABS(Amount)), COUNT(*)
+FROM WalletTransaction GROUP BY CustomerID, EXTRACT(YEAR FROM Date)::int;
+
+-- Orders of each customer per branch (queries/7.sql, v_branch_manager_customers): count, total
+-- spent and first/last order date. Inserted orders are added; updated and deleted ones
+-- recompute their (customer, branch) pairs, which also covers the BranchID SET NULL of a
+-- deleted branch. Orders without a branch are not counted.
+CREATE TABLE IF NOT EXISTS CustomerBranchActivity (
+    CustomerID INT NOT NULL,
+    BranchID INT NOT NULL,
+    OrderCount INT NOT NULL,
+    TotalSpent DECIMAL(17, 2),
+    FirstOrderDate TIMESTAMP,
+    LastOrderDate TIMESTAMP,
+    PRIMARY KEY (CustomerID, BranchID)
+);
+CREATE INDEX IF NOT EXISTS idx_customer_branch_activity_branch
+    ON CustomerBranchActivity (BranchID, CustomerID) INCLUDE (OrderCount);
+CREATE INDEX IF NOT EXISTS idx_order_header_customer_branch ON Order_Header (CustomerID, BranchID);
+
+CREATE OR REPLACE FUNCTION fn_branch_activity_recompute(pairs INT[][])
+RETURNS VOID AS $$
+  DELETE FROM CustomerBranchActivity a
+  USING (SELECT pairs[i][1] AS CustomerID, pairs[i][2] AS BranchID FROM generate_subscripts(pairs, 1) AS i) k
+  WHERE a.CustomerID = k.CustomerID AND a.BranchID = k.BranchID;
+  INSERT INTO CustomerBranchActivity (CustomerID, BranchID, OrderCount, TotalSpent, FirstOrderDate, LastOrderDate)
+  SELECT oh.CustomerID, oh.BranchID, COUNT(*), SUM(oh.TotalAmount), MIN(oh.OrderDate), MAX(oh.OrderDate)
+  FROM Order_Header oh
+  JOIN (SELECT DISTINCT pairs[i][1] AS CustomerID, pairs[i][2] AS BranchID FROM generate_subscripts(pairs, 1) AS i) k
+    ON k.CustomerID = oh.CustomerID AND k.BranchID = oh.BranchID
+  GROUP BY oh.CustomerID, oh.BranchID;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_branch_activity_touch()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO CustomerBranchActivity AS a
+        (CustomerID, BranchID, OrderCount, TotalSpent, FirstOrderDate, LastOrderDate)
+    SELECT CustomerID, BranchID, COUNT(*), SUM(TotalAmount), MIN(OrderDate), MAX(OrderDate)
+    FROM new_rows WHERE BranchID IS NOT NULL
+    GROUP BY CustomerID, BranchID
+    ON CONFLICT (CustomerID, BranchID) DO UPDATE SET
+        OrderCount = a.OrderCount + EXCLUDED.OrderCount,
+        TotalSpent = CASE WHEN a.TotalSpent IS NULL THEN EXCLUDED.TotalSpent
+                          ELSE a.TotalSpent + COALESCE(EXCLUDED.TotalSpent, 0) END,
+        FirstOrderDate = LEAST(a.FirstOrderDate, EXCLUDED.FirstOrderDate),
+        LastOrderDate = GREATEST(a.LastOrderDate, EXCLUDED.LastOrderDate);
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM fn_branch_activity_recompute(ARRAY(
+      SELECT DISTINCT ARRAY[CustomerID, BranchID] FROM old_rows WHERE BranchID IS NOT NULL));
+  ELSE
+    -- only orders whose customer, branch, amount or date changed
+    PERFORM fn_branch_activity_recompute(ARRAY(
+      SELECT DISTINCT ARRAY[x.CustomerID, x.BranchID]
+      FROM old_rows o JOIN new_rows n ON n.OrderID = o.OrderID
+      CROSS JOIN LATERAL (VALUES (o.CustomerID, o.BranchID), (n.CustomerID, n.BranchID)) AS x(CustomerID, BranchID)
+      WHERE x.BranchID IS NOT NULL
+        AND (o.CustomerID, o.BranchID, o.TotalAmount, o.OrderDate)
+            IS DISTINCT FROM (n.CustomerID, n.BranchID, n.TotalAmount, n.OrderDate)));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_branch_activity_ins ON Order_Header;
+CREATE TRIGGER trg_branch_activity_ins AFTER INSERT ON Order_Header
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_branch_activity_touch();
+DROP TRIGGER IF EXISTS trg_branch_activity_upd ON Order_Header;
+CREATE TRIGGER trg_branch_activity_upd AFTER UPDATE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_branch_activity_touch();
+DROP TRIGGER IF EXISTS trg_branch_activity_del ON Order_Header;
+CREATE TRIGGER trg_branch_activity_del AFTER DELETE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_branch_activity_touch();
+
+-- Orders already in the database when this file is applied
+TRUNCATE CustomerBranchActivity;
+INSERT INTO CustomerBranchActivity (CustomerID, BranchID, OrderCount, TotalSpent, FirstOrderDate, LastOrderDate)
+SELECT CustomerID, BranchID, COUNT(*), SUM(TotalAmount), MIN(OrderDate), MAX(OrderDate)
+FROM Order_Header WHERE BranchID IS NOT NULL
+GROUP BY CustomerID, BranchID;
+
+-- Per-customer ledger for queries/12.sql (customer value): one row per customer with the four
+-- totals of that report. Inserted orders, items and repayments are added to it; other changes
+-- to Order_Header, OrderItem, RepaymentHistory, ReturnRequest and Product tax rates recompute
+-- the customers they touch. scripts/summaries.py --check compares it with the report's query.
+CREATE TABLE IF NOT EXISTS CustomerLedger (
+    CustomerID INT PRIMARY KEY,
+    DirectPayments NUMERIC NOT NULL DEFAULT 0,         -- orders paid by card, cash or wallet
+    BNPLRepayments NUMERIC NOT NULL DEFAULT 0,
+    ApprovedReturnRefunds NUMERIC NOT NULL DEFAULT 0,  -- item price of each approved return
+    TotalTaxPaid NUMERIC NOT NULL DEFAULT 0,           -- item price x product tax, items without approved return
+    TrueCustomerValue NUMERIC GENERATED ALWAYS AS
+        (ROUND(DirectPayments + BNPLRepayments - ApprovedReturnRefunds + TotalTaxPaid, 2)) STORED
+);
+CREATE INDEX IF NOT EXISTS idx_customer_ledger_value ON CustomerLedger (TrueCustomerValue DESC);
+CREATE INDEX IF NOT EXISTS idx_return_request_item ON ReturnRequest (OrderID, ProductID);
+
+-- Locks the customers' ledger rows in CustomerID order first: a concurrent writer adding to
+-- them is waited for, and the totals are then read from a snapshot that includes its rows.
+-- The insert paths below lock their rows in the same order.
+CREATE OR REPLACE FUNCTION fn_customer_ledger_recompute(customers INT[])
+RETURNS VOID AS $$
+  SELECT CustomerID FROM CustomerLedger WHERE CustomerID = ANY(customers) ORDER BY CustomerID FOR UPDATE;
+  INSERT INTO CustomerLedger AS l
+      (CustomerID, DirectPayments, BNPLRepayments, ApprovedReturnRefunds, TotalTaxPaid)
+  SELECT
+      c.CustomerID,
+      COALESCE((SELECT SUM(oh.TotalAmount) FROM Order_Header oh
+                WHERE oh.CustomerID = c.CustomerID
+                  AND oh.PaymentMethod IN ('credit card', 'debit card', 'cash', 'wallet')), 0),
+      COALESCE((SELECT SUM(rh.Amount) FROM Order_Header oh
+                JOIN RepaymentHistory rh ON rh.OrderID = oh.OrderID
+                WHERE oh.CustomerID = c.CustomerID), 0),
+      COALESCE((SELECT SUM(oi.CalculatedItemPrice) FROM Order_Header oh
+                JOIN ReturnRequest rr ON rr.OrderID = oh.OrderID
+                JOIN OrderItem oi ON oi.OrderID = rr.OrderID AND oi.ProductID = rr.ProductID
+                WHERE oh.CustomerID = c.CustomerID AND rr.ReviewResult = 'Approved'), 0),
+      COALESCE((SELECT SUM(oi.CalculatedItemPrice * p.TaxAmount) FROM Order_Header oh
+                JOIN OrderItem oi ON oi.OrderID = oh.OrderID
+                JOIN Product p ON p.ProductID = oi.ProductID
+                WHERE oh.CustomerID = c.CustomerID
+                  AND NOT EXISTS (SELECT 1 FROM ReturnRequest rr
+                                  WHERE rr.OrderID = oi.OrderID AND rr.ProductID = oi.ProductID
+                                    AND rr.ReviewResult = 'Approved')), 0)
+  FROM Customer c
+  WHERE c.CustomerID = ANY(customers)
+  ON CONFLICT (CustomerID) DO UPDATE SET
+      DirectPayments = EXCLUDED.DirectPayments,
+      BNPLRepayments = EXCLUDED.BNPLRepayments,
+      ApprovedReturnRefunds = EXCLUDED.ApprovedReturnRefunds,
+      TotalTaxPaid = EXCLUDED.TotalTaxPaid;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_customer_ledger_recompute_orders(order_ids INT[])
+RETURNS VOID AS $$
+  SELECT fn_customer_ledger_recompute(ARRAY(
+    SELECT DISTINCT CustomerID FROM Order_Header WHERE OrderID = ANY(order_ids)));
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_customer()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO CustomerLedger (CustomerID) SELECT CustomerID FROM new_rows ORDER BY CustomerID ON CONFLICT DO NOTHING;
+  ELSE
+    DELETE FROM CustomerLedger WHERE CustomerID IN (SELECT CustomerID FROM old_rows);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_order()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO CustomerLedger AS l (CustomerID, DirectPayments)
+    SELECT CustomerID, SUM(TotalAmount) FROM new_rows
+    WHERE PaymentMethod IN ('credit card', 'debit card', 'cash', 'wallet') AND TotalAmount IS NOT NULL
+    GROUP BY CustomerID ORDER BY CustomerID
+    ON CONFLICT (CustomerID) DO UPDATE SET DirectPayments = l.DirectPayments + EXCLUDED.DirectPayments;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM fn_customer_ledger_recompute(ARRAY(SELECT DISTINCT CustomerID FROM old_rows));
+  ELSE
+    PERFORM fn_customer_ledger_recompute(ARRAY(
+      SELECT CustomerID FROM (
+        (SELECT OrderID, CustomerID, TotalAmount, PaymentMethod FROM new_rows
+         EXCEPT SELECT OrderID, CustomerID, TotalAmount, PaymentMethod FROM old_rows)
+        UNION
+        (SELECT OrderID, CustomerID, TotalAmount, PaymentMethod FROM old_rows
+         EXCEPT SELECT OrderID, CustomerID, TotalAmount, PaymentMethod FROM new_rows)) d));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A new item cannot have a return request yet, so its tax is simply added
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_item()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO CustomerLedger AS l (CustomerID, TotalTaxPaid)
+    SELECT oh.CustomerID, SUM(n.CalculatedItemPrice * p.TaxAmount)
+    FROM new_rows n
+    JOIN Order_Header oh ON oh.OrderID = n.OrderID
+    JOIN Product p ON p.ProductID = n.ProductID
+    WHERE n.CalculatedItemPrice IS NOT NULL AND p.TaxAmount IS NOT NULL
+    GROUP BY oh.CustomerID ORDER BY oh.CustomerID
+    ON CONFLICT (CustomerID) DO UPDATE SET TotalTaxPaid = l.TotalTaxPaid + EXCLUDED.TotalTaxPaid;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(SELECT DISTINCT OrderID FROM old_rows));
+  ELSE
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+      SELECT OrderID FROM (
+        (SELECT OrderID, ProductID, CalculatedItemPrice FROM new_rows
+         EXCEPT SELECT OrderID, ProductID, CalculatedItemPrice FROM old_rows)
+        UNION
+        (SELECT OrderID, ProductID, CalculatedItemPrice FROM old_rows
+         EXCEPT SELECT OrderID, ProductID, CalculatedItemPrice FROM new_rows)) d));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_repayment()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO CustomerLedger AS l (CustomerID, BNPLRepayments)
+    SELECT oh.CustomerID, SUM(n.Amount)
+    FROM new_rows n JOIN Order_Header oh ON oh.OrderID = n.OrderID
+    WHERE n.Amount IS NOT NULL
+    GROUP BY oh.CustomerID ORDER BY oh.CustomerID
+    ON CONFLICT (CustomerID) DO UPDATE SET BNPLRepayments = l.BNPLRepayments + EXCLUDED.BNPLRepayments;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(SELECT DISTINCT OrderID FROM old_rows));
+  ELSE
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+      SELECT OrderID FROM (
+        (SELECT OrderID, PaymentDate, Amount FROM new_rows EXCEPT SELECT OrderID, PaymentDate, Amount FROM old_rows)
+        UNION
+        (SELECT OrderID, PaymentDate, Amount FROM old_rows EXCEPT SELECT OrderID, PaymentDate, Amount FROM new_rows)) d));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only approved returns count, so requests still under review are skipped
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_return()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+      SELECT DISTINCT OrderID FROM new_rows WHERE ReviewResult = 'Approved'));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+      SELECT DISTINCT OrderID FROM old_rows WHERE ReviewResult = 'Approved'));
+  ELSE
+    PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+      SELECT OrderID FROM (
+        (SELECT ReturnID, OrderID, ProductID, ReviewResult FROM new_rows
+         EXCEPT SELECT ReturnID, OrderID, ProductID, ReviewResult FROM old_rows)
+        UNION
+        (SELECT ReturnID, OrderID, ProductID, ReviewResult FROM old_rows
+         EXCEPT SELECT ReturnID, OrderID, ProductID, ReviewResult FROM new_rows)) d));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_customer_ledger_touch_product()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM fn_customer_ledger_recompute_orders(ARRAY(
+    SELECT DISTINCT oi.OrderID FROM OrderItem oi
+    WHERE oi.ProductID IN (SELECT n.ProductID FROM new_rows n JOIN old_rows o ON o.ProductID = n.ProductID
+                           WHERE n.TaxAmount IS DISTINCT FROM o.TaxAmount)));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_customer_ins ON Customer;
+CREATE TRIGGER trg_customer_ledger_customer_ins AFTER INSERT ON Customer
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_customer();
+DROP TRIGGER IF EXISTS trg_customer_ledger_customer_del ON Customer;
+CREATE TRIGGER trg_customer_ledger_customer_del AFTER DELETE ON Customer
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_customer();
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_order_ins ON Order_Header;
+CREATE TRIGGER trg_customer_ledger_order_ins AFTER INSERT ON Order_Header
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_order();
+DROP TRIGGER IF EXISTS trg_customer_ledger_order_upd ON Order_Header;
+CREATE TRIGGER trg_customer_ledger_order_upd AFTER UPDATE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_order();
+DROP TRIGGER IF EXISTS trg_customer_ledger_order_del ON Order_Header;
+CREATE TRIGGER trg_customer_ledger_order_del AFTER DELETE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_order();
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_item_ins ON OrderItem;
+CREATE TRIGGER trg_customer_ledger_item_ins AFTER INSERT ON OrderItem
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_item();
+DROP TRIGGER IF EXISTS trg_customer_ledger_item_upd ON OrderItem;
+CREATE TRIGGER trg_customer_ledger_item_upd AFTER UPDATE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_item();
+DROP TRIGGER IF EXISTS trg_customer_ledger_item_del ON OrderItem;
+CREATE TRIGGER trg_customer_ledger_item_del AFTER DELETE ON OrderItem
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_item();
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_repayment_ins ON RepaymentHistory;
+CREATE TRIGGER trg_customer_ledger_repayment_ins AFTER INSERT ON RepaymentHistory
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_repayment();
+DROP TRIGGER IF EXISTS trg_customer_ledger_repayment_upd ON RepaymentHistory;
+CREATE TRIGGER trg_customer_ledger_repayment_upd AFTER UPDATE ON RepaymentHistory
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_repayment();
+DROP TRIGGER IF EXISTS trg_customer_ledger_repayment_del ON RepaymentHistory;
+CREATE TRIGGER trg_customer_ledger_repayment_del AFTER DELETE ON RepaymentHistory
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_repayment();
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_return_ins ON ReturnRequest;
+CREATE TRIGGER trg_customer_ledger_return_ins AFTER INSERT ON ReturnRequest
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_return();
+DROP TRIGGER IF EXISTS trg_customer_ledger_return_upd ON ReturnRequest;
+CREATE TRIGGER trg_customer_ledger_return_upd AFTER UPDATE ON ReturnRequest
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_return();
+DROP TRIGGER IF EXISTS trg_customer_ledger_return_del ON ReturnRequest;
+CREATE TRIGGER trg_customer_ledger_return_del AFTER DELETE ON ReturnRequest
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_return();
+
+DROP TRIGGER IF EXISTS trg_customer_ledger_product_upd ON Product;
+CREATE TRIGGER trg_customer_ledger_product_upd AFTER UPDATE ON Product
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_customer_ledger_touch_product();
+
+-- Recompute every customer (when this file is applied, or to repair the ledger)
+CREATE OR REPLACE FUNCTION rebuild_customer_ledger()
+RETURNS VOID AS $$
+  TRUNCATE CustomerLedger;
+  SELECT fn_customer_ledger_recompute(ARRAY(SELECT CustomerID FROM Customer));
+$$ LANGUAGE sql;
+
+SELECT rebuild_customer_ledger();
+
+-- One CustomerBranchActivity row per customer with at least one order in the branch
 CREATE OR REPLACE VIEW v_branch_manager_customers AS
-SELECT DISTINCT
+SELECT
     b.BranchID,
     b.Name AS BranchName,
     m.ManagerID,
@@ -50,8 +771,8 @@ SELECT DISTINCT
     c.Tier
 FROM Branch b
 JOIN Manager m ON b.ManagerID = m.ManagerID
-JOIN Order_Header oh ON oh.BranchID = b.BranchID
-JOIN Customer c ON oh.CustomerID = c.CustomerID
+JOIN CustomerBranchActivity a ON a.BranchID = b.BranchID
+JOIN Customer c ON a.CustomerID = c.CustomerID
 ORDER BY b.BranchID, c.CustomerID;
 
 CREATE OR REPLACE VIEW v_marketing_customer_loyalty AS
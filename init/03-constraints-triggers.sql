@@ -49,6 +49,39 @@ CREATE TRIGGER trg_order_date_immutable
   FOR EACH ROW
   EXECUTE FUNCTION fn_order_date_immutable();
 
+-- OrderItem.OrderDate is its order's OrderDate (for databases created before the column).
+-- When the tables are partitioned (01-schema.sql) Shipment, RepaymentHistory and ReturnRequest
+-- carry it too. Rows get it from Order_Header; partitioned OrderItem rows are routed before
+-- triggers run, so loaders pass it there.
+ALTER TABLE OrderItem ADD COLUMN IF NOT EXISTS OrderDate TIMESTAMP;
+UPDATE OrderItem oi SET OrderDate = oh.OrderDate
+FROM Order_Header oh
+WHERE oh.OrderID = oi.OrderID AND oi.OrderDate IS NULL;
+ALTER TABLE OrderItem ALTER COLUMN OrderDate SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION fn_copy_order_date()
+RETURNS TRIGGER AS $$
+BEGIN
+  SELECT OrderDate INTO NEW.OrderDate FROM Order_Header WHERE OrderID = NEW.OrderID;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOR t IN
+    SELECT table_name FROM information_schema.columns
+    WHERE table_schema = current_schema() AND column_name = 'orderdate'
+      AND table_name IN ('orderitem', 'shipment', 'repaymenthistory', 'returnrequest')
+  LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || t || '_order_date', t);
+    EXECUTE format('CREATE TRIGGER %I BEFORE INSERT OR UPDATE OF OrderID ON %I FOR EACH ROW '
+                   'EXECUTE FUNCTION fn_copy_order_date()', 'trg_' || t || '_order_date', t);
+  END LOOP;
+END $$;
+
 -- ShipDate >= OrderDate
 CREATE OR REPLACE FUNCTION fn_shipment_date_check()
 RETURNS TRIGGER AS $$
@@ -67,47 +100,42 @@ DROP TRIGGER IF EXISTS trg_shipment_date_check ON Shipment;
 CREATE TRIGGER trg_shipment_date_check
   BEFORE INSERT OR UPDATE ON Shipment
   FOR EACH ROW
+  WHEN (current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_shipment_date_check();
 
 
 -- 3
 
+-- Allowed transitions (from -> to)
+-- item procurement -> awaiting payment, item procurement
+-- awaiting payment -> shipped, awaiting payment
+-- shipped -> received, shipped, Pending Return Review
+-- received -> received, Pending Return Review
+-- Pending Return Review -> Return Approved, Return Rejected, Pending Return Review
+-- Return Approved/Rejected -> terminal
+CREATE OR REPLACE FUNCTION fn_item_status_transition_ok(from_status TEXT, to_status TEXT)
+RETURNS BOOLEAN AS $$
+  SELECT CASE from_status
+    WHEN 'item procurement' THEN to_status IN ('awaiting payment', 'item procurement')
+    WHEN 'awaiting payment' THEN to_status IN ('shipped', 'awaiting payment')
+    WHEN 'shipped' THEN to_status IN ('received', 'shipped', 'Pending Return Review')
+    WHEN 'received' THEN to_status IN ('received', 'Pending Return Review')
+    WHEN 'Pending Return Review' THEN to_status IN ('Return Approved', 'Return Rejected', 'Pending Return Review')
+    WHEN 'Return Approved' THEN to_status = 'Return Approved'
+    WHEN 'Return Rejected' THEN to_status = 'Return Rejected'
+    WHEN 'unknown' THEN to_status IN ('item procurement', 'awaiting payment', 'shipped', 'received', 'unknown')
+    ELSE TRUE
+  END;
+$$ LANGUAGE sql IMMUTABLE;
+
 CREATE OR REPLACE FUNCTION fn_order_item_status_flow()
 RETURNS TRIGGER AS $$
-DECLARE
-  allowed_next TEXT[];
-  next_ok BOOLEAN := FALSE;
-  s TEXT;
 BEGIN
   IF OLD.ItemStatus IS NULL OR NEW.ItemStatus IS NULL THEN
     RAISE EXCEPTION 'ItemStatus cannot be NULL';
   END IF;
 
-  -- Allowed transitions (from -> to)
-  -- item procurement -> awaiting payment, item procurement
-  -- awaiting payment -> shipped, awaiting payment
-  -- shipped -> received, shipped, Pending Return Review
-  -- received -> received, Pending Return Review
-  -- Pending Return Review -> Return Approved, Return Rejected, Pending Return Review
-  -- Return Approved/Rejected -> terminal
-  allowed_next := CASE OLD.ItemStatus
-    WHEN 'item procurement' THEN ARRAY['awaiting payment', 'item procurement']
-    WHEN 'awaiting payment' THEN ARRAY['shipped', 'awaiting payment']
-    WHEN 'shipped' THEN ARRAY['received', 'shipped', 'Pending Return Review']
-    WHEN 'received' THEN ARRAY['received', 'Pending Return Review']
-    WHEN 'Pending Return Review' THEN ARRAY['Return Approved', 'Return Rejected', 'Pending Return Review']
-    WHEN 'Return Approved' THEN ARRAY['Return Approved']
-    WHEN 'Return Rejected' THEN ARRAY['Return Rejected']
-    WHEN 'unknown' THEN ARRAY['item procurement', 'awaiting payment', 'shipped', 'received', 'unknown']
-    ELSE ARRAY[NEW.ItemStatus]
-  END;
-
-  FOREACH s IN ARRAY allowed_next
-  LOOP
-    IF s = NEW.ItemStatus THEN next_ok := TRUE; EXIT; END IF;
-  END LOOP;
-
-  IF NOT next_ok THEN
+  IF NOT fn_item_status_transition_ok(OLD.ItemStatus, NEW.ItemStatus) THEN
     RAISE EXCEPTION 'Invalid ItemStatus transition: % -> %', OLD.ItemStatus, NEW.ItemStatus;
   END IF;
   RETURN NEW;
@@ -118,7 +146,7 @@ DROP TRIGGER IF EXISTS trg_order_item_status_flow ON OrderItem;
 CREATE TRIGGER trg_order_item_status_flow
   BEFORE UPDATE ON OrderItem
   FOR EACH ROW
-  WHEN (OLD.ItemStatus IS DISTINCT FROM NEW.ItemStatus)
+  WHEN (OLD.ItemStatus IS DISTINCT FROM NEW.ItemStatus AND current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_order_item_status_flow();
 
 -- On INSERT: ItemStatus not NULL; allow initial + completed statuses (for historical data load)
@@ -140,17 +168,24 @@ DROP TRIGGER IF EXISTS trg_order_item_status_insert ON OrderItem;
 CREATE TRIGGER trg_order_item_status_insert
   BEFORE INSERT ON OrderItem
   FOR EACH ROW
+  WHEN (current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_order_item_status_insert();
 
 
 -- 4
 
+-- Low income: 'low', 'کم', or numeric < 60000
+CREATE OR REPLACE FUNCTION fn_is_low_income(income TEXT)
+RETURNS BOOLEAN AS $$
+  SELECT (income ILIKE '%low%' OR income ILIKE '%کم%')
+    OR (income ~ '^[0-9.]+$' AND (income::numeric) < 60000);
+$$ LANGUAGE sql IMMUTABLE;
+
 CREATE OR REPLACE FUNCTION fn_order_priority_small_business()
 RETURNS TRIGGER AS $$
 DECLARE
   c_nature VARCHAR(50);
   c_income VARCHAR(50);
-  is_low_income BOOLEAN := FALSE;
 BEGIN
   IF NEW.Priority <> 'highest' THEN
     RETURN NEW;
@@ -163,11 +198,7 @@ BEGIN
     RETURN NEW;
   END IF;
 
-  -- Low income: 'low', 'کم', or numeric < 60000
-  is_low_income := (c_income ILIKE '%low%' OR c_income ILIKE '%کم%')
-    OR (c_income ~ '^[0-9.]+$' AND (c_income::numeric) < 60000);
-
-  IF is_low_income THEN
+  IF fn_is_low_income(c_income) THEN
     RAISE EXCEPTION 'Priority cannot be highest for small business customers with low income';
   END IF;
   RETURN NEW;
@@ -178,6 +209,7 @@ DROP TRIGGER IF EXISTS trg_order_priority_small_business ON Order_Header;
 CREATE TRIGGER trg_order_priority_small_business
   BEFORE INSERT OR UPDATE ON Order_Header
   FOR EACH ROW
+  WHEN (current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_order_priority_small_business();
 
 
@@ -206,6 +238,7 @@ DROP TRIGGER IF EXISTS trg_shipment_pack_transport ON Shipment;
 CREATE TRIGGER trg_shipment_pack_transport
   BEFORE INSERT OR UPDATE ON Shipment
   FOR EACH ROW
+  WHEN (current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_shipment_pack_transport();
 
 
@@ -241,6 +274,7 @@ DROP TRIGGER IF EXISTS trg_wallet_debt_ceiling ON Wallet;
 CREATE TRIGGER trg_wallet_debt_ceiling
   BEFORE INSERT OR UPDATE ON Wallet
   FOR EACH ROW
+  WHEN (current_setting('bdbkala.bulk_load', true) IS DISTINCT FROM 'on')
   EXECUTE FUNCTION fn_wallet_debt_ceiling();
 
 
@@ -267,26 +301,35 @@ ALTER TABLE Order_Header DROP CONSTRAINT IF EXISTS FK_Order_Branch;
 ALTER TABLE Order_Header
   ADD CONSTRAINT FK_Order_Branch FOREIGN KEY (BranchID) REFERENCES Branch(BranchID) ON DELETE SET NULL;
 
+-- The SET NULL above runs one UPDATE of Order_Header per deleted branch; this index serves
+-- it, and idx_order_header_customer_branch (02-views.sql) the check below
+CREATE INDEX IF NOT EXISTS idx_order_header_branch ON Order_Header (BranchID);
+
+-- Anonymize customers who had orders ONLY in the deleted branches: among the customers of
+-- the orders this UPDATE moved off a branch that no longer exists, those left without any
+-- order in a branch
 CREATE OR REPLACE FUNCTION fn_branch_delete_anonymize()
 RETURNS TRIGGER AS $$
 BEGIN
-  -- Anonymize customers who had orders ONLY in this branch (after SET NULL, they have BranchID NULL)
-  UPDATE Customer
+  UPDATE Customer c
   SET Name = '[deleted]', Email = NULL, Phone = NULL, Age = NULL, Gender = NULL
-  WHERE CustomerID IN (
-    SELECT CustomerID FROM Order_Header
-    WHERE BranchID IS NULL
-    EXCEPT
-    SELECT CustomerID FROM Order_Header WHERE BranchID IS NOT NULL
-  );
-  RETURN OLD;
+  WHERE c.CustomerID IN (
+    SELECT n.CustomerID
+    FROM old_rows o JOIN new_rows n ON n.OrderID = o.OrderID
+    WHERE o.BranchID IS NOT NULL AND n.BranchID IS NULL
+      AND NOT EXISTS (SELECT 1 FROM Branch b WHERE b.BranchID = o.BranchID)
+  )
+  AND NOT EXISTS (SELECT 1 FROM Order_Header oh WHERE oh.CustomerID = c.CustomerID AND oh.BranchID IS NOT NULL);
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 DROP TRIGGER IF EXISTS trg_branch_delete_anonymize ON Branch;
+DROP TRIGGER IF EXISTS trg_branch_delete_anonymize ON Order_Header;
 CREATE TRIGGER trg_branch_delete_anonymize
-  AFTER DELETE ON Branch
-  FOR EACH ROW
+  AFTER UPDATE ON Order_Header
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
   EXECUTE FUNCTION fn_branch_delete_anonymize();
 
 
@@ -342,3 +385,119 @@ ALTER TABLE OrderItem ADD CONSTRAINT chk_order_item_price CHECK (CalculatedItemP
 ALTER TABLE WalletTransaction DROP CONSTRAINT IF EXISTS chk_wallet_trans_amount;
 ALTER TABLE WalletTransaction
   ADD CONSTRAINT chk_wallet_trans_amount CHECK (Amount IS NOT NULL AND Amount <> 0);
+
+
+-- Bulk-load mode: with SET bdbkala.bulk_load = on (LOAD_BULK=1 for the scripts) the row
+-- triggers above that only validate are skipped, and the statement-level triggers below
+-- check the same rules once per statement over its transition tables. A statement with
+-- violating rows fails with all of them listed, so nothing invalid is committed.
+
+CREATE OR REPLACE FUNCTION fn_bulk_load_reject(violations TEXT[])
+RETURNS VOID AS $$
+BEGIN
+  IF cardinality(violations) > 0 THEN
+    RAISE EXCEPTION '% row(s) violate load rules:%', cardinality(violations),
+      E'\n  ' || array_to_string(violations[1:20], E'\n  ')
+      || CASE WHEN cardinality(violations) > 20 THEN E'\n  ...' ELSE '' END;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_bulk_check_order_header()
+RETURNS TRIGGER AS $$
+DECLARE
+  v TEXT[];
+BEGIN
+  SELECT array_agg(format('order %s: Priority cannot be highest for small business customers with low income', n.OrderID)
+                   ORDER BY n.OrderID) INTO v
+  FROM new_rows n JOIN Customer c ON c.CustomerID = n.CustomerID
+  WHERE (n.Priority <> 'highest') IS NOT TRUE AND (c.Nature <> 'corporate') IS NOT TRUE
+    AND fn_is_low_income(c.IncomeLevel);
+  PERFORM fn_bulk_load_reject(v);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_bulk_check_order_item()
+RETURNS TRIGGER AS $$
+DECLARE
+  v TEXT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(format('item %s/%s: ItemStatus must be a valid status value', n.OrderID, n.ProductID)
+                     ORDER BY n.OrderID, n.ProductID) INTO v
+    FROM new_rows n
+    WHERE n.ItemStatus IS NULL OR n.ItemStatus NOT IN ('item procurement', 'awaiting payment', 'unknown', 'shipped',
+      'received', 'Pending Return Review', 'Return Approved', 'Return Rejected');
+  ELSE
+    -- rows are matched by key, so an update that also changes OrderID or ProductID is not checked
+    SELECT array_agg(format('item %s/%s: Invalid ItemStatus transition: %s -> %s', n.OrderID, n.ProductID,
+                            COALESCE(o.ItemStatus, 'NULL'), COALESCE(n.ItemStatus, 'NULL'))
+                     ORDER BY n.OrderID, n.ProductID) INTO v
+    FROM old_rows o JOIN new_rows n ON n.OrderID = o.OrderID AND n.ProductID = o.ProductID
+    WHERE o.ItemStatus IS DISTINCT FROM n.ItemStatus
+      AND (o.ItemStatus IS NULL OR n.ItemStatus IS NULL OR NOT fn_item_status_transition_ok(o.ItemStatus, n.ItemStatus));
+  END IF;
+  PERFORM fn_bulk_load_reject(v);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_bulk_check_shipment()
+RETURNS TRIGGER AS $$
+DECLARE
+  v TEXT[];
+BEGIN
+  SELECT array_agg(msg ORDER BY id) INTO v FROM (
+    SELECT n.ShipmentID AS id, format('shipment %s: ShipDate must be on or after OrderDate', n.ShipmentID) AS msg
+    FROM new_rows n JOIN Order_Header oh ON oh.OrderID = n.OrderID
+    WHERE n.ShipDate::date < oh.OrderDate::date
+    UNION ALL
+    SELECT n.ShipmentID, format('shipment %s: Large envelope cannot be sent by air (airmail or air freight)', n.ShipmentID)
+    FROM new_rows n
+    WHERE n.PackType = 'envelope' AND n.PackSize IN ('large-regular', 'large-bubble')
+      AND n.TransportMethod IN ('airmail', 'air freight')
+    UNION ALL
+    SELECT n.ShipmentID, format('shipment %s: Box cannot be sent by ground transport', n.ShipmentID)
+    FROM new_rows n
+    WHERE n.PackType = 'box' AND n.TransportMethod = 'ground'
+  ) s;
+  PERFORM fn_bulk_load_reject(v);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_bulk_check_wallet()
+RETURNS TRIGGER AS $$
+DECLARE
+  v TEXT[];
+BEGIN
+  SELECT array_agg(CASE WHEN c.CreditLimit IS NULL
+                     THEN format('wallet %s: Wallet cannot have negative balance when customer has no credit limit', n.CustomerID)
+                     ELSE format('wallet %s: Wallet debt (%s) exceeds customer credit limit (%s)', n.CustomerID, -n.Balance, c.CreditLimit)
+                   END ORDER BY n.CustomerID) INTO v
+  FROM new_rows n LEFT JOIN Customer c ON c.CustomerID = n.CustomerID
+  WHERE n.Balance < 0 AND (c.CreditLimit IS NULL OR -n.Balance > c.CreditLimit);
+  PERFORM fn_bulk_load_reject(v);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  t RECORD;
+BEGIN
+  FOR t IN
+    SELECT * FROM (VALUES ('order_header', 'fn_bulk_check_order_header'), ('orderitem', 'fn_bulk_check_order_item'),
+                          ('shipment', 'fn_bulk_check_shipment'), ('wallet', 'fn_bulk_check_wallet')) AS v(tbl, func)
+  LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || t.tbl || '_bulk_ins', t.tbl);
+    EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT '
+                   'WHEN (current_setting(''bdbkala.bulk_load'', true) = ''on'') EXECUTE FUNCTION %I()',
+                   'trg_' || t.tbl || '_bulk_ins', t.tbl, t.func);
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || t.tbl || '_bulk_upd', t.tbl);
+    EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                   'FOR EACH STATEMENT WHEN (current_setting(''bdbkala.bulk_load'', true) = ''on'') EXECUTE FUNCTION %I()',
+                   'trg_' || t.tbl || '_bulk_upd', t.tbl, t.func);
+  END LOOP;
+END $$;
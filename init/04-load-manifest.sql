@@ -0,0 +1,28 @@
+-- Bookkeeping for incremental reloads (scripts/manifest.py, scripts/pipeline.py).
+-- Kept in the database next to the data it describes.
+
+-- Input files as of the last complete load
+CREATE TABLE IF NOT EXISTS LoadManifest (
+    FileName VARCHAR(255) PRIMARY KEY,
+    FileSize BIGINT NOT NULL,
+    FileHash CHAR(64) NOT NULL,
+    ChunkCount INT NOT NULL,
+    LoadedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-chunk content hashes. A chunk's row is committed right after the chunk's data, in a
+-- separate transaction: a crash in between leaves the chunk loaded but unrecorded, and the
+-- next run loads it again, which is idempotent.
+CREATE TABLE IF NOT EXISTS LoadManifestChunk (
+    FileName VARCHAR(255) NOT NULL,
+    ChunkNo INT NOT NULL,
+    ChunkHash CHAR(64) NOT NULL,
+    PRIMARY KEY (FileName, ChunkNo)
+);
+
+-- Last successful run of each pipeline stage and the inputs it ran on
+CREATE TABLE IF NOT EXISTS PipelineStage (
+    StageName VARCHAR(100) PRIMARY KEY,
+    Signature CHAR(64) NOT NULL,
+    CompletedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,70 @@
+-- Customers whose wallet or wallet transactions changed since they were last verified
+-- (scripts/reconstruct_wallet.py verify --incremental). Verified customers are removed,
+-- mismatching ones stay until they pass.
+CREATE TABLE IF NOT EXISTS WalletVerifyPending (
+    CustomerID INT PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION fn_wallet_verify_touch_new()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO WalletVerifyPending (CustomerID)
+  SELECT DISTINCT CustomerID FROM new_rows WHERE CustomerID IS NOT NULL
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_wallet_verify_touch_old()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO WalletVerifyPending (CustomerID)
+  SELECT DISTINCT CustomerID FROM old_rows WHERE CustomerID IS NOT NULL
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level, so a bulk reconstruction costs one INSERT ... SELECT per statement
+DROP TRIGGER IF EXISTS trg_wallet_verify_ins ON Wallet;
+CREATE TRIGGER trg_wallet_verify_ins
+  AFTER INSERT ON Wallet
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_new();
+
+DROP TRIGGER IF EXISTS trg_wallet_verify_upd ON Wallet;
+CREATE TRIGGER trg_wallet_verify_upd
+  AFTER UPDATE ON Wallet
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_new();
+
+DROP TRIGGER IF EXISTS trg_wtrans_verify_ins ON WalletTransaction;
+CREATE TRIGGER trg_wtrans_verify_ins
+  AFTER INSERT ON WalletTransaction
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_new();
+
+-- An update may move a transaction between customers: both sides are touched
+DROP TRIGGER IF EXISTS trg_wtrans_verify_upd_new ON WalletTransaction;
+CREATE TRIGGER trg_wtrans_verify_upd_new
+  AFTER UPDATE ON WalletTransaction
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_new();
+
+DROP TRIGGER IF EXISTS trg_wtrans_verify_upd_old ON WalletTransaction;
+CREATE TRIGGER trg_wtrans_verify_upd_old
+  AFTER UPDATE ON WalletTransaction
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_old();
+
+DROP TRIGGER IF EXISTS trg_wtrans_verify_del ON WalletTransaction;
+CREATE TRIGGER trg_wtrans_verify_del
+  AFTER DELETE ON WalletTransaction
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION fn_wallet_verify_touch_old();
@@ -0,0 +1,7 @@
+-- Inputs each customer's wallet history was last reconstructed from
+-- (scripts/reconstruct_wallet.py --incremental): md5 of Wallet.Balance and the
+-- customer's wallet-paid orders. A customer whose digest differs is rebuilt.
+CREATE TABLE IF NOT EXISTS WalletReconstructState (
+    CustomerID INT PRIMARY KEY,
+    Digest CHAR(32) NOT NULL
+);
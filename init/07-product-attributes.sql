@@ -0,0 +1,86 @@
+-- Product attributes as JSONB, and a facet table for attribute lookups (queries/13.sql).
+-- Databases created before the columns were JSONB are converted once; the conversion
+-- fails if a stored value is not valid JSON.
+DO $$
+BEGIN
+  IF (SELECT data_type FROM information_schema.columns
+      WHERE table_name = 'product' AND column_name = 'baseinfo') = 'text' THEN
+    ALTER TABLE Product ALTER COLUMN BaseInfo TYPE JSONB USING NULLIF(BaseInfo, '')::jsonb;
+  END IF;
+  IF (SELECT data_type FROM information_schema.columns
+      WHERE table_name = 'branchsupplyoffer' AND column_name = 'technicalspecs_json') = 'text' THEN
+    ALTER TABLE BranchSupplyOffer ALTER COLUMN TechnicalSpecs_JSON TYPE JSONB
+      USING NULLIF(TechnicalSpecs_JSON, '')::jsonb;
+  END IF;
+END $$;
+
+-- Distinct values of each top-level BaseInfo key per (Category, SubCategory); ProductCount
+-- is the number of products with that value. The primary key serves "values of key K in
+-- category C / sub-category S" as an index-only scan. Products without a category or
+-- sub-category, non-object BaseInfo and JSON null values are left out.
+CREATE TABLE IF NOT EXISTS ProductAttributeFacet (
+    Category VARCHAR(100) NOT NULL,
+    SubCategory VARCHAR(100) NOT NULL,
+    AttrKey TEXT NOT NULL,
+    AttrValue TEXT NOT NULL,
+    ProductCount INT NOT NULL,
+    PRIMARY KEY (Category, SubCategory, AttrKey, AttrValue)
+);
+
+CREATE OR REPLACE FUNCTION fn_attribute_facet_apply(cats TEXT[], subcats TEXT[], infos JSONB[], delta INT)
+RETURNS VOID AS $$
+  INSERT INTO ProductAttributeFacet AS f (Category, SubCategory, AttrKey, AttrValue, ProductCount)
+  SELECT p.Category, p.SubCategory, kv.key, kv.value, delta * COUNT(*)
+  FROM unnest(cats, subcats, infos) AS p(Category, SubCategory, Info)
+  CROSS JOIN LATERAL jsonb_each_text(CASE WHEN jsonb_typeof(p.Info) = 'object' THEN p.Info END) AS kv
+  WHERE p.Category IS NOT NULL AND p.SubCategory IS NOT NULL AND kv.value IS NOT NULL
+  GROUP BY p.Category, p.SubCategory, kv.key, kv.value
+  ON CONFLICT (Category, SubCategory, AttrKey, AttrValue) DO UPDATE
+  SET ProductCount = f.ProductCount + EXCLUDED.ProductCount;
+
+  DELETE FROM ProductAttributeFacet f
+  USING (SELECT DISTINCT Category, SubCategory FROM unnest(cats, subcats) AS p(Category, SubCategory)) p
+  WHERE delta < 0 AND f.Category = p.Category AND f.SubCategory = p.SubCategory AND f.ProductCount <= 0;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION fn_attribute_facet_touch()
+RETURNS TRIGGER AS $$
+DECLARE
+  c TEXT[];
+  s TEXT[];
+  i JSONB[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(Category), array_agg(SubCategory), array_agg(BaseInfo) INTO c, s, i FROM new_rows;
+    PERFORM fn_attribute_facet_apply(c, s, i, 1);
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(Category), array_agg(SubCategory), array_agg(BaseInfo) INTO c, s, i FROM old_rows;
+    PERFORM fn_attribute_facet_apply(c, s, i, -1);
+  ELSE
+    -- only products whose attributes or category changed
+    SELECT array_agg(o.Category), array_agg(o.SubCategory), array_agg(o.BaseInfo) INTO c, s, i
+    FROM old_rows o JOIN new_rows n ON n.ProductID = o.ProductID
+    WHERE (o.Category, o.SubCategory, o.BaseInfo) IS DISTINCT FROM (n.Category, n.SubCategory, n.BaseInfo);
+    PERFORM fn_attribute_facet_apply(c, s, i, -1);
+    SELECT array_agg(n.Category), array_agg(n.SubCategory), array_agg(n.BaseInfo) INTO c, s, i
+    FROM old_rows o JOIN new_rows n ON n.ProductID = o.ProductID
+    WHERE (o.Category, o.SubCategory, o.BaseInfo) IS DISTINCT FROM (n.Category, n.SubCategory, n.BaseInfo);
+    PERFORM fn_attribute_facet_apply(c, s, i, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_attribute_facet_ins ON Product;
+CREATE TRIGGER trg_attribute_facet_ins AFTER INSERT ON Product
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_attribute_facet_touch();
+DROP TRIGGER IF EXISTS trg_attribute_facet_upd ON Product;
+CREATE TRIGGER trg_attribute_facet_upd AFTER UPDATE ON Product
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_attribute_facet_touch();
+DROP TRIGGER IF EXISTS trg_attribute_facet_del ON Product;
+CREATE TRIGGER trg_attribute_facet_del AFTER DELETE ON Product
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fn_attribute_facet_touch();
+
+-- Products already in the database when this file is applied
+TRUNCATE ProductAttributeFacet;
+SELECT fn_attribute_facet_apply(array_agg(Category), array_agg(SubCategory), array_agg(BaseInfo), 1) FROM Product;
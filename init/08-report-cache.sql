@@ -0,0 +1,42 @@
+-- Change notifications for the report cache (scripts/reports.py). Every statement that writes
+-- a table with trg_report_cache_notify sends NOTIFY report_cache with the table name as payload;
+-- notifications are sent at commit and sent once per transaction and table, so a batch costs one
+-- message per table it wrote. Only the tables the reports of queries/*.sql read get the trigger:
+--   python scripts/reports.py --install-triggers
+-- passes them to set_report_cache_triggers (again after a report is added or changed).
+CREATE OR REPLACE FUNCTION fn_report_cache_notify()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('report_cache', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Give exactly the given tables (lower-case names) the trigger: create it where it is missing and
+-- drop it from the other tables of the schema. Tables already in the right state are not touched,
+-- so no lock is taken on them. Returns the number of tables changed.
+CREATE OR REPLACE FUNCTION set_report_cache_triggers(tables TEXT[])
+RETURNS INT AS $$
+DECLARE
+  t RECORD;
+  changed INT := 0;
+BEGIN
+  FOR t IN
+    SELECT c.relname, c.relname = ANY(tables) AS wanted
+    FROM pg_class c
+    WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+      AND (c.relname = ANY(tables)) <> EXISTS (
+        SELECT 1 FROM pg_trigger g WHERE g.tgrelid = c.oid AND g.tgname = 'trg_report_cache_notify')
+    ORDER BY c.relname
+  LOOP
+    IF t.wanted THEN
+      EXECUTE format('CREATE TRIGGER trg_report_cache_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                     'FOR EACH STATEMENT EXECUTE FUNCTION fn_report_cache_notify()', t.relname);
+    ELSE
+      EXECUTE format('DROP TRIGGER trg_report_cache_notify ON %I', t.relname);
+    END IF;
+    changed := changed + 1;
+  END LOOP;
+  RETURN changed;
+END;
+$$ LANGUAGE plpgsql;
@@ -3,15 +3,17 @@ deallocate subcategory_profit;
 
 PREPARE subcategory_profit AS
 
+-- One BranchProductBestOffer row per (branch, product) stands for all its offers:
+-- MarginSum sums their margins and OfferCount weights the quantity as the offer join did.
 SELECT
     p.SubCategory,
-    SUM((bso.SellingPrice - bso.SupplyPrice) * oi.Quantity) /
-        NULLIF(SUM(oi.Quantity), 0) AS weighted_avg_profit_margin
+    SUM(bp.MarginSum * oi.Quantity) /
+        NULLIF(SUM(oi.Quantity * bp.OfferCount), 0) AS weighted_avg_profit_margin
 FROM OrderItem oi
 JOIN Product p ON oi.ProductID = p.ProductID
 JOIN Order_Header oh ON oi.OrderID = oh.OrderID
-JOIN BranchSupplyOffer bso
-    ON bso.ProductID = oi.ProductID AND bso.BranchID = oh.BranchID
+JOIN BranchProductBestOffer bp
+    ON bp.ProductID = oi.ProductID AND bp.BranchID = oh.BranchID
 WHERE p.Category = $1
 GROUP BY p.SubCategory;
 
@@ -25,8 +25,9 @@ supplier_coverage AS (
     GROUP BY bso.BranchID, bso.SupplierID
 ),
 branch_avg_leadtime AS (
-    SELECT BranchID, AVG(LeadTime) AS BranchAvgLeadTime
-    FROM BranchSupplyOffer
+    -- average over all offers of the branch, from one BranchProductBestOffer row per product
+    SELECT BranchID, SUM(LeadTimeSum)::numeric / NULLIF(SUM(LeadTimeCount), 0) AS BranchAvgLeadTime
+    FROM BranchProductBestOffer
     GROUP BY BranchID
 )
 SELECT
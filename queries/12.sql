@@ -1,69 +1,22 @@
 deallocate customer_value;
 
-prepare customer_value as
+prepare customer_value(int, bigint) as
 
-WITH direct_payments AS (
-    SELECT
-        oh.CustomerID,
-        SUM(oh.TotalAmount) AS TotalOrderPayments
-    FROM Order_Header oh
-    WHERE oh.PaymentMethod IN ('credit card', 'debit card', 'cash', 'wallet')
-    GROUP BY oh.CustomerID
-),
-bnpl_repayments AS (
-    SELECT
-        oh.CustomerID,
-        SUM(rh.Amount) AS TotalBNPLRepaid
-    FROM RepaymentHistory rh
-    JOIN Order_Header oh ON oh.OrderID = rh.OrderID
-    GROUP BY oh.CustomerID
-),
-approved_returns AS (
-    SELECT
-        oh.CustomerID,
-        SUM(oi.CalculatedItemPrice) AS TotalRefunded
-    FROM ReturnRequest rr
-    JOIN OrderItem oi
-        ON oi.OrderID = rr.OrderID
-        AND oi.ProductID = rr.ProductID
-    JOIN Order_Header oh ON oh.OrderID = rr.OrderID
-    WHERE rr.ReviewResult = 'Approved'
-    GROUP BY oh.CustomerID
-),
-tax_paid AS (
-    SELECT
-        oh.CustomerID,
-        SUM(oi.CalculatedItemPrice * p.TaxAmount) AS TotalTaxPaid
-    FROM OrderItem oi
-    JOIN Order_Header oh ON oh.OrderID = oi.OrderID
-    JOIN Product p ON p.ProductID = oi.ProductID
-    WHERE NOT EXISTS (
-        SELECT 1
-        FROM ReturnRequest rr
-        WHERE rr.OrderID = oi.OrderID
-          AND rr.ProductID = oi.ProductID
-          AND rr.ReviewResult = 'Approved'
-    )
-    GROUP BY oh.CustomerID
-)
+-- CustomerLedger holds the four totals per customer (kept current by triggers on
+-- Order_Header, OrderItem, RepaymentHistory, ReturnRequest and Product, see
+-- init/02-views.sql). $1 = one customer or NULL for all, $2 = top N or NULL for all.
 SELECT
     c.CustomerID,
-    c.Name                                                      AS CustomerName,
-    COALESCE(dp.TotalOrderPayments, 0)                          AS DirectPayments,
-    COALESCE(bp.TotalBNPLRepaid, 0)                             AS BNPLRepayments,
-    COALESCE(ar.TotalRefunded, 0)                               AS ApprovedReturnRefunds,
-    COALESCE(tp.TotalTaxPaid, 0)                                AS TotalTaxPaid,
-    ROUND(
-        COALESCE(dp.TotalOrderPayments, 0)
-        + COALESCE(bp.TotalBNPLRepaid, 0)
-        - COALESCE(ar.TotalRefunded, 0)
-        + COALESCE(tp.TotalTaxPaid, 0),
-    2)                                                          AS TrueCustomerValue
-FROM Customer c
-LEFT JOIN direct_payments dp   ON dp.CustomerID = c.CustomerID
-LEFT JOIN bnpl_repayments bp   ON bp.CustomerID = c.CustomerID
-LEFT JOIN approved_returns ar  ON ar.CustomerID = c.CustomerID
-LEFT JOIN tax_paid tp          ON tp.CustomerID = c.CustomerID
-ORDER BY TrueCustomerValue DESC;
+    c.Name                      AS CustomerName,
+    l.DirectPayments,
+    l.BNPLRepayments,
+    l.ApprovedReturnRefunds,
+    l.TotalTaxPaid,
+    l.TrueCustomerValue
+FROM CustomerLedger l
+JOIN Customer c ON c.CustomerID = l.CustomerID
+WHERE $1 IS NULL OR l.CustomerID = $1
+ORDER BY l.TrueCustomerValue DESC
+LIMIT $2;
 
-execute customer_value;
\ No newline at end of file
+execute customer_value(NULL, NULL);
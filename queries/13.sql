@@ -1,13 +1,15 @@
 DEALLOCATE get_attribute_values;
 
+-- ProductAttributeFacet holds the distinct values of each BaseInfo key per category and
+-- sub-category (init/07-product-attributes.sql); its primary key answers this index-only.
 PREPARE get_attribute_values(text, text, text) AS
-SELECT DISTINCT
-    (BaseInfo::jsonb) ->> $1 AS attribute_value
+SELECT
+    f.AttrValue AS attribute_value
 FROM
-    Product
+    ProductAttributeFacet f
 WHERE
-    Category = $2
-    AND SubCategory = $3
-    AND (BaseInfo::jsonb) ->> $1 IS NOT NULL;
+    f.Category = $2
+    AND f.SubCategory = $3
+    AND f.AttrKey = $1;
 
 EXECUTE get_attribute_values('camera', 'Electronics', 'Mobile Phones');
\ No newline at end of file
@@ -9,6 +9,7 @@ JOIN Order_Header oh ON oi.OrderID = oh.OrderID
 JOIN Product p ON oi.ProductID = p.ProductID
 JOIN ProductReview pr ON pr.ProductID = p.ProductID
 WHERE oh.OrderDate BETWEEN $1 AND $2
+  AND oi.OrderDate BETWEEN $1 AND $2  -- same dates; lets partitioned OrderItem skip other partitions
 GROUP BY p.ProductID, p.Name
 ORDER BY avg_score DESC NULLS LAST;
 
@@ -2,32 +2,25 @@ deallocate mutual_branch_customers;
 
 PREPARE mutual_branch_customers AS
 
+-- CustomerBranchActivity has one row per customer and branch with the order count
+-- (kept current by triggers on Order_Header, see init/02-views.sql)
 SELECT
     c.CustomerID,
     c.name AS customer_name,
     b1.name AS branch1_name,
-    COUNT(DISTINCT CASE WHEN oh.BranchID = $1 THEN oh.OrderID END) AS orders_in_branch1,
+    a1.OrderCount AS orders_in_branch1,
     b2.name AS branch2_name,
-    COUNT(DISTINCT CASE WHEN oh.BranchID = $2 THEN oh.OrderID END) AS orders_in_branch2,
+    a2.OrderCount AS orders_in_branch2,
     CASE
-        WHEN COUNT(DISTINCT CASE WHEN oh.BranchID = $1 THEN oh.OrderID END) >=
-             COUNT(DISTINCT CASE WHEN oh.BranchID = $2 THEN oh.OrderID END)
-        THEN b1.name
+        WHEN a1.OrderCount >= a2.OrderCount THEN b1.name
         ELSE b2.name
     END AS preferred_branch
-FROM Customer c
-JOIN Order_Header oh ON c.CustomerID = oh.CustomerID
-CROSS JOIN Branch b1
-CROSS JOIN Branch b2
-WHERE b1.BranchID = $1
-  AND b2.BranchID = $2
-  AND oh.BranchID IN ($1, $2)
-  AND c.CustomerID IN (
-      SELECT oh1.CustomerID FROM Order_Header oh1 WHERE oh1.BranchID = $1
-      INTERSECT
-      SELECT oh2.CustomerID FROM Order_Header oh2 WHERE oh2.BranchID = $2
-  )
-GROUP BY c.CustomerID, c.name, c.CustomerID, b1.name, b2.name
+FROM CustomerBranchActivity a1
+JOIN CustomerBranchActivity a2 ON a2.CustomerID = a1.CustomerID AND a2.BranchID = $2
+JOIN Customer c ON c.CustomerID = a1.CustomerID
+JOIN Branch b1 ON b1.BranchID = a1.BranchID
+JOIN Branch b2 ON b2.BranchID = a2.BranchID
+WHERE a1.BranchID = $1
 ORDER BY customer_name;
 
 
@@ -2,24 +2,25 @@ deallocate wallet_turnover;
 
 PREPARE wallet_turnover AS
 
+-- WalletTurnoverYearly holds SUM(ABS(Amount)) and the transaction count per customer and year.
+-- Numbers match the former double join over WalletTransaction: each customer-year in a group
+-- adds its transaction count times the customer's turnover over all years (and times the
+-- customer's number of years to the count).
+WITH customer_totals AS (
+    SELECT CustomerID, SUM(Turnover) AS total_turnover, COUNT(*) AS years
+    FROM WalletTurnoverYearly
+    GROUP BY CustomerID
+)
 SELECT
     c.Gender,
     c.IncomeLevel,
-    EXTRACT(YEAR FROM wt.date) AS transaction_year,
-    COUNT(DISTINCT c.CustomerID) AS customer_count,
-    AVG(abs_turnover.total_turnover) AS avg_wallet_turnover
-FROM Customer c
-JOIN Wallet w ON c.CustomerID = w.CustomerID
-JOIN (
-    SELECT
-        wt.customerid,
-        EXTRACT(YEAR FROM wt.date) AS yr,
-        SUM(ABS(wt.Amount)) AS total_turnover
-    FROM WalletTransaction wt
-    GROUP BY wt.customerid, EXTRACT(YEAR FROM wt.date)
-) abs_turnover ON w.customerid = abs_turnover.customerid
-JOIN WalletTransaction wt ON w.customerid = wt.customerid
-GROUP BY c.Gender, c.IncomeLevel, EXTRACT(YEAR FROM wt.date)
+    wy.Year AS transaction_year,
+    COUNT(*) AS customer_count,
+    SUM(wy.TxnCount * ct.total_turnover) / SUM(wy.TxnCount * ct.years) AS avg_wallet_turnover
+FROM WalletTurnoverYearly wy
+JOIN customer_totals ct ON ct.CustomerID = wy.CustomerID
+JOIN Customer c ON c.CustomerID = wy.CustomerID
+GROUP BY c.Gender, c.IncomeLevel, wy.Year
 ORDER BY transaction_year, c.Gender, c.IncomeLevel;
 
 execute wallet_turnover;
\ No newline at end of file
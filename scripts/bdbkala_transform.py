@@ -0,0 +1,444 @@
+"""
+Columnar transform stage for BDBKala_full.csv.
+
+Does the same normalisation as load_dataset._collect_bdbkala (customer fields,
+product IDs, quantities and prices, priority/payment/transport mapping,
+packaging, (OrderID, ProductID) dedup and order totals) over whole columns:
+
+- Text fields with few distinct values (priority, payment, dates, packaging,
+  quantities, customer attributes) are factorized, the row loop's expression
+  runs once per distinct value, and the result is broadcast back to the rows.
+- Prices and shipping costs are parsed into scaled int64, then multiplied,
+  summed and rounded half-even exactly like Decimal. Values that cannot be
+  represented that way go through Decimal for those rows only, and sums and
+  totals that could leave int64 are computed on Python ints instead.
+
+The output is identical to the row-by-row path; `python bdbkala_transform.py
+--check [file]` runs both over a file and reports the rows that differ.
+transform_bdbkala returns a BDBKalaFrames of DataFrames whose columns are named
+after the target table columns and can be passed straight to bulk.copy_upsert.
+"""
+import argparse
+import csv
+import random
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from load_dataset import (DATASET_DIR, PAYMENT_MAP, PRIORITY_MAP, TRANSPORT_MAP, _bdbkala_product_resolver,
+                          _collect_bdbkala, _order_rows, parse_packaging)
+
+BDBKalaFrames = namedtuple("BDBKalaFrames", "products customers orders items")
+
+_MAX_SCALE = 6  # decimals handled in int64
+_MAX_MANTISSA = 2 ** 50  # float * 10 ** scale is exact to well under 0.5 below this
+_MAX_SAFE = 2 ** 62
+
+
+def read_bdbkala(path_or_buffer):
+    """Read BDBKala_full.csv as all-string columns, empty fields as ''."""
+    return pd.read_csv(path_or_buffer, dtype=str, keep_default_na=False, na_filter=False, encoding="utf-8")
+
+
+def _col(df, name, default=""):
+    """Column as str Series; missing column gives default, like row.get(name, default)."""
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def _map_unique(s, func, dtype=object):
+    """func applied once per distinct value of s, broadcast back to the rows as an ndarray."""
+    codes, uniques = pd.factorize(s, sort=False)
+    if dtype is object:
+        mapped = np.empty(len(uniques), dtype=object)
+        mapped[:] = [func(u) for u in np.asarray(uniques, dtype=object)]
+    else:
+        mapped = np.array([func(u) for u in np.asarray(uniques, dtype=object)], dtype=dtype)
+    return mapped[codes]
+
+
+def _strip(s):
+    return _map_unique(s, str.strip)
+
+
+# ---- row-loop expressions, applied per distinct value ----
+
+def _order_id(v):
+    try:
+        return int(v)
+    except ValueError:
+        return None
+
+
+def _quantity(v):
+    try:
+        return max(1, int(float(v or 1)))
+    except (ValueError, TypeError):
+        return 1
+
+
+def _date(v):
+    if v:
+        try:
+            return datetime.strptime(v[:10], "%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+
+def _age(v):
+    return int(v) if v and str(v).isdigit() else None
+
+
+def _gender(v):
+    g = (v or "").strip().lower()
+    return "M" if "male" in g and "female" not in g else "F" if "female" in g else None
+
+
+def _nature(v):
+    return "corporate" if (v or "Consumer").strip() in ("Corporate", "Small Business") else "consumer"
+
+
+def _income(v):
+    """(IncomeLevel as stored, income present, float value) for the priority rule."""
+    if not v:
+        return None, False, np.nan
+    d = Decimal(str(v))
+    return (str(d) if d else None), True, float(d)
+
+
+# ---- exact decimals in scaled int64 ----
+
+def _decimal_column(s):
+    """Decimal(str(x or 0)) for a whole column, as (column, mask of fast rows, int64 mantissas, scale).
+
+    A row is on the fast path when its text is at most 15 characters (so a
+    float holds every digit), it has at most _MAX_SCALE decimals and its
+    mantissa at the column scale stays below _MAX_MANTISSA.
+    """
+    s = s.where(s != "", "0")
+    v = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+    fast = (s.str.len().to_numpy() <= 15) & np.isfinite(v)
+    v = np.where(fast, v, 0)
+    row_scale = np.full(len(v), _MAX_SCALE + 1)
+    for k in range(_MAX_SCALE, -1, -1):
+        row_scale[np.rint(v * 10 ** k) / 10 ** k == v] = k
+    fast &= row_scale <= _MAX_SCALE
+    scale = int(row_scale[fast].max()) if fast.any() else 0
+    fast &= np.abs(v) * 10 ** scale < _MAX_MANTISSA
+    mant = np.rint(np.where(fast, v, 0) * 10 ** scale).astype(np.int64)
+    return s, fast, mant, scale
+
+
+def _exact(values):
+    """int64 mantissas as Python ints (object array), for arithmetic that could overflow int64."""
+    return np.asarray(values).astype(object)
+
+
+def _beyond_int64(values, factor=1):
+    """True if some |value| * factor could reach _MAX_SAFE (always for Python int arrays)."""
+    if values.dtype == object:
+        return True
+    return len(values) > 0 and float(np.abs(values).max()) * factor >= _MAX_SAFE
+
+
+def _round_half_even(values, from_scale, to_scale=2):
+    """Round int64 (or Python int) mantissas from from_scale down to to_scale, half to even."""
+    if from_scale <= to_scale:
+        return values * 10 ** (to_scale - from_scale)
+    m = 10 ** (from_scale - to_scale)
+    q, r = np.abs(values) // m, np.abs(values) % m
+    q = q + ((2 * r > m) | ((2 * r == m) & (q % 2 == 1)))
+    return np.where(values < 0, -q, q)
+
+
+def _scaled_text(values, scale=2):
+    """int64 (or Python int) mantissas -> decimal text ('12.30', '-0.05')."""
+    q, r = np.abs(values) // 10 ** scale, np.abs(values) % 10 ** scale
+    text = np.where(values < 0, "-", "").astype(object) + q.astype(str).astype(object)
+    if scale:
+        text = text + "." + np.char.zfill(r.astype(str), scale).astype(object)
+    return text
+
+
+def _item_prices(unit_s, disc_s, qty):
+    """max(0, round(Decimal(unit) * (1 - Decimal(discount)) * qty, 2)) in cents."""
+    unit_s, unit_fast, unit_m, unit_scale = _decimal_column(unit_s)
+    disc_s, disc_fast, disc_m, disc_scale = _decimal_column(disc_s)
+    one_minus = 10 ** disc_scale - disc_m
+    # Rows whose exact product could overflow int64 take the Decimal path
+    approx = np.abs(unit_m.astype(float)) * np.abs(one_minus.astype(float)) * qty.astype(float)
+    fast = unit_fast & disc_fast & (approx < _MAX_SAFE)
+    cents = _round_half_even(np.where(fast, unit_m * one_minus * qty, 0), unit_scale + disc_scale)
+    slow = np.flatnonzero(~fast)
+    prices = [int(round(Decimal(str(unit_s.iat[i])) * (1 - Decimal(str(disc_s.iat[i]))) * int(qty[i]), 2) * 100)
+              for i in slow]
+    if any(abs(p) >= _MAX_SAFE for p in prices):
+        cents = _exact(cents)
+    cents[slow] = prices
+    return np.maximum(cents, 0)
+
+
+def _order_totals(item_cents, cost_s):
+    """Shipping cost text and max(0, round(items + shipping cost, 2)) in cents, per order."""
+    cost_s, fast, mant, scale = _decimal_column(cost_s)
+    total_scale = max(2, scale)
+    item_factor, cost_factor = 10 ** (total_scale - 2), 10 ** (total_scale - scale)
+    if _beyond_int64(item_cents, 2 * item_factor) or _beyond_int64(mant, 2 * cost_factor):
+        item_cents, mant = _exact(item_cents), _exact(mant)
+    total = _round_half_even(item_cents * item_factor + mant * cost_factor, total_scale)
+    cost_text = _scaled_text(mant, scale)
+    slow = np.flatnonzero(~fast)
+    costs = [Decimal(str(cost_s.iat[i])) for i in slow]
+    totals = [int(round(Decimal(int(item_cents[i])) / 100 + cost, 2) * 100) for i, cost in zip(slow, costs)]
+    if any(abs(t) >= _MAX_SAFE for t in totals):
+        total = _exact(total)
+    cost_text[slow] = [str(cost) for cost in costs]
+    total[slow] = totals
+    return cost_text, np.maximum(total, 0)  # Ensure non-negative for constraint
+
+
+# ---- frames ----
+
+def _customers(cdf, email, cids):
+    """Customer rows for new customers, and their (nature, income) lookup for the priority rule."""
+    income = _map_unique(_col(cdf, "Income"), _income)
+    nature = _map_unique(_col(cdf, "Customer Segment"), _nature)
+    customers = pd.DataFrame({
+        "CustomerID": cids,
+        "Name": _strip(_col(cdf, "Customer Name")),
+        "Phone": _map_unique(_col(cdf, "Phone"), lambda v: v.strip() or None),
+        "Email": email,
+        "Age": pd.array(_map_unique(_col(cdf, "Customer Age"), _age), dtype="Int64"),
+        "Gender": _map_unique(_col(cdf, "Gender"), _gender),
+        "IncomeLevel": np.array([i[0] for i in income], dtype=object),
+        "Nature": nature,
+    })
+    lookup = pd.DataFrame({
+        "email": email, "CustomerID": cids, "nature": nature,
+        "inc_present": np.array([i[1] for i in income], dtype=bool),
+        "inc_value": np.array([i[2] for i in income], dtype=float),
+    })
+    return customers, lookup
+
+
+def _known_lookup(known_customers):
+    """(nature, income) lookup for customers already in the database; IncomeLevel as stored."""
+    def value(inc):
+        try:
+            return float(inc)
+        except (ValueError, TypeError):
+            return np.nan
+
+    rows = [(e, cid, nat, inc is not None, value(inc)) for e, (cid, nat, inc) in known_customers.items()]
+    return pd.DataFrame(rows, columns=["email", "CustomerID", "nature", "inc_present", "inc_value"])
+
+
+def _products(df, product_map):
+    """ProductID per row and the new Product rows; new keys are numbered in first-appearance order."""
+    keys = pd.MultiIndex.from_arrays([
+        _strip(_col(df, "Product Name")),
+        _strip(_col(df, "Product Category")),
+        _strip(_col(df, "Product Sub-Category")),
+    ])
+    codes, uniques = pd.factorize(keys, sort=False)
+    next_pid = (max(product_map.values()) if product_map else 0) + 1
+    ids = np.empty(len(uniques), dtype=np.int64)
+    new = np.zeros(len(uniques), dtype=bool)
+    for i, key in enumerate(uniques):
+        pid = product_map.get(key)
+        if pid is None:
+            pid = product_map[key] = next_pid
+            next_pid += 1
+            new[i] = True
+        ids[i] = pid
+    products = pd.DataFrame(list(uniques[new]), columns=["Name", "Category", "SubCategory"])
+    products["ProductID"] = ids[new]
+    products["Category"] = products["Category"].replace("", None)
+    products["SubCategory"] = products["SubCategory"].replace("", None)
+    return ids[codes], products
+
+
+def transform_bdbkala(df, branch_ids, product_map, next_cid=1, known_customers=None):
+    """Vectorized equivalent of _collect_bdbkala followed by the order/item shaping in _write_bdbkala.
+
+    df: raw BDBKala_full.csv frame from read_bdbkala.
+    product_map: (name, category, subcategory) -> ProductID, updated in place with new products.
+    known_customers: email -> (CustomerID, Nature, IncomeLevel) for customers already in the database.
+    Returns (BDBKalaFrames, next_cid). The order of random draws (branch per order,
+    then tier per new customer) matches the row loop.
+    """
+    known_customers = known_customers or {}
+
+    # Rows without a usable Order ID or email are skipped
+    order_id = _map_unique(_col(df, "Order ID"), _order_id)
+    email = _strip(_col(df, "Email"))
+    valid = pd.notna(order_id) & (email != "")
+    df = df[valid]
+    order_id = order_id[valid].astype(np.int64)
+    email = _map_unique(pd.Series(email[valid]), lambda e: e.replace("@@", "@"))  # Fix common typo for constraint
+
+    # Customers: attributes from the first row of each new email
+    emails = pd.Series(email)
+    new_cust = (~emails.duplicated() & ~emails.isin(known_customers.keys())).to_numpy()
+    cids = np.arange(next_cid, next_cid + int(new_cust.sum()), dtype=np.int64)
+    customers, lookup = _customers(df[new_cust], email[new_cust], cids)
+    if known_customers:
+        lookup = pd.concat([lookup, _known_lookup(known_customers)], ignore_index=True)
+    lookup = lookup.set_index("email")
+
+    product_id, products = _products(df, product_map)
+
+    # Items, deduplicated by (OrderID, ProductID)
+    qty = _map_unique(_col(df, "Order Quantity", 1), _quantity, np.int64)
+    cents = _item_prices(_col(df, "Unit Price", "0"), _col(df, "Discount", "0"), qty)
+    if cents.dtype != object and _beyond_int64(pd.Series(np.abs(cents), dtype=float).groupby(order_id).sum().to_numpy()):
+        cents = _exact(cents)  # an order's sum could overflow int64
+    rows = pd.DataFrame({"OrderID": order_id, "ProductID": product_id, "Quantity": qty, "cents": cents})
+    items = rows.groupby(["OrderID", "ProductID"], sort=False, as_index=False).agg(
+        Quantity=("Quantity", "sum"), cents=("cents", "sum"))
+    items["CalculatedItemPrice"] = _scaled_text(items.pop("cents").to_numpy())
+    order_cents = rows.groupby("OrderID", sort=False)["cents"].sum()
+
+    # Orders: header and shipment fields from the first row of each order
+    first_order = ~pd.Series(order_id).duplicated().to_numpy()
+    odf = df[first_order]
+    oids = order_id[first_order]
+    branch = np.array([random.choice(branch_ids) if branch_ids else 1 for _ in range(len(oids))], dtype=np.int64)
+
+    priority = _map_unique(_col(odf, "Order Priority"), lambda v: PRIORITY_MAP.get((v or "Low").strip(), "low"))
+    payment = _map_unique(_col(odf, "Payment Method"), lambda v: PAYMENT_MAP.get((v or "").strip(), "credit card"))
+    ship_date = _map_unique(_col(odf, "Ship Date"), _date, "datetime64[us]")
+    transport = _map_unique(_col(odf, "Ship Mode"), lambda v: TRANSPORT_MAP.get((v or "").strip(), "ground"))
+    packaging = _map_unique(_col(odf, "Packaging"), parse_packaging)
+    pack_type = np.array([p[0] for p in packaging], dtype=object)
+    pack_size = np.array([p[1] for p in packaging], dtype=object)
+    transport = np.where((pack_type == "box") & (transport == "ground"), "airmail", transport)  # Box cannot use ground
+    ship_type = _map_unique(_col(odf, "Shipping Method"), lambda v: "same-day" if "Express" in (v or "") else "standard")
+    cost_text, total = _order_totals(order_cents.loc[oids].to_numpy(), _col(odf, "Shipping Cost", "0"))
+
+    # Corporate customers with income below 60000 cannot have highest priority
+    cust = lookup.loc[email[first_order]]
+    downgrade = ((priority == "highest") & (cust["nature"].to_numpy() == "corporate")
+                 & cust["inc_present"].to_numpy(dtype=bool) & (cust["inc_value"].to_numpy(dtype=float) < 60000))
+
+    orders = pd.DataFrame({
+        "OrderID": oids,
+        "Priority": np.where(downgrade, "high", priority),
+        "TotalAmount": _scaled_text(total),
+        "PaymentMethod": payment,
+        "LoyaltyDiscount": 0,
+        "CustomerID": cust["CustomerID"].to_numpy(dtype=np.int64),
+        "BranchID": branch,
+        "ShipDate": ship_date,
+        "RecipientAddress": _map_unique(_col(odf, "Shipping Address"), lambda v: v.strip() or None),
+        "City": _map_unique(_col(odf, "City"), lambda v: v.strip() or None),
+        "ZipCode": _map_unique(_col(odf, "Zip Code"), lambda v: v.strip() or None),
+        "Type": ship_type,
+        "TransportMethod": transport,
+        "Cost": cost_text,
+        "PackType": pack_type,
+        "PackSize": pack_size,
+    })
+
+    return BDBKalaFrames(products, customers, orders, items), next_cid + len(cids)
+
+
+def _plain(v):
+    """Frame cell as the row loop writes it: missing -> None, numpy scalars -> Python."""
+    if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v)):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _frame_rows(df, key, money=()):
+    """{key: row dict} of plain values, money columns as Decimal."""
+    rows = {}
+    for rec in df.to_dict("records"):
+        rec = {k: _plain(v) for k, v in rec.items()}
+        for col in money:
+            rec[col] = Decimal(rec[col])
+        rows[tuple(rec[k] for k in key) if isinstance(key, tuple) else rec[key]] = rec
+    return rows
+
+
+def compare_with_row_loop(path, branch_ids=(1, 2, 3), seed=0, show=10):
+    """Run transform_bdbkala and the row loop of load_dataset over path; returns the differing rows.
+
+    Both start from an empty product map and the same random seed. Each difference
+    is (table, key, transform row, row-loop row); None for a row one side lacks.
+    """
+    branch_ids = list(branch_ids)
+    random.seed(seed)
+    frames, _ = transform_bdbkala(read_bdbkala(path), branch_ids, {})
+
+    random.seed(seed)
+    product_map, customers = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        orders, order_item_agg, _ = _collect_bdbkala(csv.DictReader(f), branch_ids,
+                                                     _bdbkala_product_resolver(product_map), customers, 1)
+    cid_to_nature_income = {cid: (nat, inc) for _, (cid, _, _, _, _, inc, nat) in customers.items()}
+
+    expected = {
+        "Product": {pid: {"ProductID": pid, "Name": name, "Category": cat or None, "SubCategory": sub or None}
+                    for (name, cat, sub), pid in product_map.items()},
+        "Customer": {cid: {"CustomerID": cid, "Name": name, "Phone": phone or None, "Email": email, "Age": age,
+                           "Gender": gender, "IncomeLevel": str(inc) if inc else None, "Nature": nature}
+                     for email, (cid, name, phone, age, gender, inc, nature) in customers.items()},
+        "OrderItem": {key: {"OrderID": key[0], "ProductID": key[1], "Quantity": qty,
+                            "CalculatedItemPrice": max(Decimal("0"), price)}
+                      for key, (qty, price) in order_item_agg.items()},
+        "Order_Header": {},
+    }
+    for oid, _, priority, total, payment, _, cid, branch in _order_rows(orders, order_item_agg, cid_to_nature_income, None):
+        data = orders[oid]
+        expected["Order_Header"][oid] = {
+            "OrderID": oid, "Priority": priority, "TotalAmount": total, "PaymentMethod": payment, "CustomerID": cid,
+            "BranchID": branch, "ShipDate": data["ship_date"], "RecipientAddress": data["ship_addr"] or None,
+            "City": data["city"] or None, "ZipCode": data["zip_code"] or None, "Type": data["ship_type"],
+            "TransportMethod": data["transport"], "Cost": data["ship_cost"], "PackType": data["pack_type"],
+            "PackSize": data["pack_size"],
+        }
+    actual = {
+        "Product": _frame_rows(frames.products, "ProductID"),
+        "Customer": _frame_rows(frames.customers, "CustomerID"),
+        "OrderItem": _frame_rows(frames.items, ("OrderID", "ProductID"), ("CalculatedItemPrice",)),
+        "Order_Header": _frame_rows(frames.orders, "OrderID", ("TotalAmount", "Cost")),
+    }
+
+    diffs = []
+    for table, want in expected.items():
+        got = actual[table]
+        bad = []
+        for key in sorted(want.keys() | got.keys()):
+            row = got.get(key)
+            if row is not None:
+                row = {k: row[k] for k in want.get(key, row)}
+            if row != want.get(key):
+                bad.append((table, key, row, want.get(key)))
+        for _, key, row, want_row in bad[:show]:
+            print(f"  {table} {key}: transform {row}, row loop {want_row}")
+        print(f"{table}: {len(bad)} of {len(want)} rows differ")
+        diffs.extend(bad)
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="compare transform_bdbkala with the row-by-row path")
+    parser.add_argument("path", nargs="?", default=str(DATASET_DIR / "BDBKala_full.csv"))
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+    elif compare_with_row_loop(args.path):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
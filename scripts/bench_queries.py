@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Benchmark the prepared reports in queries/*.sql under different index sets.
+
+Each report file holds one PREPARE and one EXECUTE. For every report and
+parameter set, every execution runs as EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON):
+- cold: BENCH_COLD_RUNS executions, each the first on a new connection
+  (statement prepared and planned from scratch; shared buffers and the OS
+  cache are not flushed, a server restart is needed for that)
+- warm: BENCH_WARM_RUNS executions on one connection after BENCH_WARMUP
+  unrecorded ones
+
+Index sets: "none" (none of the experimental indexes), "index-for" (the
+CREATE INDEX statements of all "queries/Index For *.sql" files),
+"index-for-<N>" (one such file) and name=path.sql (CREATE INDEX statements
+of any file). Indexes of all selected sets are dropped before each set runs;
+those that existed before the benchmark are re-created at the end.
+
+The JSON report has latency percentiles (planning + execution time), buffer
+hits/reads and the distinct plan shapes per report, parameter set and index
+set, and flags reports whose plan shape differs from the first index set.
+--compare old.json lists reports whose warm p50 grew by more than
+--threshold and exits with status 1 if there are any.
+
+    python scripts/bench_queries.py --sets none,index-for --queries 1,4
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import db
+from sql_files import QUERIES_DIR, load_reports, split_statements, strip_comments
+
+load_dotenv()
+
+BENCH_COLD_RUNS = int(os.getenv("BENCH_COLD_RUNS", "3"))
+BENCH_WARM_RUNS = int(os.getenv("BENCH_WARM_RUNS", "10"))
+BENCH_WARMUP = int(os.getenv("BENCH_WARMUP", "1"))
+
+PERCENTILES = (50, 90, 95, 99)
+
+_CREATE_INDEX = re.compile(
+    r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I
+)
+
+
+def index_file_statements(path):
+    """[(index name, CREATE INDEX statement)] of an SQL file; other statements are ignored."""
+    out = []
+    for stmt in split_statements(Path(path).read_text(encoding="utf-8")):
+        m = _CREATE_INDEX.match(strip_comments(stmt))
+        if m:
+            out.append((m.group(1).lower(), stmt))
+    return out
+
+
+def index_sets(names):
+    """Resolve --sets entries to {set name: [(index name, CREATE statement)]}, in order."""
+    index_for = {}
+    for p in sorted(QUERIES_DIR.glob("Index For *.sql")):
+        index_for[p.stem.split()[-1]] = index_file_statements(p)
+    sets = {}
+    for entry in names:
+        if entry == "none":
+            sets[entry] = []
+        elif entry == "index-for":
+            sets[entry] = [s for stmts in index_for.values() for s in stmts]
+        elif entry.startswith("index-for-") and entry[len("index-for-"):] in index_for:
+            sets[entry] = index_for[entry[len("index-for-"):]]
+        elif "=" in entry:
+            name, path = entry.split("=", 1)
+            sets[name] = index_file_statements(path)
+        else:
+            raise ValueError(f"unknown index set {entry!r} (none, index-for, index-for-<N> or name=path.sql)")
+    return sets
+
+
+def _existing_indexes(cur, names):
+    cur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND indexname = ANY(%s)",
+        (list(names),),
+    )
+    return dict(cur.fetchall())
+
+
+def _drop_indexes(cur, names):
+    for name in sorted(names):
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def load_params(path):
+    """Parameter sets from a JSON file: {report name or file stem: [[arg, ...], ...]}."""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _param_sets(report, params, cur):
+    """SQL argument lists to run the report with (default: those of its EXECUTE)."""
+    given = params.get(report["name"]) or params.get(Path(report["file"]).stem)
+    if not given:
+        return [report["args"]]
+    return [", ".join(cur.mogrify("%s", (v,)).decode() for v in values) for values in given]
+
+
+def plan_shape(node):
+    """Node types with their relation / index names, e.g. 'Hash Join(Seq Scan[orderitem], Hash(...))'."""
+    label = node["Node Type"]
+    target = node.get("Index Name") or node.get("Relation Name")
+    if target:
+        label += f"[{target}]"
+    children = node.get("Plans") or []
+    if children:
+        label += "(" + ", ".join(plan_shape(c) for c in children) + ")"
+    return label
+
+
+def _explain(cur, name, args):
+    call = f"EXECUTE {name}({args})" if args else f"EXECUTE {name}"
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {call}")
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    top = result[0]
+    plan = top["Plan"]
+    return {
+        "ms": top.get("Planning Time", 0.0) + top["Execution Time"],
+        "planning_ms": top.get("Planning Time", 0.0),
+        "shared_hit": plan.get("Shared Hit Blocks", 0),
+        "shared_read": plan.get("Shared Read Blocks", 0),
+        "shape": plan_shape(plan),
+    }
+
+
+def _session(report):
+    conn = db.connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(report["prepare"])
+    return conn, cur
+
+
+def run_cold(report, args, runs):
+    samples = []
+    for _ in range(runs):
+        conn, cur = _session(report)
+        try:
+            samples.append(_explain(cur, report["name"], args))
+        finally:
+            conn.close()
+    return samples
+
+
+def run_warm(report, args, runs, warmup):
+    conn, cur = _session(report)
+    try:
+        for _ in range(warmup):
+            _explain(cur, report["name"], args)
+        return [_explain(cur, report["name"], args) for _ in range(runs)]
+    finally:
+        conn.close()
+
+
+def percentile(values, p):
+    """Linear interpolation between closest ranks."""
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    ms = [s["ms"] for s in samples]
+    shapes = {}
+    for s in samples:
+        shapes[s["shape"]] = shapes.get(s["shape"], 0) + 1
+    out = {"runs": len(samples), "min_ms": round(min(ms), 3), "max_ms": round(max(ms), 3),
+           "mean_ms": round(sum(ms) / len(ms), 3),
+           "mean_planning_ms": round(sum(s["planning_ms"] for s in samples) / len(samples), 3)}
+    for p in PERCENTILES:
+        out[f"p{p}_ms"] = round(percentile(ms, p), 3)
+    out["shared_hit_blocks"] = round(sum(s["shared_hit"] for s in samples) / len(samples), 1)
+    out["shared_read_blocks"] = round(sum(s["shared_read"] for s in samples) / len(samples), 1)
+    out["plans"] = [{"shape": shape, "runs": runs} for shape, runs in shapes.items()]
+    return out
+
+
+def run(reports, sets, params, cold_runs, warm_runs, warmup):
+    """Benchmark every report under every index set. Returns the report dict."""
+    all_indexes = {name for stmts in sets.values() for name, _ in stmts}
+    admin = db.connect()
+    admin.autocommit = True
+    cur = admin.cursor()
+    existing = _existing_indexes(cur, all_indexes)
+    results = []
+    try:
+        for set_name, stmts in sets.items():
+            print(f"Index set {set_name}: {', '.join(n for n, _ in stmts) or 'no extra indexes'}")
+            _drop_indexes(cur, all_indexes)
+            for _, create in stmts:
+                cur.execute(create)
+            if stmts:
+                cur.execute("ANALYZE")
+            for report in reports:
+                for args in _param_sets(report, params, cur):
+                    started = time.perf_counter()
+                    cold = summarize(run_cold(report, args, cold_runs))
+                    warm = summarize(run_warm(report, args, warm_runs, warmup))
+                    results.append({
+                        "index_set": set_name, "file": report["file"], "name": report["name"],
+                        "params": args, "cold": cold, "warm": warm,
+                    })
+                    p50 = warm["p50_ms"] if warm else cold["p50_ms"]
+                    print(f"  {report['file']:>7} {report['name']}({args}): p50 {p50} ms "
+                          f"[{time.perf_counter() - started:.1f}s]")
+    finally:
+        _drop_indexes(cur, all_indexes)
+        for indexdef in existing.values():
+            cur.execute(indexdef)
+        admin.close()
+    _mark_plan_changes(results, next(iter(sets), None))
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "database": db._params()["dbname"],
+        "cold_runs": cold_runs, "warm_runs": warm_runs, "warmup": warmup,
+        "index_sets": {name: [n for n, _ in stmts] for name, stmts in sets.items()},
+        "results": results,
+    }
+
+
+def _shapes(result):
+    return sorted({p["shape"] for part in ("cold", "warm") if result[part] for p in result[part]["plans"]})
+
+
+def _mark_plan_changes(results, baseline_set):
+    """plan_changed: the report's plan shapes differ from those under the first index set."""
+    base = {(r["file"], r["params"]): _shapes(r) for r in results if r["index_set"] == baseline_set}
+    for r in results:
+        ref = base.get((r["file"], r["params"]))
+        r["plan_changed"] = ref is not None and _shapes(r) != ref
+
+
+def compare(report, previous, threshold):
+    """Results whose warm (else cold) p50 is more than threshold times that of the previous report."""
+    def p50(r):
+        part = r["warm"] or r["cold"]
+        return part["p50_ms"] if part else None
+
+    old = {(r["index_set"], r["file"], r["params"]): r for r in previous.get("results", [])}
+    regressions = []
+    for r in report["results"]:
+        before = old.get((r["index_set"], r["file"], r["params"]))
+        if before is None or not p50(before) or p50(r) is None:
+            continue
+        ratio = p50(r) / p50(before)
+        if ratio > threshold:
+            regressions.append({
+                "index_set": r["index_set"], "file": r["file"], "params": r["params"],
+                "old_p50_ms": p50(before), "new_p50_ms": p50(r), "ratio": round(ratio, 2),
+                "plan_changed": _shapes(r) != _shapes(before),
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark queries/*.sql under index sets")
+    parser.add_argument("--sets", default="none,index-for",
+                        help="comma-separated: none, index-for, index-for-<N>, name=path.sql")
+    parser.add_argument("--queries", help="comma-separated file numbers, e.g. 1,4 (default: all)")
+    parser.add_argument("--params", help="JSON file {report name or number: [[arg, ...], ...]}")
+    parser.add_argument("--cold", type=int, default=BENCH_COLD_RUNS)
+    parser.add_argument("--warm", type=int, default=BENCH_WARM_RUNS)
+    parser.add_argument("--warmup", type=int, default=BENCH_WARMUP)
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--compare", help="previous report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="regression if p50 grows by more than this factor")
+    args = parser.parse_args()
+
+    reports = load_reports(set(args.queries.split(",")) if args.queries else None)
+    sets = index_sets([s.strip() for s in args.sets.split(",") if s.strip()])
+    report = run(reports, sets, load_params(args.params), args.cold, args.warm, args.warmup)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+        for r in report["regressions"]:
+            print(f"Regression: {r['file']} ({r['params']}) under {r['index_set']}: "
+                  f"{r['old_p50_ms']} -> {r['new_p50_ms']} ms (x{r['ratio']})")
+        status = 1 if report["regressions"] else 0
+
+    changed = [r for r in report["results"] if r["plan_changed"]]
+    for r in changed:
+        print(f"Plan changed: {r['file']} {r['name']}({r['params']}) under {r['index_set']}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
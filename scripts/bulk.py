@@ -0,0 +1,270 @@
+"""
+Bulk-write helpers for the BiDibiKala load scripts.
+
+Rows are streamed with COPY ... FROM STDIN into a temporary staging table and
+merged into the target with one set-based INSERT ... SELECT ... ON CONFLICT
+per batch, so a load costs a handful of round trips per table instead of one
+per row. Conflict handling mirrors the per-row statements the scripts used
+before: with DO NOTHING the first occurrence of a key wins, with DO UPDATE
+the last one does. copy_rows is a plain COPY for rows that cannot conflict.
+
+Time-partitioned tables (PartitionScheme, init/01-schema.sql) get the partitions
+a batch needs before it is written. Their keys include the partition key, so a
+conflict on other columns (OrderID) is resolved with UPDATE ... FROM and
+INSERT ... WHERE NOT EXISTS instead of ON CONFLICT. That only sees committed
+rows, so when two loaders insert the same new OrderID at once the second one
+fails on OrderKey (init/01-schema.sql) instead of adding a duplicate order.
+
+Rows may be any iterable of tuples or a pandas DataFrame; a DataFrame is
+encoded column-wise without touching individual rows in Python.
+"""
+import io
+import os
+from datetime import date, datetime
+
+DEFAULT_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "10000"))
+
+_ORD = "_ord"
+
+
+def _copy_value(v):
+    """Encode one value for COPY text format."""
+    if v is None:
+        return "\\N"
+    if v is True:
+        return "t"
+    if v is False:
+        return "f"
+    if isinstance(v, (datetime, date)):
+        return v.isoformat(sep=" ") if isinstance(v, datetime) else v.isoformat()
+    s = str(v)
+    if "\\" in s or "\t" in s or "\n" in s or "\r" in s:
+        s = s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return s
+
+
+def _frame_column_text(col):
+    """Encode one DataFrame column for COPY text format."""
+    kind = col.dtype.kind
+    if kind == "M":
+        text = col.dt.strftime("%Y-%m-%d %H:%M:%S")
+    elif kind == "b":
+        text = col.map({True: "t", False: "f"})
+    else:
+        text = col.astype(str)
+        if kind == "O":
+            text = (text.str.replace("\\", "\\\\", regex=False).str.replace("\t", "\\t", regex=False)
+                    .str.replace("\n", "\\n", regex=False).str.replace("\r", "\\r", regex=False))
+    return text.where(col.notna(), "\\N")
+
+
+def _batches(rows, batch_size):
+    if hasattr(rows, "iloc"):
+        for start in range(0, len(rows), batch_size):
+            yield rows.iloc[start:start + batch_size]
+        return
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _create_staging(cur, table, columns):
+    staging = f"_stg_{table.lower()}"
+    cols = ", ".join(columns)
+    cur.execute(f"DROP TABLE IF EXISTS {staging}")
+    cur.execute(f"CREATE TEMP TABLE {staging} AS SELECT {cols} FROM {table} WITH NO DATA")
+    cur.execute(f"ALTER TABLE {staging} ADD COLUMN {_ORD} BIGINT")
+    return staging
+
+
+def _copy_text(batch, columns, offset=None):
+    """COPY text for a batch; with offset, each line ends with its row number for the staging _ord column."""
+    buf = io.StringIO()
+    if hasattr(batch, "iloc"):
+        lines = None
+        for c in columns:
+            text = _frame_column_text(batch[c])
+            lines = text if lines is None else lines + "\t" + text
+        if offset is not None:
+            lines = lines + "\t" + [str(offset + i) for i in range(len(batch))]
+        buf.write("\n".join(lines.tolist()))
+        buf.write("\n")
+    else:
+        for i, row in enumerate(batch):
+            buf.write("\t".join([_copy_value(v) for v in row]))
+            buf.write(f"\t{offset + i}\n" if offset is not None else "\n")
+    buf.seek(0)
+    return buf
+
+
+def _copy_batch(cur, staging, columns, batch, offset):
+    cur.copy_expert(f"COPY {staging} ({', '.join(columns)}, {_ORD}) FROM STDIN", _copy_text(batch, columns, offset))
+
+
+def partition_key(cur, table):
+    """Partition key column of table (lower case) if it is time-partitioned, else None."""
+    cur.execute("SELECT to_regclass('partitionscheme') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute("SELECT KeyColumn FROM PartitionScheme WHERE ParentTable = lower(%s)", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def ensure_partitions(cur, lo, hi, table=None):
+    """Create the partitions covering [lo, hi] of table, or of every time-partitioned table (no-op if none)."""
+    cur.execute("SELECT to_regclass('partitionscheme') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("SELECT ensure_time_partitions(%s, %s, lower(%s))", (lo, hi, table))
+
+
+def _staged_partitions(cur, table, columns):
+    """Partition key of table when it is partitioned and among columns, else None."""
+    key = partition_key(cur, table)
+    return key if key in [c.lower() for c in columns] else None
+
+
+def _ensure_staged_partitions(cur, table, staging, key):
+    cur.execute(f"SELECT MIN({key}), MAX({key}) FROM {staging}")
+    lo, hi = cur.fetchone()
+    ensure_partitions(cur, lo, hi, table)
+
+
+def copy_rows(conn, table, columns, rows, batch_size=None):
+    """COPY rows straight into table (no conflict handling), batch_size rows per COPY. Returns the row count.
+
+    A time-partitioned table is written through a staging table, so the
+    partitions of each batch exist before it is inserted.
+    """
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    cols = ", ".join(columns)
+    cur = conn.cursor()
+    key = _staged_partitions(cur, table, columns)
+    staging = _create_staging(cur, table, columns) if key else None
+    n = 0
+    offset = 0
+    for batch in _batches(rows, batch_size):
+        if staging:
+            _copy_batch(cur, staging, columns, batch, offset)
+            offset += len(batch)
+            _ensure_staged_partitions(cur, table, staging, key)
+            cur.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} ORDER BY {_ORD}")
+            cur.execute(f"TRUNCATE {staging}")
+        else:
+            cur.copy_expert(f"COPY {table} ({cols}) FROM STDIN", _copy_text(batch, columns))
+        n += len(batch)
+    if staging:
+        cur.execute(f"DROP TABLE {staging}")
+    cur.close()
+    return n
+
+
+def insert_select(conn, table, columns, select_sql):
+    """INSERT INTO table (columns) select_sql. Returns the row count.
+
+    For a time-partitioned table the rows are staged first, so the partitions
+    they need can be created before they are inserted.
+    """
+    cols = ", ".join(columns)
+    cur = conn.cursor()
+    key = _staged_partitions(cur, table, columns)
+    if key:
+        staging = _create_staging(cur, table, columns)
+        cur.execute(f"INSERT INTO {staging} ({cols}) {select_sql}")
+        _ensure_staged_partitions(cur, table, staging, key)
+        cur.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging}")
+        n = cur.rowcount
+        cur.execute(f"DROP TABLE {staging}")
+    else:
+        cur.execute(f"INSERT INTO {table} ({cols}) {select_sql}")
+        n = cur.rowcount
+    cur.close()
+    return n
+
+
+def copy_upsert(conn, table, columns, rows, conflict=None, update=None, batch_size=None):
+    """Insert rows into table through a COPY-fed staging table.
+
+    conflict: conflict-target columns; None means ON CONFLICT DO NOTHING on any unique key.
+    update: columns to overwrite from EXCLUDED (ON CONFLICT ... DO UPDATE); None means DO NOTHING.
+    Returns the number of rows written to the target.
+    """
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    cols = ", ".join(columns)
+    cur = conn.cursor()
+    key = partition_key(cur, table)
+    # a partitioned table has no unique index on keys without the partition key
+    merge = bool(key and conflict and key not in [c.lower() for c in conflict])
+    if conflict:
+        keys = ", ".join(conflict)
+        # Collapse duplicate keys inside the batch the way per-row statements would have
+        order = f"{_ORD} DESC" if update else _ORD
+        source = f"SELECT DISTINCT ON ({keys}) {cols} FROM {{staging}} ORDER BY {keys}, {order}"
+        action = f"ON CONFLICT ({keys}) DO NOTHING"
+        if update:
+            action = f"ON CONFLICT ({keys}) DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in update)
+        if merge:
+            match = " AND ".join(f"t.{k} = s.{k}" for k in conflict)
+            action = f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {match})"
+    else:
+        if update:
+            raise ValueError("update requires conflict columns")
+        source = f"SELECT {cols} FROM {{staging}} ORDER BY {_ORD}"
+        action = "ON CONFLICT DO NOTHING"
+
+    staging = _create_staging(cur, table, columns)
+    written = 0
+    offset = 0
+    for batch in _batches(rows, batch_size):
+        _copy_batch(cur, staging, columns, batch, offset)
+        offset += len(batch)
+        if key in [c.lower() for c in columns]:
+            _ensure_staged_partitions(cur, table, staging, key)
+        if merge and update:
+            cur.execute(
+                f"UPDATE {table} t SET " + ", ".join(f"{c} = s.{c}" for c in update)
+                + f" FROM ({source.format(staging=staging)}) s WHERE {match}"
+            )
+            written += cur.rowcount
+        cur.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM ({source.format(staging=staging)}) s {action}")
+        written += cur.rowcount
+        cur.execute(f"TRUNCATE {staging}")
+    cur.execute(f"DROP TABLE {staging}")
+    cur.close()
+    return written
+
+
+def copy_update(conn, table, key, columns, rows, batch_size=None):
+    """UPDATE table SET columns FROM a COPY-fed staging table joined on key columns.
+
+    Each row is key values followed by column values. Last occurrence of a key wins.
+    Returns the number of target rows updated.
+    """
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    all_cols = list(key) + list(columns)
+    keys = ", ".join(key)
+    sets = ", ".join(f"{c} = s.{c}" for c in columns)
+    match = " AND ".join(f"t.{k} = s.{k}" for k in key)
+
+    cur = conn.cursor()
+    staging = _create_staging(cur, table, all_cols)
+    updated = 0
+    offset = 0
+    for batch in _batches(rows, batch_size):
+        _copy_batch(cur, staging, all_cols, batch, offset)
+        offset += len(batch)
+        cur.execute(
+            f"""UPDATE {table} t SET {sets}
+                FROM (SELECT DISTINCT ON ({keys}) * FROM {staging} ORDER BY {keys}, {_ORD} DESC) s
+                WHERE {match}"""
+        )
+        updated += cur.rowcount
+        cur.execute(f"TRUNCATE {staging}")
+    cur.execute(f"DROP TABLE {staging}")
+    cur.close()
+    return updated
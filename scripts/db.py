@@ -0,0 +1,159 @@
+"""
+Shared database access for the BiDibiKala scripts.
+
+- connect(): a new connection from the PG* settings in .env
+- connection(): a connection borrowed from a thread-safe pool of DB_POOL_MAX
+  connections; commits on success, rolls back on error and returns it to the
+  pool. Callers block while all connections are in use.
+- execute(cur, sql, params): runs sql as a server-side prepared statement.
+  Each connection prepares a given SQL text once and then only sends EXECUTE,
+  so statements run in a loop are parsed and planned once. At most
+  DB_PREPARED_MAX statements are kept per connection (least recently used are
+  deallocated).
+- execute_values / copy_rows / copy_upsert: batched multi-row INSERT and COPY
+  (the COPY helpers live in bulk.py, with insert_select and ensure_partitions
+  for time-partitioned tables).
+- LOAD_BULK=1 opens every connection in bulk-load mode (bdbkala.bulk_load):
+  the validating row triggers of init/03-constraints-triggers.sql are skipped
+  and their rules are checked once per statement instead. analyze_loaded()
+  then refreshes the planner statistics of the tables a load wrote.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+from bulk import DEFAULT_BATCH_SIZE, copy_rows, copy_update, copy_upsert, ensure_partitions, insert_select  # noqa: F401 (re-exported)
+
+load_dotenv()
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_PREPARED_MAX = int(os.getenv("DB_PREPARED_MAX", "256"))
+LOAD_BULK = os.getenv("LOAD_BULK", "0").lower() in ("1", "true", "yes")
+
+_PLACEHOLDER = re.compile(r"%(%|s)")
+
+
+class Connection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers the statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()  # SQL text -> (statement name, parameter count)
+        self._prepared_seq = 0
+
+
+def _params():
+    return dict(
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+        dbname=os.getenv("PGDATABASE", "bdbkala"),
+        user=os.getenv("PGUSER", "admin"),
+        password=os.getenv("PGPASSWORD", "admin"),
+        options="-c bdbkala.bulk_load=on" if LOAD_BULK else "",
+    )
+
+
+def connect():
+    """Open a new (unpooled) connection, e.g. one per pipeline worker."""
+    return psycopg2.connect(connection_factory=Connection, **_params())
+
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """This process's connection pool (a forked child builds its own)."""
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, connection_factory=Connection, **_params())
+            _pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for one unit of work."""
+    pool = get_pool()
+    slots = _pool_slots
+    slots.acquire()  # ThreadedConnectionPool raises instead of waiting when exhausted
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+        slots.release()
+
+
+def analyze_loaded(conn, tables):
+    """In bulk-load mode, ANALYZE the given tables after a load (autovacuum may not have caught up)."""
+    if not LOAD_BULK or not tables:
+        return
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE " + ", ".join(tables))
+    conn.commit()
+    print(f"Analyzed {', '.join(tables)}")
+
+
+def _prepare(cur, sql):
+    conn = cur.connection
+    cache = getattr(conn, "prepared", None)
+    if cache is None:
+        raise TypeError("prepared statements need a db.Connection (use db.connect or db.connection)")
+    entry = cache.get(sql)
+    if entry is not None:
+        cache.move_to_end(sql)
+        return entry
+
+    count = 0
+
+    def number(m):
+        nonlocal count
+        if m.group(1) == "%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    conn._prepared_seq += 1
+    name = f"_ps{conn._prepared_seq}"
+    # PREPARE survives a rollback of the surrounding transaction, so the cache stays valid
+    cur.execute(f"PREPARE {name} AS {_PLACEHOLDER.sub(number, sql)}")
+    cache[sql] = entry = (name, count)
+    while len(cache) > DB_PREPARED_MAX:
+        _, (old, _) = cache.popitem(last=False)
+        cur.execute(f"DEALLOCATE {old}")
+    return entry
+
+
+def execute(cur, sql, params=()):
+    """Execute sql (with %s placeholders) through this connection's prepared-statement cache."""
+    name, count = _prepare(cur, sql)
+    if len(params) != count:
+        raise ValueError(f"statement takes {count} parameters, got {len(params)}")
+    if count:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * count)})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+def execute_values(cur, sql, rows, template=None, page_size=DEFAULT_BATCH_SIZE, fetch=False):
+    """Multi-row INSERT: sql holds one VALUES %s, filled with page_size rows per statement."""
+    return psycopg2.extras.execute_values(cur, sql, rows, template=template, page_size=page_size, fetch=fetch)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Export a view, table or report of queries/*.sql to CSV or Parquet in bounded memory.
+
+Rows are read through a named (server-side) cursor, EXPORT_FETCH_SIZE rows per
+round trip, and written batch by batch, so the client never holds more than
+one batch. A CSV export without a row transform goes through COPY (...) TO
+STDOUT instead, which the server streams straight into the file.
+
+Reports are given by PREPARE name or file number; their query is run with the
+parameters given (default: the arguments of the report's EXECUTE). Parquet
+needs pyarrow (pip install pyarrow); numeric columns without a declared
+precision are written as strings to keep their exact value.
+
+    python scripts/export.py v_marketing_customer_loyalty loyalty.csv
+    python scripts/export.py customer_value value.parquet NULL 1000
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import uuid
+
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+import db
+from sql_files import strip_comments
+from reports import report_index
+
+load_dotenv()
+
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "10000"))
+
+_PREPARE = re.compile(r"^\s*PREPARE\s+\w+\s*(?:\(([^)]*)\))?\s*AS\s+(.*?)\s*$", re.I | re.S)
+_PARAM = re.compile(r"\$(\d+)")
+
+
+def report_query(cur, report, params=None):
+    """The SELECT of a report with its $n parameters filled in (declared types are kept as casts)."""
+    m = _PREPARE.match(strip_comments(report["prepare"]))
+    types = [t.strip() for t in m.group(1).split(",")] if m.group(1) else []
+    if params is None:
+        params = ()
+        if report["args"]:
+            cur.execute(f"SELECT {report['args']}")
+            params = cur.fetchone()
+
+    def value(p):
+        n = int(p.group(1))
+        if n > len(params):
+            raise ValueError(f"report {report['name']} needs parameter ${n}, got {len(params)}")
+        literal = cur.mogrify("%s", (params[n - 1],)).decode()
+        return f"CAST({literal} AS {types[n - 1]})" if n <= len(types) else literal
+
+    return _PARAM.sub(value, m.group(2))
+
+
+def source_query(cur, source, params=None):
+    """SELECT text for a report (PREPARE name or file number) or a table / view name."""
+    report = report_index().get(str(source).lower())
+    if report is not None:
+        return report_query(cur, report, params)
+    if params:
+        raise ValueError(f"{source} is not a report and takes no parameters")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (source,))
+    if not cur.fetchone()[0]:
+        raise ValueError(f"unknown report, table or view {source!r}")
+    return sql.SQL("SELECT * FROM {}").format(sql.Identifier(source.lower())).as_string(cur)
+
+
+def _batches(cur, fetch_size):
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _csv_value(v):
+    return json.dumps(v) if isinstance(v, (dict, list)) else v
+
+
+def _write_csv(cur, path, fetch_size, transform):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header = False
+        for rows in _batches(cur, fetch_size):
+            if not header:  # a named cursor has no description before its first fetch
+                writer.writerow([d[0] for d in cur.description])
+                header = True
+            if transform:
+                rows = [transform(r) for r in rows]
+            writer.writerows([_csv_value(v) for v in r] for r in rows)
+            count += len(rows)
+        if not header:
+            writer.writerow([d[0] for d in cur.description])
+    return count
+
+
+# PostgreSQL type OID -> pyarrow type name (others are written as strings)
+_ARROW_TYPES = {16: "bool_", 20: "int64", 21: "int16", 23: "int32", 700: "float32", 701: "float64",
+                1082: "date32", 1114: "timestamp", 1184: "timestamptz"}
+
+
+def _arrow_schema(pa, description):
+    fields = []
+    for d in description:
+        name = _ARROW_TYPES.get(d.type_code)
+        if name == "timestamp":
+            t = pa.timestamp("us")
+        elif name == "timestamptz":
+            t = pa.timestamp("us", tz="UTC")
+        elif name:
+            t = getattr(pa, name)()
+        elif d.type_code == 1700 and d.precision and d.precision <= 38:  # numeric(p, s)
+            t = pa.decimal128(d.precision, d.scale or 0)
+        else:
+            t = pa.string()
+        fields.append(pa.field(d[0], t))
+    return pa.schema(fields)
+
+
+def _write_parquet(cur, path, fetch_size, transform):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    count, writer, schema = 0, None, None
+    try:
+        for rows in _batches(cur, fetch_size):
+            if writer is None:
+                schema = _arrow_schema(pa, cur.description)
+                writer = pq.ParquetWriter(path, schema)
+            if transform:
+                rows = [transform(r) for r in rows]
+            columns = []
+            for i, field in enumerate(schema):
+                values = [r[i] for r in rows]
+                if pa.types.is_string(field.type):
+                    values = [None if v is None else json.dumps(v) if isinstance(v, (dict, list)) else str(v) for v in values]
+                columns.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))  # one row group per batch
+            count += len(rows)
+        if writer is None:
+            pq.write_table(_arrow_schema(pa, cur.description).empty_table(), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export(conn, source, path, fmt=None, params=None, fetch_size=None, transform=None, copy=True):
+    """Write a report, view or table to path (csv or parquet, default from the extension). Returns the row count.
+
+    transform(row) -> row is applied to every row on the client. Without one, a CSV export
+    uses COPY TO unless copy is False.
+    """
+    fetch_size = fetch_size or EXPORT_FETCH_SIZE
+    fmt = (fmt or os.path.splitext(str(path))[1].lstrip(".") or "csv").lower()
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"unsupported format {fmt!r} (csv or parquet)")
+    with conn.cursor() as cur:
+        query = source_query(cur, source, params)
+    if fmt == "csv" and copy and transform is None:
+        with conn.cursor() as cur, open(path, "w", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            count = cur.rowcount
+    else:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = fetch_size
+            cur.execute(query)
+            count = (_write_csv if fmt == "csv" else _write_parquet)(cur, path, fetch_size, transform)
+    conn.commit()
+    return count
+
+
+def _arg(text):
+    return None if text.upper() == "NULL" else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a view, table or report to CSV or Parquet")
+    parser.add_argument("source", help="view or table name, or report (PREPARE name or file number)")
+    parser.add_argument("path", help="output file (.csv or .parquet)")
+    parser.add_argument("params", nargs="*", help="report parameters (NULL for null; default: those of its EXECUTE)")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="default: from the file extension")
+    parser.add_argument("--fetch-size", type=int, default=EXPORT_FETCH_SIZE, help="rows per server-side cursor fetch")
+    parser.add_argument("--no-copy", action="store_true", help="read CSV through the cursor instead of COPY TO")
+    args = parser.parse_args()
+
+    params = tuple(_arg(p) for p in args.params) or None
+    with db.connection() as conn:
+        count = export(conn, args.source, args.path, args.format, params, args.fetch_size, copy=not args.no_copy)
+    print(f"Exported {count} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,39 +3,33 @@
 Generate missing data for BiDibiKala using Faker.
 Creates: Warehouses, WarehouseInventory, additional orders (reusing customers/products),
 ReturnRequest, RepaymentHistory for BNPL orders.
+Large load-test datasets are generated by scale_data.py instead.
 """
-import os
 import random
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-import psycopg2
 from faker import Faker
 from dotenv import load_dotenv
 
+import db
+from key_registry import KeyRegistry
+
 load_dotenv()
 fake = Faker()
 
-def get_conn():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "bdbkala"),
-        user=os.getenv("PGUSER", "admin"),
-        password=os.getenv("PGPASSWORD", "admin"),
-    )
-
 
-def create_warehouses(conn):
+def create_warehouses(conn, registry=None):
     """Create one warehouse per branch."""
+    registry = registry or KeyRegistry.open(conn)
     cur = conn.cursor()
-    cur.execute("SELECT BranchID, Name, Address FROM Branch")
-    branches = cur.fetchall()
+    branches = [(bid, bname, baddr) for (bname, baddr), bid in registry.branches.items()]
     cur.execute("SELECT COALESCE(MAX(WarehouseID), 0) FROM Warehouse")
     next_id = cur.fetchone()[0] + 1
 
     for bid, bname, baddr in branches:
-        cur.execute(
+        db.execute(
+            cur,
             "INSERT INTO Warehouse (WarehouseID, Name, Address, BranchID) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
             (next_id, f"Warehouse {bname}", (baddr or "") + " - Warehouse", bid),
         )
@@ -55,7 +49,9 @@ def create_warehouse_inventory(conn):
         wid = branch_warehouse.get(bid)
         if wid:
             qty = random.randint(10, 500)
-            cur.execute(
+            # one row per statement: an offer's (branch, product) may repeat, and each adds to Quantity
+            db.execute(
+                cur,
                 """INSERT INTO WarehouseInventory (WarehouseID, ProductID, Quantity)
                    VALUES (%s, %s, %s) ON CONFLICT (WarehouseID, ProductID) DO UPDATE SET Quantity = WarehouseInventory.Quantity + EXCLUDED.Quantity""",
                 (wid, pid, qty),
@@ -78,19 +74,21 @@ def _cannot_have_highest_priority(nature, income_level):
         return False
 
 
-def create_additional_orders(conn, count=500):
+def create_additional_orders(conn, count=500, registry=None):
     """Create additional orders reusing existing customers, products, branches. Vary payment method and status."""
+    registry = registry or KeyRegistry.open(conn)
     cur = conn.cursor()
     cur.execute("SELECT CustomerID, Nature, IncomeLevel FROM Customer")
     customers = list(cur.fetchall())  # (cid, nature, income_level)
-    cur.execute("SELECT BranchID FROM Branch")
-    branches = [r[0] for r in cur.fetchall()]
-    cur.execute("SELECT ProductID, Name FROM Product")
-    products = list(cur.fetchall())
+    branches = registry.branch_ids()
+    products = [(pid, pname) for (pname, _, _), pid in registry.products.items()]
     cur.execute("SELECT COALESCE(MAX(OrderID), 0) FROM Order_Header")
     next_oid = cur.fetchone()[0] + 1
     cur.execute("SELECT COALESCE(MAX(ShipmentID), 0) FROM Shipment")
     next_sid = cur.fetchone()[0] + 1
+    cur.execute("SELECT LOCALTIMESTAMP")
+    now = cur.fetchone()[0]
+    db.ensure_partitions(cur, now, now)  # the orders below are dated now
 
     payments = ["credit card", "debit card", "cash", "wallet", "BNPL"]
     priorities = ["lowest", "low", "medium", "high", "highest"]
@@ -120,22 +118,25 @@ def create_additional_orders(conn, count=500):
             items_to_insert.append((oid, pid, qty, item_total, status))
         ship_cost = Decimal(str(round(random.uniform(5, 30), 2)))
         total += ship_cost
-        cur.execute(
+        db.execute(
+            cur,
             """INSERT INTO Order_Header (OrderID, OrderDate, Priority, TotalAmount, PaymentMethod, LoyaltyDiscount, CustomerID, BranchID)
-               VALUES (%s, CURRENT_TIMESTAMP, %s, %s, %s, 0, %s, %s) ON CONFLICT (OrderID) DO NOTHING""",
+               VALUES (%s, CURRENT_TIMESTAMP, %s, %s, %s, 0, %s, %s) ON CONFLICT DO NOTHING""",
             (oid, priority, total, payment, cid, bid),
         )
-        cur.execute("SELECT OrderDate FROM Order_Header WHERE OrderID = %s", (oid,))
+        db.execute(cur, "SELECT OrderDate FROM Order_Header WHERE OrderID = %s", (oid,))
         order_date = cur.fetchone()[0]
         for oid_i, pid, qty, item_total, status in items_to_insert:
-            cur.execute(
-                "INSERT INTO OrderItem (OrderID, ProductID, Quantity, CalculatedItemPrice, ItemStatus) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (OrderID, ProductID) DO NOTHING",
-                (oid_i, pid, qty, item_total, status),
+            db.execute(
+                cur,
+                "INSERT INTO OrderItem (OrderID, ProductID, Quantity, CalculatedItemPrice, ItemStatus, OrderDate) VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING",
+                (oid_i, pid, qty, item_total, status, order_date),
             )
         ship_date = order_date + timedelta(days=random.randint(1, 7))
         # Box cannot use ground (constraint); use airmail or air freight
         transport = random.choice(["airmail", "air freight"])
-        cur.execute(
+        db.execute(
+            cur,
             """INSERT INTO Shipment (ShipmentID, TrackingCode, ShipDate, RecipientAddress, City, ZipCode, Type, TransportMethod, Cost, PackType, PackSize, OrderID)
                VALUES (%s, %s, %s, %s, %s, %s, 'standard', %s, %s, 'box', 'medium', %s) ON CONFLICT (OrderID) DO NOTHING""",
             (oid, f"TRK{oid:08d}", ship_date, fake.address(), fake.city(), fake.zipcode(), transport, ship_cost, oid),
@@ -152,6 +153,7 @@ def create_repayment_history(conn):
     cur = conn.cursor()
     cur.execute("SELECT OrderID, TotalAmount, OrderDate FROM Order_Header WHERE PaymentMethod = 'BNPL'")
     bnpl_orders = cur.fetchall()
+    rows = []
     for oid, total, order_date in bnpl_orders:
         if total <= 0:
             continue
@@ -161,10 +163,10 @@ def create_repayment_history(conn):
         base = order_date if isinstance(order_date, datetime) else datetime.combine(order_date, datetime.min.time())
         for i in range(num_payments):
             pay_date = base + timedelta(days=30 * (i + 1))
-            cur.execute(
-                "INSERT INTO RepaymentHistory (OrderID, PaymentDate, Amount, PaymentMethod) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                (oid, pay_date, amt_per, random.choice(methods)),
-            )
+            rows.append((oid, pay_date, amt_per, random.choice(methods)))
+    db.execute_values(
+        cur, "INSERT INTO RepaymentHistory (OrderID, PaymentDate, Amount, PaymentMethod) VALUES %s ON CONFLICT DO NOTHING", rows
+    )
     conn.commit()
     cur.close()
     print(f"Created RepaymentHistory for {len(bnpl_orders)} BNPL orders")
@@ -182,29 +184,32 @@ def create_return_requests(conn, count=50):
     cur.execute("SELECT COALESCE(MAX(ReturnID), 0) FROM ReturnRequest")
     next_rid = cur.fetchone()[0] + 1
     reasons = ["Defective product", "Wrong size", "Changed mind", "Received damaged"]
+    rows = []
     for oid, pid in chosen:
-        cur.execute(
-            """INSERT INTO ReturnRequest (ReturnID, RequestDate, Reason, ReviewResult, DecisionDate, OrderID, ProductID)
-               VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING""",
-            (next_rid, fake.date_time_between(start_date="-1y"), random.choice(reasons), random.choice(["Approved", "Rejected"]), fake.date_time_between(start_date="-6m"), oid, pid),
-        )
+        rows.append((next_rid, fake.date_time_between(start_date="-1y"), random.choice(reasons), random.choice(["Approved", "Rejected"]), fake.date_time_between(start_date="-6m"), oid, pid))
         next_rid += 1
+    db.execute_values(
+        cur,
+        """INSERT INTO ReturnRequest (ReturnID, RequestDate, Reason, ReviewResult, DecisionDate, OrderID, ProductID)
+           VALUES %s ON CONFLICT DO NOTHING""",
+        rows,
+    )
     conn.commit()
     cur.close()
     print(f"Created {len(chosen)} return requests")
 
 
 def main():
-    conn = get_conn()
-    try:
-        create_warehouses(conn)
+    with db.connection() as conn:
+        registry = KeyRegistry.open(conn)
+        create_warehouses(conn, registry)
         create_warehouse_inventory(conn)
-        create_additional_orders(conn, count=300)
+        create_additional_orders(conn, count=300, registry=registry)
         create_repayment_history(conn)
         create_return_requests(conn, count=50)
+        db.analyze_loaded(conn, ("Warehouse", "WarehouseInventory", "Order_Header", "OrderItem", "Shipment",
+                                 "RepaymentHistory", "ReturnRequest"))
         print("\nExtra data generation complete.")
-    finally:
-        conn.close()
 
 
 if __name__ == "__main__":
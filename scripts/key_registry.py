@@ -0,0 +1,149 @@
+"""
+Natural-key registry for BiDibiKala.
+
+Maps the natural keys used in the dataset files to surrogate IDs:
+- products: (name, category, subcategory) -> ProductID, plus a name -> ProductID index
+- customers: email -> CustomerID
+- branches: (name, address) -> BranchID
+- suppliers: name -> SupplierID
+
+load_dataset.py fills the registry while it assigns IDs and saves it to a
+gzipped JSON sidecar (KEY_REGISTRY_PATH, default .cache/key_registry.json.gz).
+Later scripts call KeyRegistry.open(conn), which uses the sidecar when its
+row counts and maximum IDs still match the database and otherwise rebuilds
+it from the tables.
+"""
+import gzip
+import json
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+REGISTRY_PATH = Path(os.getenv("KEY_REGISTRY_PATH", PROJECT_ROOT / ".cache" / "key_registry.json.gz"))
+
+_FORMAT_VERSION = 1
+
+# (table, ID column) whose row count and maximum ID identify the registry contents
+_TABLES = (("Product", "ProductID"), ("Customer", "CustomerID"), ("Branch", "BranchID"), ("Supplier", "SupplierID"))
+
+
+class KeyRegistry:
+    """Hash indexes from natural keys to IDs for Product, Customer, Branch and Supplier."""
+
+    def __init__(self):
+        self.products = {}  # (name, category, subcategory) -> ProductID
+        self.customers = {}  # email -> CustomerID
+        self.branches = {}  # (name, address) -> BranchID
+        self.suppliers = {}  # name -> SupplierID
+        self._product_names = {}  # name -> first ProductID registered with that name
+        self._names_indexed = 0
+
+    def product_by_name(self, name):
+        """ProductID of the first product registered under name, or None."""
+        # products only grows and keeps insertion order, so index just the new entries
+        if self._names_indexed < len(self.products):
+            for (pname, _, _), pid in list(self.products.items())[self._names_indexed:]:
+                self._product_names.setdefault(pname, pid)
+            self._names_indexed = len(self.products)
+        return self._product_names.get(name)
+
+    def product_id(self, name, category="", subcategory=""):
+        """ProductID for the full key, falling back to the name alone."""
+        return self.products.get((name, category, subcategory)) or self.product_by_name(name)
+
+    def branch_ids(self):
+        return list(self.branches.values())
+
+    @staticmethod
+    def next_id(mapping):
+        """One past the largest ID in one of the registry maps."""
+        return max(mapping.values(), default=0) + 1
+
+    # ---- persistence ----
+
+    def save(self, conn, path=None):
+        """Write the registry to the sidecar file, stamped with the current database fingerprint."""
+        self._write(path, _fingerprint(conn))
+
+    def _write(self, path, fingerprint):
+        path = Path(path or REGISTRY_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": _FORMAT_VERSION,
+            "fingerprint": fingerprint,
+            "products": [[pid, *key] for key, pid in self.products.items()],
+            "customers": [[cid, email] for email, cid in self.customers.items()],
+            "branches": [[bid, *key] for key, bid in self.branches.items()],
+            "suppliers": [[sid, name] for name, sid in self.suppliers.items()],
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # concurrent pipeline stages may save at once
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path=None):
+        """Read a sidecar file. Returns (registry, fingerprint), or (None, None) if missing or unreadable."""
+        path = Path(path or REGISTRY_PATH)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if data.get("version") != _FORMAT_VERSION:
+            return None, None
+        reg = cls()
+        reg.products = {(name, cat, sub): pid for pid, name, cat, sub in data["products"]}
+        reg.customers = {email: cid for cid, email in data["customers"]}
+        reg.branches = {(name, addr): bid for bid, name, addr in data["branches"]}
+        reg.suppliers = {name: sid for sid, name in data["suppliers"]}
+        return reg, data["fingerprint"]
+
+    @classmethod
+    def from_db(cls, conn):
+        """Build the registry from the Product, Customer, Branch and Supplier tables."""
+        reg = cls()
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT ProductID, Name, COALESCE(Category, ''), COALESCE(SubCategory, '') FROM Product ORDER BY ProductID"
+        )
+        for pid, name, cat, sub in cur.fetchall():
+            reg.products.setdefault((name, cat, sub), pid)
+        cur.execute("SELECT CustomerID, Email FROM Customer WHERE Email IS NOT NULL ORDER BY CustomerID")
+        for cid, email in cur.fetchall():
+            reg.customers.setdefault(email, cid)
+        cur.execute("SELECT BranchID, Name, COALESCE(Address, '') FROM Branch ORDER BY BranchID")
+        for bid, name, addr in cur.fetchall():
+            reg.branches.setdefault((name, addr), bid)
+        cur.execute("SELECT SupplierID, Name FROM Supplier ORDER BY SupplierID")
+        for sid, name in cur.fetchall():
+            reg.suppliers.setdefault(name, sid)
+        cur.close()
+        return reg
+
+    @classmethod
+    def open(cls, conn, path=None):
+        """Registry for the current database: the sidecar if it is up to date, else rebuilt from the tables and saved."""
+        reg, saved = cls.load(path)
+        current = _fingerprint(conn)
+        if reg is not None and saved == current:
+            return reg
+        # Stamp with the fingerprint taken before reading, so rows committed meanwhile invalidate the file
+        reg = cls.from_db(conn)
+        reg._write(path, current)
+        return reg
+
+
+def _fingerprint(conn):
+    """[row count, max ID] per registry table."""
+    cur = conn.cursor()
+    cur.execute("SELECT " + ", ".join(
+        f"(SELECT COUNT(*) FROM {table}), (SELECT COALESCE(MAX({col}), 0) FROM {table})" for table, col in _TABLES
+    ))
+    row = list(cur.fetchone())
+    cur.close()
+    return row
@@ -6,19 +6,41 @@ Run after: docker-compose up -d postgres
 """
 import os
 import csv
+import json
+import math
 import random
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from decimal import Decimal
 
-import psycopg2
 from dotenv import load_dotenv
 
+import db
+import manifest
+from bulk import DEFAULT_BATCH_SIZE, copy_update, copy_upsert
+from key_registry import REGISTRY_PATH, KeyRegistry
+
 load_dotenv()
 
 # Paths
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DATASET_DIR = PROJECT_ROOT / "dataset"
+ATTRIBUTES_SQL_PATH = PROJECT_ROOT / "init" / "07-product-attributes.sql"
+
+# Streaming mode for BDBKala_full.csv: bounded memory, one commit per chunk
+LOAD_STREAMING = os.getenv("LOAD_STREAMING", "0").lower() in ("1", "true", "yes")
+LOAD_MEMORY_MB = float(os.getenv("LOAD_MEMORY_MB", "64"))
+LOAD_MAX_OPEN_BUCKETS = int(os.getenv("LOAD_MAX_OPEN_BUCKETS", "256"))
+# BDBKala_full.csv transform: "pandas" (columnar, bdbkala_transform.py) or "python" (row loop)
+LOAD_TRANSFORM = os.getenv("LOAD_TRANSFORM", "pandas").lower()
+# Incremental reload: only the chunks of each file that changed since the last load (see manifest.py)
+LOAD_INCREMENTAL = os.getenv("LOAD_INCREMENTAL", "0").lower() in ("1", "true", "yes")
+
+# Columns refreshed when an incremental reload sees a changed order (OrderDate and BranchID are kept)
+ORDER_UPDATE = ("Priority", "TotalAmount", "PaymentMethod", "CustomerID")
+ITEM_UPDATE = ("Quantity", "CalculatedItemPrice")
+SHIPMENT_UPDATE = ("ShipDate", "RecipientAddress", "City", "ZipCode", "Type", "TransportMethod", "Cost", "PackType", "PackSize")
 
 # Payment method mapping (BDBKala -> schema)
 PAYMENT_MAP = {
@@ -63,20 +85,13 @@ def parse_packaging(pack_str):
     return None, None
 
 
-def get_conn():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "bdbkala"),
-        user=os.getenv("PGUSER", "admin"),
-        password=os.getenv("PGPASSWORD", "admin"),
-    )
-
-
-def load_branch_product_suppliers(conn):
-    """Load Managers, Branches, Products, Suppliers, BranchSupplyOffer from branch_product_suppliers.csv"""
-    print("Loading branch_product_suppliers.csv...")
-    path = DATASET_DIR / "branch_product_suppliers.csv"
+def load_branch_product_suppliers(conn, registry, batch_size=DEFAULT_BATCH_SIZE, path=None, incremental=False):
+    """Load Managers, Branches, Products, Suppliers, BranchSupplyOffer from branch_product_suppliers.csv.
+    Branch, product and supplier IDs are recorded in registry; keys already in it keep their IDs.
+    path: read another file with the same columns (a manifest chunk). With incremental, existing
+    offers get the file's prices and lead time."""
+    path = Path(path) if path else DATASET_DIR / "branch_product_suppliers.csv"
+    print(f"Loading {path.name}...")
     if not path.exists():
         raise FileNotFoundError(f"Missing {path}")
 
@@ -84,6 +99,9 @@ def load_branch_product_suppliers(conn):
     products = {}  # (name, cat, subcat) -> ProductID
     suppliers = {}  # name -> (SupplierID, phone, address)
     offers = []  # (BranchID, ProductID, SupplierID, supply_price, lead_time)
+    next_bid = registry.next_id(registry.branches)
+    next_pid = registry.next_id(registry.products)
+    next_sid = registry.next_id(registry.suppliers)
 
     with open(path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -93,15 +111,27 @@ def load_branch_product_suppliers(conn):
             baddr = row["address"].strip()
             bkey = (bname, baddr)
             if bkey not in branches:
-                branches[bkey] = (len(branches) + 1, mname, row["phone"].strip())
+                bid = registry.branches.get(bkey)
+                if bid is None:
+                    bid = registry.branches[bkey] = next_bid
+                    next_bid += 1
+                branches[bkey] = (bid, mname, row["phone"].strip())
 
             pkey = (row["product_name"].strip(), row["category"].strip(), row["sub_category"].strip())
             if pkey not in products:
-                products[pkey] = len(products) + 1
+                pid = registry.products.get(pkey)
+                if pid is None:
+                    pid = registry.products[pkey] = next_pid
+                    next_pid += 1
+                products[pkey] = pid
 
             sname = row["supplier_name"].strip()
             if sname not in suppliers:
-                suppliers[sname] = (len(suppliers) + 1, row.get("supplier_phone", ""), row.get("supplier_address", ""))
+                sid = registry.suppliers.get(sname)
+                if sid is None:
+                    sid = registry.suppliers[sname] = next_sid
+                    next_sid += 1
+                suppliers[sname] = (sid, row.get("supplier_phone", ""), row.get("supplier_address", ""))
 
             bid = branches[bkey][0]
             pid = products[pkey]
@@ -110,75 +140,91 @@ def load_branch_product_suppliers(conn):
             lead_time = int(row["lead_time_days"])
             offers.append((bid, pid, sid, supply_price, lead_time))
 
-    cur = conn.cursor()
-
-    for (bname, baddr), (bid, mname, phone) in branches.items():
-        cur.execute("INSERT INTO Manager (ManagerID, Name) VALUES (%s, %s) ON CONFLICT (ManagerID) DO NOTHING", (bid, mname))
-        cur.execute(
-            "INSERT INTO Branch (BranchID, Name, Address, Phone, ManagerID) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (BranchID) DO NOTHING",
-            (bid, bname, baddr, phone or None, bid),
-        )
-
-    for (pname, cat, subcat), pid in products.items():
-        cur.execute(
-            "INSERT INTO Product (ProductID, Name, Category, SubCategory, TaxAmount) VALUES (%s, %s, %s, %s, 0.10) ON CONFLICT (ProductID) DO NOTHING",
-            (pid, pname, cat or None, subcat or None),
-        )
-
-    for sname, (sid, phone, addr) in suppliers.items():
-        cur.execute(
-            "INSERT INTO Supplier (SupplierID, Name, Phone, Address) VALUES (%s, %s, %s, %s) ON CONFLICT (SupplierID) DO NOTHING",
-            (sid, sname, phone or None, addr or None),
-        )
-
-    for bid, pid, sid, supply_price, lead_time in offers:
-        selling_price = round(supply_price * Decimal("1.3"), 2)
-        cur.execute(
-            """INSERT INTO BranchSupplyOffer (BranchID, ProductID, SupplierID, SellingPrice, SupplyPrice, LeadTime, Discount, IsAvailable)
-               VALUES (%s, %s, %s, %s, %s, %s, 0, TRUE) ON CONFLICT (BranchID, ProductID, SupplierID) DO NOTHING""",
-            (bid, pid, sid, selling_price, supply_price, lead_time),
-        )
+    copy_upsert(conn, "Manager", ("ManagerID", "Name"),
+                ((bid, mname) for bid, mname, _ in branches.values()),
+                conflict=("ManagerID",), batch_size=batch_size)
+    copy_upsert(conn, "Branch", ("BranchID", "Name", "Address", "Phone", "ManagerID"),
+                ((bid, bname, baddr, phone or None, bid) for (bname, baddr), (bid, _, phone) in branches.items()),
+                conflict=("BranchID",), batch_size=batch_size)
+    copy_upsert(conn, "Product", ("ProductID", "Name", "Category", "SubCategory", "TaxAmount"),
+                ((pid, pname, cat or None, subcat or None, Decimal("0.10")) for (pname, cat, subcat), pid in products.items()),
+                conflict=("ProductID",), batch_size=batch_size)
+    copy_upsert(conn, "Supplier", ("SupplierID", "Name", "Phone", "Address"),
+                ((sid, sname, phone or None, addr or None) for sname, (sid, phone, addr) in suppliers.items()),
+                conflict=("SupplierID",), batch_size=batch_size)
+    copy_upsert(conn, "BranchSupplyOffer",
+                ("BranchID", "ProductID", "SupplierID", "SellingPrice", "SupplyPrice", "LeadTime", "Discount", "IsAvailable"),
+                ((bid, pid, sid, round(supply_price * Decimal("1.3"), 2), supply_price, lead_time, 0, True)
+                 for bid, pid, sid, supply_price, lead_time in offers),
+                conflict=("BranchID", "ProductID", "SupplierID"),
+                update=("SellingPrice", "SupplyPrice", "LeadTime") if incremental else None, batch_size=batch_size)
 
     conn.commit()
-    cur.close()
     print(f"  Managers: {len(branches)}, Branches: {len(branches)}, Products: {len(products)}, Suppliers: {len(suppliers)}, Offers: {len(offers)}")
     return {"branches": branches, "products": products, "suppliers": suppliers, "branch_ids": [b[0] for b in branches.values()]}
 
 
-def load_products_properties(conn, products_by_name):
-    """Update Product.BaseInfo from products_properties.csv"""
-    print("Loading products_properties.csv...")
-    path = DATASET_DIR / "products_properties.csv"
-    if not path.exists():
-        return
-
+def ensure_attribute_facets(conn):
+    """Make the attribute columns JSONB and create ProductAttributeFacet (init/07-product-attributes.sql) if missing."""
     cur = conn.cursor()
-    count = 0
+    cur.execute("SELECT to_regclass('productattributefacet') IS NULL")
+    if cur.fetchone()[0]:
+        cur.execute(ATTRIBUTES_SQL_PATH.read_text())
+        conn.commit()
+    cur.close()
+
+
+def read_product_attributes(path):
+    """[(product name, attributes dict or None)] from products_properties.csv.
+
+    Raises ValueError naming the lines whose attributes are not a JSON object,
+    so a malformed file is rejected before anything is written.
+    """
+    rows, bad = [], []
     with open(path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            pname = row["product_name"].strip()
-            attrs = row.get("attributes", "")
-            # Find product ID by name (products dict has (name, cat, subcat) -> id)
-            for (name, cat, subcat), pid in products_by_name.items():
-                if name == pname:
-                    cur.execute("UPDATE Product SET BaseInfo = %s WHERE ProductID = %s", (attrs or None, pid))
-                    count += 1
-                    break
-    conn.commit()
-    cur.close()
-    print(f"  Updated {count} products with BaseInfo")
+            text = (row.get("attributes") or "").strip()
+            attrs = None
+            if text:
+                try:
+                    attrs = json.loads(text)
+                except ValueError as e:
+                    bad.append(f"line {reader.line_num}: {e}")
+                    continue
+                if not isinstance(attrs, dict):
+                    bad.append(f"line {reader.line_num}: expected a JSON object, got {type(attrs).__name__}")
+                    continue
+            rows.append((row["product_name"].strip(), attrs))
+    if bad:
+        raise ValueError(f"{Path(path).name}: {len(bad)} rows with malformed attributes JSON\n  " + "\n  ".join(bad[:10]))
+    return rows
 
 
-def load_bdbkala_full(conn, branch_ids, product_map):
-    """Load Customers, Orders, OrderItems, Shipments from BDBKala_full.csv"""
-    print("Loading BDBKala_full.csv...")
-    path = DATASET_DIR / "BDBKala_full.csv"
+def load_products_properties(conn, registry, batch_size=DEFAULT_BATCH_SIZE, path=None, incremental=False):
+    """Update Product.BaseInfo (JSONB) from products_properties.csv (or path, a file with the same columns)"""
+    path = Path(path) if path else DATASET_DIR / "products_properties.csv"
+    print(f"Loading {path.name}...")
     if not path.exists():
-        raise FileNotFoundError(f"Missing {path}")
+        return
 
-    initial_max_pid = max(product_map.values()) if product_map else 0
-    next_pid = initial_max_pid + 1
+    attributes = read_product_attributes(path)
+    ensure_attribute_facets(conn)
+    updates = []  # (ProductID, BaseInfo)
+    count = 0
+    for pname, attrs in attributes:
+        pid = registry.product_by_name(pname)
+        if pid:
+            updates.append((pid, json.dumps(attrs, ensure_ascii=False) if attrs is not None else None))
+            count += 1
+    copy_update(conn, "Product", ("ProductID",), ("BaseInfo",), updates, batch_size=batch_size)
+    conn.commit()
+    print(f"  Updated {count} products with BaseInfo")
+
+
+def _bdbkala_product_resolver(product_map):
+    """Return get_product_id(row) that assigns new ProductIDs after the current maximum."""
+    next_pid = (max(product_map.values()) if product_map else 0) + 1
 
     def get_product_id(row):
         nonlocal next_pid
@@ -188,100 +234,104 @@ def load_bdbkala_full(conn, branch_ids, product_map):
             next_pid += 1
         return product_map[pkey]
 
-    customers = {}  # email -> (CustomerID, name, phone, age, gender, income, nature)
-    orders = {}  # OrderID -> (OrderDate, Priority, PaymentMethod, CustomerID, BranchID, items, shipment_info)
-    order_items = []
+    return get_product_id
 
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                order_id = int(row["Order ID"])
-            except (ValueError, KeyError):
-                continue
 
-            email_raw = (row.get("Email") or "").strip()
-            if not email_raw:
-                continue
-            email = email_raw.replace("@@", "@")  # Fix common typo for constraint
-
-            # Customer
-            cname = (row.get("Customer Name") or "").strip()
-            phone = (row.get("Phone") or "").strip()
-            age_val = row.get("Customer Age")
-            age = int(age_val) if age_val and str(age_val).isdigit() else None
-            gender_raw = (row.get("Gender") or "").strip().lower()
-            gender = "M" if "male" in gender_raw and "female" not in gender_raw else "F" if "female" in gender_raw else None
-            income_val = row.get("Income")
-            income = Decimal(str(income_val)) if income_val else None
-            seg = (row.get("Customer Segment") or "Consumer").strip()
-            nature = "corporate" if seg in ("Corporate", "Small Business") else "consumer"
+def _collect_bdbkala(reader, branch_ids, get_product_id, customers, next_cid, known_customers=None):
+    """Group BDBKala_full.csv rows into customers, orders and (OrderID, ProductID) item totals.
 
-            if email not in customers:
-                customers[email] = (len(customers) + 1, cname, phone, age, gender, income, nature)
+    customers collects new customers (email -> (CustomerID, name, phone, age, gender, income, nature));
+    emails found in known_customers (email -> CustomerID) reuse that ID instead.
+    Returns (orders, order_item_agg, next_cid).
+    """
+    known_customers = known_customers or {}
+    orders = {}  # OrderID -> (Priority, PaymentMethod, CustomerID, BranchID, items, shipment_info)
 
+    for row in reader:
+        try:
+            order_id = int(row["Order ID"])
+        except (ValueError, KeyError):
+            continue
+
+        email_raw = (row.get("Email") or "").strip()
+        if not email_raw:
+            continue
+        email = email_raw.replace("@@", "@")  # Fix common typo for constraint
+
+        # Customer
+        cname = (row.get("Customer Name") or "").strip()
+        phone = (row.get("Phone") or "").strip()
+        age_val = row.get("Customer Age")
+        age = int(age_val) if age_val and str(age_val).isdigit() else None
+        gender_raw = (row.get("Gender") or "").strip().lower()
+        gender = "M" if "male" in gender_raw and "female" not in gender_raw else "F" if "female" in gender_raw else None
+        income_val = row.get("Income")
+        income = Decimal(str(income_val)) if income_val else None
+        seg = (row.get("Customer Segment") or "Consumer").strip()
+        nature = "corporate" if seg in ("Corporate", "Small Business") else "consumer"
+
+        if email in known_customers:
+            cid = known_customers[email]
+        else:
+            if email not in customers:
+                customers[email] = (next_cid, cname, phone, age, gender, income, nature)
+                next_cid += 1
             cid = customers[email][0]
-            pid = get_product_id(row)
-            if not pid:
-                continue
+        pid = get_product_id(row)
+        if not pid:
+            continue
 
+        try:
+            qty = max(1, int(float(row.get("Order Quantity", 1) or 1)))
+        except (ValueError, TypeError):
+            qty = 1
+        unit_price = Decimal(str(row.get("Unit Price", 0) or 0))
+        discount = Decimal(str(row.get("Discount", 0) or 0))
+        item_price = max(Decimal("0"), round(unit_price * (1 - discount) * qty, 2))
+
+        priority_raw = (row.get("Order Priority") or "Low").strip()
+        priority = PRIORITY_MAP.get(priority_raw, "low")
+        payment_raw = (row.get("Payment Method") or "").strip()
+        payment = PAYMENT_MAP.get(payment_raw, "credit card")
+
+        ship_addr = (row.get("Shipping Address") or "").strip()
+        ship_date_str = row.get("Ship Date", "")
+        ship_date = None
+        if ship_date_str:
             try:
-                qty = max(1, int(float(row.get("Order Quantity", 1) or 1)))
-            except (ValueError, TypeError):
-                qty = 1
-            unit_price = Decimal(str(row.get("Unit Price", 0) or 0))
-            discount = Decimal(str(row.get("Discount", 0) or 0))
-            item_price = max(Decimal("0"), round(unit_price * (1 - discount) * qty, 2))
-
-            priority_raw = (row.get("Order Priority") or "Low").strip()
-            priority = PRIORITY_MAP.get(priority_raw, "low")
-            payment_raw = (row.get("Payment Method") or "").strip()
-            payment = PAYMENT_MAP.get(payment_raw, "credit card")
-            order_date_str = row.get("Order Date", "2020-01-01")
-            try:
-                order_date = datetime.strptime(order_date_str[:10], "%Y-%m-%d")
+                ship_date = datetime.strptime(ship_date_str[:10], "%Y-%m-%d")
             except ValueError:
-                order_date = datetime(2020, 1, 1)
-
-            ship_addr = (row.get("Shipping Address") or "").strip()
-            ship_date_str = row.get("Ship Date", "")
-            ship_date = None
-            if ship_date_str:
-                try:
-                    ship_date = datetime.strptime(ship_date_str[:10], "%Y-%m-%d")
-                except ValueError:
-                    pass
-            city = (row.get("City") or "").strip()
-            zip_code = (row.get("Zip Code") or "").strip()
-            ship_cost = Decimal(str(row.get("Shipping Cost", 0) or 0))
-            transport_raw = (row.get("Ship Mode") or "").strip()
-            transport = TRANSPORT_MAP.get(transport_raw, "ground")
-            pack_type, pack_size = parse_packaging(row.get("Packaging", ""))
-            if pack_type == "box" and transport == "ground":
-                transport = "airmail"  # Box cannot use ground (constraint)
-            ship_type = "same-day" if "Express" in (row.get("Shipping Method") or "") else "standard"
-
-            if order_id not in orders:
-                branch_id = random.choice(branch_ids) if branch_ids else 1
-                orders[order_id] = {
-                    "date": order_date,
-                    "priority": priority,
-                    "payment": payment,
-                    "customer_id": cid,
-                    "branch_id": branch_id,
-                    "items": [],
-                    "ship_addr": ship_addr,
-                    "ship_date": ship_date,
-                    "city": city,
-                    "zip_code": zip_code,
-                    "ship_cost": ship_cost,
-                    "transport": transport,
-                    "pack_type": pack_type,
-                    "pack_size": pack_size,
-                    "ship_type": ship_type,
-                }
-
-            orders[order_id]["items"].append((pid, qty, item_price))
+                pass
+        city = (row.get("City") or "").strip()
+        zip_code = (row.get("Zip Code") or "").strip()
+        ship_cost = Decimal(str(row.get("Shipping Cost", 0) or 0))
+        transport_raw = (row.get("Ship Mode") or "").strip()
+        transport = TRANSPORT_MAP.get(transport_raw, "ground")
+        pack_type, pack_size = parse_packaging(row.get("Packaging", ""))
+        if pack_type == "box" and transport == "ground":
+            transport = "airmail"  # Box cannot use ground (constraint)
+        ship_type = "same-day" if "Express" in (row.get("Shipping Method") or "") else "standard"
+
+        if order_id not in orders:
+            branch_id = random.choice(branch_ids) if branch_ids else 1
+            orders[order_id] = {
+                "priority": priority,
+                "payment": payment,
+                "customer_id": cid,
+                "branch_id": branch_id,
+                "items": [],
+                "ship_addr": ship_addr,
+                "ship_date": ship_date,
+                "city": city,
+                "zip_code": zip_code,
+                "ship_cost": ship_cost,
+                "transport": transport,
+                "pack_type": pack_type,
+                "pack_size": pack_size,
+                "ship_type": ship_type,
+            }
+
+        orders[order_id]["items"].append((pid, qty, item_price))
 
     # Deduplicate order items by (OrderID, ProductID) - sum quantities
     order_item_agg = {}
@@ -293,26 +343,34 @@ def load_bdbkala_full(conn, branch_ids, product_map):
             order_item_agg[key][0] += qty
             order_item_agg[key][1] += price
 
+    return orders, order_item_agg, next_cid
+
+
+def _insert_timestamp(conn):
+    """This transaction's LOCALTIMESTAMP, the OrderDate trg_order_date_now stores on insert.
+
+    Orders are written with it rather than the file's date, so a partitioned
+    Order_Header routes them to the partition they end up in.
+    """
     cur = conn.cursor()
+    cur.execute("SELECT LOCALTIMESTAMP")
+    now = cur.fetchone()[0]
+    cur.close()
+    return now
 
-    # Insert any new products discovered from BDBKala (not in branch_product_suppliers)
-    for (pname, cat, subcat), pid in product_map.items():
-        if pid > initial_max_pid:
-            cur.execute(
-                "INSERT INTO Product (ProductID, Name, Category, SubCategory, TaxAmount) VALUES (%s, %s, %s, %s, 0.10) ON CONFLICT (ProductID) DO NOTHING",
-                (pid, pname, cat or None, subcat or None),
-            )
 
-    for email, (cid, cname, phone, age, gender, income, nature) in customers.items():
-        tier = random.choice(["new", "regular", "special"])
-        cur.execute(
-            """INSERT INTO Customer (CustomerID, Name, Phone, Email, Age, Gender, IncomeLevel, Nature, Tier, TaxAmount, LoyaltyPoints)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 0.10, 0) ON CONFLICT (CustomerID) DO NOTHING""",
-            (cid, cname, phone or None, email, age, gender, str(income) if income else None, nature, tier),
-        )
+def _stored_order_dates(conn, order_ids):
+    """OrderID -> stored OrderDate (kept for orders that already existed), in one round trip."""
+    cur = conn.cursor()
+    cur.execute("SELECT OrderID, OrderDate FROM Order_Header WHERE OrderID = ANY(%s)", (order_ids,))
+    stored = dict(cur.fetchall())
+    cur.close()
+    return stored
 
-    cid_to_nature_income = {cid: (nat, inc) for _, (cid, _, _, _, _, inc, nat) in customers.items()}
 
+def _order_rows(orders, order_item_agg, cid_to_nature_income, order_date):
+    """Order_Header rows (OrderID, OrderDate, Priority, TotalAmount, PaymentMethod, LoyaltyDiscount, CustomerID, BranchID)."""
+    order_rows = []
     for oid, data in orders.items():
         total = sum(order_item_agg[(oid, pid)][1] for pid in set(p for p, _, _ in data["items"]) if (oid, pid) in order_item_agg)
         total = round(total + data["ship_cost"], 2)
@@ -327,54 +385,264 @@ def load_bdbkala_full(conn, branch_ids, product_map):
                     priority = "high"
             except (ValueError, TypeError):
                 pass
-        cur.execute(
-            """INSERT INTO Order_Header (OrderID, OrderDate, Priority, TotalAmount, PaymentMethod, LoyaltyDiscount, CustomerID, BranchID)
-               VALUES (%s, %s, %s, %s, %s, 0, %s, %s) ON CONFLICT (OrderID) DO NOTHING""",
-            (oid, data["date"], priority, total, data["payment"], cid, data["branch_id"]),
-        )
-
-    for (oid, pid), (qty, price) in order_item_agg.items():
-        price = max(Decimal("0"), price)  # Ensure non-negative for constraint
-        cur.execute(
-            """INSERT INTO OrderItem (OrderID, ProductID, Quantity, CalculatedItemPrice, ItemStatus)
-               VALUES (%s, %s, %s, %s, 'received') ON CONFLICT (OrderID, ProductID) DO NOTHING""",
-            (oid, pid, qty, price),
-        )
+        order_rows.append((oid, order_date, priority, total, data["payment"], 0, cid, data["branch_id"]))
+    return order_rows
+
+
+def _write_bdbkala(conn, new_products, customers, orders, order_item_agg, cid_to_nature_income, batch_size, update=False):
+    """Write products, customers, orders, order items and shipments collected by _collect_bdbkala.
+    With update, existing orders, items and shipments are overwritten instead of kept."""
+    # Insert any new products discovered from BDBKala (not in branch_product_suppliers)
+    copy_upsert(conn, "Product", ("ProductID", "Name", "Category", "SubCategory", "TaxAmount"),
+                ((pid, pname, cat or None, subcat or None, Decimal("0.10")) for (pname, cat, subcat), pid in new_products),
+                conflict=("ProductID",), batch_size=batch_size)
 
+    customer_rows = []
+    for email, (cid, cname, phone, age, gender, income, nature) in customers.items():
+        tier = random.choice(["new", "regular", "special"])
+        customer_rows.append((cid, cname, phone or None, email, age, gender, str(income) if income else None, nature, tier,
+                              Decimal("0.10"), 0))
+    copy_upsert(conn, "Customer",
+                ("CustomerID", "Name", "Phone", "Email", "Age", "Gender", "IncomeLevel", "Nature", "Tier", "TaxAmount", "LoyaltyPoints"),
+                customer_rows, conflict=("CustomerID",), batch_size=batch_size)
+
+    copy_upsert(conn, "Order_Header",
+                ("OrderID", "OrderDate", "Priority", "TotalAmount", "PaymentMethod", "LoyaltyDiscount", "CustomerID", "BranchID"),
+                _order_rows(orders, order_item_agg, cid_to_nature_income, _insert_timestamp(conn)),
+                conflict=("OrderID",), update=ORDER_UPDATE if update else None, batch_size=batch_size)
+    stored_dates = _stored_order_dates(conn, list(orders))
+
+    copy_upsert(conn, "OrderItem", ("OrderID", "ProductID", "Quantity", "CalculatedItemPrice", "ItemStatus", "OrderDate"),
+                ((oid, pid, qty, max(Decimal("0"), price), "received", stored_dates[oid])  # Ensure non-negative for constraint
+                 for (oid, pid), (qty, price) in order_item_agg.items()),
+                conflict=("OrderID", "ProductID"), update=ITEM_UPDATE if update else None, batch_size=batch_size)
+
+    shipment_rows = []
     for oid, data in orders.items():
-        cur.execute("SELECT OrderDate FROM Order_Header WHERE OrderID = %s", (oid,))
-        row = cur.fetchone()
-        order_date = row[0] if row else None
+        order_date = stored_dates.get(oid)
         ship_date = data["ship_date"]
         if order_date and ship_date and ship_date < order_date:
             ship_date = order_date  # ShipDate must be >= OrderDate (constraint)
         tracking = f"TRK{oid:08d}"
-        cur.execute(
-            """INSERT INTO Shipment (ShipmentID, TrackingCode, ShipDate, RecipientAddress, City, ZipCode, Type, TransportMethod, Cost, PackType, PackSize, OrderID)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING""",
-            (oid, tracking, ship_date, data["ship_addr"] or None, data["city"] or None, data["zip_code"] or None,
-             data["ship_type"], data["transport"], data["ship_cost"], data["pack_type"], data["pack_size"], oid),
-        )
+        shipment_rows.append((oid, tracking, ship_date, data["ship_addr"] or None, data["city"] or None, data["zip_code"] or None,
+                              data["ship_type"], data["transport"], data["ship_cost"], data["pack_type"], data["pack_size"], oid))
+    copy_upsert(conn, "Shipment",
+                ("ShipmentID", "TrackingCode", "ShipDate", "RecipientAddress", "City", "ZipCode", "Type", "TransportMethod",
+                 "Cost", "PackType", "PackSize", "OrderID"),
+                shipment_rows, conflict=("ShipmentID",) if update else None, update=SHIPMENT_UPDATE if update else None,
+                batch_size=batch_size)
+
+
+def _write_bdbkala_frames(conn, frames, batch_size, update=False):
+    """Write the column buffers produced by bdbkala_transform.transform_bdbkala (update as in _write_bdbkala)."""
+    copy_upsert(conn, "Product", ("ProductID", "Name", "Category", "SubCategory", "TaxAmount"),
+                frames.products.assign(TaxAmount="0.10"), conflict=("ProductID",), batch_size=batch_size)
+
+    customers = frames.customers.assign(
+        Tier=[random.choice(["new", "regular", "special"]) for _ in range(len(frames.customers))],
+        TaxAmount="0.10", LoyaltyPoints=0,
+    )
+    copy_upsert(conn, "Customer",
+                ("CustomerID", "Name", "Phone", "Email", "Age", "Gender", "IncomeLevel", "Nature", "Tier", "TaxAmount", "LoyaltyPoints"),
+                customers, conflict=("CustomerID",), batch_size=batch_size)
+
+    orders = frames.orders
+    copy_upsert(conn, "Order_Header",
+                ("OrderID", "OrderDate", "Priority", "TotalAmount", "PaymentMethod", "LoyaltyDiscount", "CustomerID", "BranchID"),
+                orders.assign(OrderDate=_insert_timestamp(conn)), conflict=("OrderID",),
+                update=ORDER_UPDATE if update else None, batch_size=batch_size)
+    stored_dates = _stored_order_dates(conn, orders["OrderID"].tolist())
+    items = frames.items
+    copy_upsert(conn, "OrderItem", ("OrderID", "ProductID", "Quantity", "CalculatedItemPrice", "ItemStatus", "OrderDate"),
+                items.assign(ItemStatus="received", OrderDate=items["OrderID"].map(stored_dates).astype("datetime64[us]")),
+                conflict=("OrderID", "ProductID"), update=ITEM_UPDATE if update else None, batch_size=batch_size)
+
+    order_date = orders["OrderID"].map(stored_dates).astype("datetime64[us]")
+    ship_date = orders["ShipDate"].astype("datetime64[us]")
+    ship_date = ship_date.where(~(ship_date < order_date), order_date)  # ShipDate must be >= OrderDate (constraint)
+    shipments = orders.assign(
+        ShipmentID=orders["OrderID"], ShipDate=ship_date,
+        TrackingCode="TRK" + orders["OrderID"].astype(str).str.zfill(8),
+    )
+    copy_upsert(conn, "Shipment",
+                ("ShipmentID", "TrackingCode", "ShipDate", "RecipientAddress", "City", "ZipCode", "Type", "TransportMethod",
+                 "Cost", "PackType", "PackSize", "OrderID"),
+                shipments, conflict=("ShipmentID",) if update else None, update=SHIPMENT_UPDATE if update else None,
+                batch_size=batch_size)
+
+
+def load_bdbkala_full(conn, registry, batch_size=DEFAULT_BATCH_SIZE):
+    """Load Customers, Orders, OrderItems, Shipments from BDBKala_full.csv"""
+    print("Loading BDBKala_full.csv...")
+    path = DATASET_DIR / "BDBKala_full.csv"
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}")
+    branch_ids = registry.branch_ids()
+    product_map = registry.products
+
+    if LOAD_TRANSFORM == "pandas":
+        from bdbkala_transform import read_bdbkala, transform_bdbkala
+
+        frames, _ = transform_bdbkala(read_bdbkala(path), branch_ids, product_map)
+        _write_bdbkala_frames(conn, frames, batch_size)
+        conn.commit()
+        registry.customers.update(zip(frames.customers["Email"], frames.customers["CustomerID"].tolist()))
+        print(f"  Customers: {len(frames.customers)}, Orders: {len(frames.orders)}, OrderItems: {len(frames.items)}")
+        order_to_customer = dict(zip(frames.orders["OrderID"].tolist(), frames.orders["CustomerID"].tolist()))
+        return {"customers": frames.customers, "orders": frames.orders, "order_to_customer": order_to_customer}
+
+    initial_max_pid = max(product_map.values()) if product_map else 0
+    get_product_id = _bdbkala_product_resolver(product_map)
+
+    customers = {}  # email -> (CustomerID, name, phone, age, gender, income, nature)
+    with open(path, "r", encoding="utf-8") as f:
+        orders, order_item_agg, _ = _collect_bdbkala(csv.DictReader(f), branch_ids, get_product_id, customers, 1)
+
+    new_products = [(pkey, pid) for pkey, pid in product_map.items() if pid > initial_max_pid]
+    cid_to_nature_income = {cid: (nat, inc) for _, (cid, _, _, _, _, inc, nat) in customers.items()}
+    _write_bdbkala(conn, new_products, customers, orders, order_item_agg, cid_to_nature_income, batch_size)
 
     conn.commit()
-    cur.close()
+    registry.customers.update((email, c[0]) for email, c in customers.items())
     print(f"  Customers: {len(customers)}, Orders: {len(orders)}, OrderItems: {len(order_item_agg)}")
     return {"customers": customers, "orders": orders, "order_to_customer": {oid: d["customer_id"] for oid, d in orders.items()}}
 
 
-def load_wallet_balances(conn, _unused=None):
+def _spill_by_order(path, n_buckets, tmpdir, stride=1):
+    """Partition a BDBKala_full.csv file into n_buckets CSV files by OrderID.
+
+    Every row of an order lands in the same bucket and rows keep their file order
+    within a bucket. Rows without a numeric Order ID are dropped here, as the
+    loader would skip them anyway. At most LOAD_MAX_OPEN_BUCKETS files are open
+    at once: more buckets are made by splitting each of those files again.
+    """
+    fanout = min(n_buckets, LOAD_MAX_OPEN_BUCKETS)
+    prefix = "bucket" if stride == 1 else path.stem
+    paths = [tmpdir / f"{prefix}_{i:05d}.csv" for i in range(fanout)]
+    files = [open(p, "w", encoding="utf-8", newline="") for p in paths]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            writers = [csv.DictWriter(bf, fieldnames=reader.fieldnames) for bf in files]
+            for w in writers:
+                w.writeheader()
+            for row in reader:
+                try:
+                    order_id = int(row["Order ID"])
+                except (ValueError, KeyError):
+                    continue
+                writers[order_id // stride % fanout].writerow(row)
+    finally:
+        for bf in files:
+            bf.close()
+    if fanout == n_buckets:
+        return paths
+
+    buckets = []
+    for p in paths:
+        buckets.extend(_spill_by_order(p, math.ceil(n_buckets / fanout), tmpdir, stride * fanout))
+        p.unlink()
+    return buckets
+
+
+def load_bdbkala_streaming(conn, registry, memory_mb=LOAD_MEMORY_MB, batch_size=DEFAULT_BATCH_SIZE, path=None,
+                           incremental=False):
+    """Load BDBKala_full.csv in order-clustered chunks with bounded memory.
+
+    The file is first partitioned by OrderID into on-disk buckets of roughly
+    memory_mb each; every bucket holds complete orders and is written and
+    committed before the next one is read. Customers are resolved by email
+    against the Customer table, so nothing grows with the size of the file
+    except the key registry.
+
+    path: read another file with the same columns (a manifest chunk). With
+    incremental, orders, items and shipments already in the database are
+    overwritten from the file.
+    """
+    path = Path(path) if path else DATASET_DIR / "BDBKala_full.csv"
+    print(f"Loading {path.name} (streaming)...")
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}")
+
+    n_buckets = max(1, math.ceil(path.stat().st_size / (memory_mb * 1024 * 1024)))
+    branch_ids = registry.branch_ids()
+    product_map = registry.products
+    if LOAD_TRANSFORM == "pandas":
+        from bdbkala_transform import read_bdbkala, transform_bdbkala
+    get_product_id = _bdbkala_product_resolver(product_map)
+    written_max_pid = max(product_map.values()) if product_map else 0
+
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(CustomerID), 0) FROM Customer")
+    next_cid = cur.fetchone()[0] + 1
+
+    n_customers = n_orders = n_items = 0
+    with tempfile.TemporaryDirectory(prefix="bdbkala_") as tmp:
+        buckets = _spill_by_order(path, n_buckets, Path(tmp))
+        for i, bucket in enumerate(buckets, 1):
+            if LOAD_TRANSFORM == "pandas":
+                df = read_bdbkala(bucket)
+                emails = list(set(df["Email"].str.strip().str.replace("@@", "@", regex=False)) - {""}) if "Email" in df else []
+            else:
+                with open(bucket, "r", encoding="utf-8") as f:
+                    rows = list(csv.DictReader(f))
+                emails = list({(r.get("Email") or "").strip().replace("@@", "@") for r in rows} - {""})
+            cur.execute(
+                """SELECT DISTINCT ON (Email) Email, CustomerID, Nature, IncomeLevel
+                   FROM Customer WHERE Email = ANY(%s) ORDER BY Email, CustomerID""",
+                (emails,),
+            )
+            found = cur.fetchall()
+            registry.customers.update((email, cid) for email, cid, _, _ in found)
+
+            if LOAD_TRANSFORM == "pandas":
+                known = {email: (cid, nat, inc) for email, cid, nat, inc in found}
+                frames, next_cid = transform_bdbkala(df, branch_ids, product_map, next_cid, known)
+                del df
+                _write_bdbkala_frames(conn, frames, batch_size, update=incremental)
+                registry.customers.update(zip(frames.customers["Email"], frames.customers["CustomerID"].tolist()))
+                chunk_customers, chunk_orders, chunk_items = len(frames.customers), len(frames.orders), len(frames.items)
+            else:
+                known = {email: cid for email, cid, _, _ in found}
+                customers = {}
+                orders, order_item_agg, next_cid = _collect_bdbkala(rows, branch_ids, get_product_id, customers, next_cid, known)
+                del rows
+
+                new_products = [(pkey, pid) for pkey, pid in product_map.items() if pid > written_max_pid]
+                written_max_pid = max([written_max_pid] + [pid for _, pid in new_products])
+                cid_to_nature_income = {cid: (nat, inc) for _, cid, nat, inc in found}
+                cid_to_nature_income.update({cid: (nat, inc) for _, (cid, _, _, _, _, inc, nat) in customers.items()})
+                _write_bdbkala(conn, new_products, customers, orders, order_item_agg, cid_to_nature_income, batch_size,
+                               update=incremental)
+                registry.customers.update((email, c[0]) for email, c in customers.items())
+                chunk_customers, chunk_orders, chunk_items = len(customers), len(orders), len(order_item_agg)
+            conn.commit()
+
+            n_customers += chunk_customers
+            n_orders += chunk_orders
+            n_items += chunk_items
+            print(f"  Chunk {i}/{len(buckets)}: {chunk_orders} orders")
+    cur.close()
+
+    print(f"  Customers: {n_customers}, Orders: {n_orders}, OrderItems: {n_items}")
+    return {"customers": None, "orders": None, "order_to_customer": None}
+
+
+def load_wallet_balances(conn, registry, batch_size=DEFAULT_BATCH_SIZE, path=None, incremental=False):
     """Load Wallet table from wallet_balances.csv. Create Customer records for new customers.
-    Ensures all customers have a Wallet (balance 0 if not in file)."""
-    print("Loading wallet_balances.csv...")
-    path = DATASET_DIR / "wallet_balances.csv"
+    Ensures all customers have a Wallet (balance 0 if not in file).
+    With incremental, only the customers in the file (or path, a manifest chunk) are written."""
+    path = Path(path) if path else DATASET_DIR / "wallet_balances.csv"
+    print(f"Loading {path.name}...")
 
+    email_to_cid = registry.customers
     cur = conn.cursor()
     cur.execute("SELECT COALESCE(MAX(CustomerID), 0) FROM Customer")
     next_cid = cur.fetchone()[0] + 1
-    cur.execute("SELECT CustomerID, Email FROM Customer")
-    email_to_cid = {r[1]: r[0] for r in cur.fetchall() if r[1]}
-    all_cids = set(email_to_cid.values())
+    cur.close()
+    all_cids = set() if incremental else set(email_to_cid.values())
     wallets = {}
+    new_customers = []
 
     if path.exists():
         with open(path, "r", encoding="utf-8") as f:
@@ -390,39 +658,49 @@ def load_wallet_balances(conn, _unused=None):
                     cid = next_cid
                     next_cid += 1
                     email_to_cid[email] = cid
-                    cur.execute(
-                        """INSERT INTO Customer (CustomerID, Name, Phone, Email, Nature, Tier, TaxAmount, LoyaltyPoints)
-                           VALUES (%s, %s, %s, %s, 'consumer', 'regular', 0.10, 0) ON CONFLICT (CustomerID) DO NOTHING""",
-                        (cid, name, phone or None, email),
-                    )
+                    new_customers.append((cid, name, phone or None, email, "consumer", "regular", Decimal("0.10"), 0))
                 cid = email_to_cid[email]
                 wallets[cid] = balance
                 all_cids.add(cid)
 
-    for cid in all_cids:
-        balance = wallets.get(cid, Decimal("0"))
-        cur.execute(
-            "INSERT INTO Wallet (CustomerID, Balance) VALUES (%s, %s) ON CONFLICT (CustomerID) DO UPDATE SET Balance = EXCLUDED.Balance",
-            (cid, balance),
-        )
+    copy_upsert(conn, "Customer", ("CustomerID", "Name", "Phone", "Email", "Nature", "Tier", "TaxAmount", "LoyaltyPoints"),
+                new_customers, conflict=("CustomerID",), batch_size=batch_size)
+    copy_upsert(conn, "Wallet", ("CustomerID", "Balance"),
+                ((cid, wallets.get(cid, Decimal("0"))) for cid in all_cids),
+                conflict=("CustomerID",), update=("Balance",), batch_size=batch_size)
 
     conn.commit()
-    cur.close()
     print(f"  Wallets: {len(all_cids)} (from file: {len(wallets)})")
     return wallets
 
 
-def load_reviews(conn, order_to_customer, product_map):
-    """Load ProductReview from reviews.csv. Match by Order ID and Product name."""
-    print("Loading reviews.csv...")
-    path = DATASET_DIR / "reviews.csv"
+def _review_order_customers(conn, path):
+    """OrderID -> CustomerID for the orders referenced by reviews.csv, in one query."""
+    order_ids = set()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for row in csv.DictReader(f):
+            try:
+                order_ids.add(int(row.get("Order ID", 0)))
+            except (ValueError, TypeError):
+                continue
+    cur = conn.cursor()
+    cur.execute("SELECT OrderID, CustomerID FROM Order_Header WHERE OrderID = ANY(%s)", (list(order_ids),))
+    result = dict(cur.fetchall())
+    cur.close()
+    return result
+
+
+def load_reviews(conn, order_to_customer, registry, batch_size=DEFAULT_BATCH_SIZE, path=None, incremental=False):
+    """Load ProductReview from reviews.csv. Match by Order ID and Product name.
+    If order_to_customer is None (streaming load), the orders are looked up in Order_Header.
+    With incremental, existing reviews get the file's comment."""
+    path = Path(path) if path else DATASET_DIR / "reviews.csv"
+    print(f"Loading {path.name}...")
     if not path.exists():
         return
 
-    cur = conn.cursor()
-    count = 0
+    reviews = []
     seen = set()
-    name_to_pid = {pname: pid for (pname, _pc, _ps), pid in product_map.items()}
 
     # Increase field size limit for CSV (reviews have large Image column with binary data)
     import sys
@@ -434,6 +712,9 @@ def load_reviews(conn, order_to_customer, product_map):
         except OverflowError:
             max_int //= 2
 
+    if order_to_customer is None:
+        order_to_customer = _review_order_customers(conn, path)
+
     with open(path, "r", encoding="utf-8", errors="replace") as f:
         reader = csv.DictReader(f)
         for row in reader:
@@ -447,8 +728,7 @@ def load_reviews(conn, order_to_customer, product_map):
             pname = (row.get("Product Name") or "").strip()
             pcat = (row.get("Product Category") or "").strip()
             psub = (row.get("Product Sub-Category") or "").strip()
-            pkey = (pname, pcat, psub)
-            pid = product_map.get(pkey) or name_to_pid.get(pname)
+            pid = registry.product_id(pname, pcat, psub)
             if not pid:
                 continue
             key = (cid, pid)
@@ -457,36 +737,126 @@ def load_reviews(conn, order_to_customer, product_map):
             seen.add(key)
             comment = (row.get("Comment") or "").strip()[:2000]
             score = random.randint(1, 5)
-            cur.execute(
-                """INSERT INTO ProductReview (CustomerID, ProductID, Score, Comment, IsPublic)
-                   VALUES (%s, %s, %s, %s, TRUE) ON CONFLICT (CustomerID, ProductID) DO NOTHING""",
-                (cid, pid, score, comment or None),
-            )
-            count += 1
+            reviews.append((cid, pid, score, comment or None, True))
 
+    copy_upsert(conn, "ProductReview", ("CustomerID", "ProductID", "Score", "Comment", "IsPublic"),
+                reviews, conflict=("CustomerID", "ProductID"), update=("Comment", "IsPublic") if incremental else None,
+                batch_size=batch_size)
     conn.commit()
-    cur.close()
-    print(f"  Reviews: {count}")
+    print(f"  Reviews: {len(reviews)}")
 
 
-def main():
-    conn = get_conn()
+def _order_key(row):
     try:
-        data = load_branch_product_suppliers(conn)
-        product_map = data["products"]
-        branch_ids = data["branch_ids"]
+        return int(row.get("Order ID"))
+    except (ValueError, TypeError):
+        return None
+
+
+# Manifest chunk key per dataset file: rows that must be loaded together share a key
+FILE_KEYS = {
+    "branch_product_suppliers.csv": lambda r: (r["branch_name"].strip(), r["product_name"].strip(), r["supplier_name"].strip()),
+    "products_properties.csv": lambda r: r["product_name"].strip(),
+    "BDBKala_full.csv": _order_key,
+    "wallet_balances.csv": lambda r: (r.get("customer_email") or "").strip(),
+    "reviews.csv": _order_key,
+}
+
+
+def _load_file(conn, name, load, load_streaming=None):
+    """Load one dataset file with load(path=None, incremental=False) and record it in the manifest.
+
+    With LOAD_INCREMENTAL only the manifest chunks that changed are loaded, each
+    through load_streaming (default: load) with incremental=True.
+    """
+    path = DATASET_DIR / name
+    if LOAD_INCREMENTAL:
+        chunk_load = load_streaming or load
+        manifest.load_changed(conn, path, FILE_KEYS[name], lambda: chunk_load(incremental=True),
+                              lambda chunk: chunk_load(path=chunk, incremental=True))
+    else:
+        load()
+        manifest.record(conn, path, FILE_KEYS[name])
 
-        load_products_properties(conn, product_map)
 
-        bdb_data = load_bdbkala_full(conn, branch_ids, product_map)
+# Pipeline stages (run_all.py). Each runs on its own connection and shares IDs through the key registry.
+
+def stage_branch_product_suppliers(conn):
+    # keys already in the database keep their IDs
+    registry = KeyRegistry.open(conn)
+    _load_file(conn, "branch_product_suppliers.csv", lambda **kw: load_branch_product_suppliers(conn, registry, **kw))
+    registry.save(conn)
+
+
+def stage_products_properties(conn):
+    registry = KeyRegistry.open(conn)
+    path = DATASET_DIR / "products_properties.csv"
+    if path.exists():
+        read_product_attributes(path)  # reject a malformed file before an incremental load writes any of its chunks
+    _load_file(conn, "products_properties.csv", lambda **kw: load_products_properties(conn, registry, **kw))
+
+
+def stage_bdbkala(conn):
+    registry = KeyRegistry.open(conn)
+    # load_bdbkala_full assumes an empty Customer table; chunks resolve customers through the streaming loader
+    _load_file(conn, "BDBKala_full.csv",
+               lambda **kw: (load_bdbkala_streaming if LOAD_STREAMING else load_bdbkala_full)(conn, registry, **kw),
+               lambda **kw: load_bdbkala_streaming(conn, registry, **kw))
+    registry.save(conn)
+
+
+def stage_wallet_balances(conn):
+    registry = KeyRegistry.open(conn)
+    _load_file(conn, "wallet_balances.csv", lambda **kw: load_wallet_balances(conn, registry, **kw))
+    if LOAD_INCREMENTAL:
+        # customers added by the other files still need a wallet
+        cur = conn.cursor()
+        cur.execute("INSERT INTO Wallet (CustomerID, Balance) SELECT CustomerID, 0 FROM Customer ON CONFLICT DO NOTHING")
+        cur.close()
+        conn.commit()
+    registry.save(conn)
+
+
+def stage_reviews(conn):
+    registry = KeyRegistry.open(conn)
+    _load_file(conn, "reviews.csv", lambda **kw: load_reviews(conn, None, registry, **kw))
+
+
+LOADED_TABLES = ("Manager", "Branch", "Supplier", "Product", "BranchSupplyOffer", "Customer",
+                 "Order_Header", "OrderItem", "Shipment", "Wallet", "ProductReview")
+
+
+def main():
+    with db.connection() as conn:
+        manifest.ensure_tables(conn)
+        if LOAD_INCREMENTAL:
+            for stage in (stage_branch_product_suppliers, stage_products_properties, stage_bdbkala,
+                          stage_wallet_balances, stage_reviews):
+                stage(conn)
+            db.analyze_loaded(conn, LOADED_TABLES)
+            print("\nIncremental load complete.")
+            return
+
+        registry = KeyRegistry.open(conn)
+        load_branch_product_suppliers(conn, registry)
+        load_products_properties(conn, registry)
+
+        if LOAD_STREAMING:
+            bdb_data = load_bdbkala_streaming(conn, registry)
+        else:
+            bdb_data = load_bdbkala_full(conn, registry)
         order_to_customer = bdb_data["order_to_customer"]
 
-        load_wallet_balances(conn, bdb_data.get("order_to_customer", {}))
-        load_reviews(conn, order_to_customer, product_map)
+        load_wallet_balances(conn, registry)
+        load_reviews(conn, order_to_customer, registry)
+
+        for name, key in FILE_KEYS.items():
+            manifest.record(conn, DATASET_DIR / name, key)
+        registry.save(conn)
+        print(f"Saved key registry to {REGISTRY_PATH}")
+        db.analyze_loaded(conn, LOADED_TABLES)
 
         print("\nData load complete. Run generate_extra_data.py and reconstruct_wallet.py next.")
-    finally:
-        conn.close()
 
 
 if __name__ == "__main__":
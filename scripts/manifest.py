@@ -0,0 +1,185 @@
+"""
+Change manifest for incremental reloads of the dataset files.
+
+Each input file is recorded in LoadManifest (size, SHA-256, chunk count) and
+LoadManifestChunk (one hash per chunk). Rows are assigned to one of
+MANIFEST_CHUNKS chunks by a key (e.g. the Order ID), so every row of an order
+lands in the same chunk and a chunk keeps its identity when unrelated rows
+change.
+
+load_changed compares a file with its manifest: an identical file is skipped
+after hashing it, a file seen before has only its changed chunks re-loaded,
+and a file never seen is loaded in full. A chunk's hash is committed right
+after the loader has committed the chunk itself. The two commits are not
+atomic, but loading a chunk again is idempotent, so an interrupted run
+resumes with the chunks whose hash was not recorded yet.
+"""
+import csv
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SQL_PATH = PROJECT_ROOT / "init" / "04-load-manifest.sql"
+MANIFEST_CHUNKS = int(os.getenv("MANIFEST_CHUNKS", "64"))
+
+
+def _raise_field_limit():
+    # reviews.csv has a large Image column
+    max_int = sys.maxsize
+    while True:
+        try:
+            csv.field_size_limit(max_int)
+            return
+        except OverflowError:
+            max_int //= 2
+
+
+def ensure_tables(conn):
+    """Create the manifest tables on databases initialised before init/04-load-manifest.sql existed."""
+    cur = conn.cursor()
+    cur.execute(SQL_PATH.read_text())
+    cur.close()
+    conn.commit()
+
+
+def file_digest(path):
+    """(size in bytes, SHA-256 hex) of a file."""
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+            size += len(block)
+    return size, h.hexdigest()
+
+
+def _chunk_of(key, n):
+    return zlib.crc32(str(key).encode("utf-8")) % n
+
+
+def _rows(path):
+    _raise_field_limit()
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        for row in reader:
+            yield header, row
+
+
+def chunk_hashes(path, key, n=MANIFEST_CHUNKS):
+    """SHA-256 hex per chunk; key(row dict) chooses a row's chunk."""
+    hashes = [hashlib.sha256() for _ in range(n)]
+    for header, row in _rows(path):
+        hashes[_chunk_of(key(dict(zip(header, row))), n)].update(("\x1f".join(row) + "\x1e").encode("utf-8"))
+    return [h.hexdigest() for h in hashes]
+
+
+def spill(path, key, n, chunks, tmpdir):
+    """Write the rows of the given chunks to one CSV file each (same header). Returns {chunk: path}."""
+    chunks = set(chunks)
+    paths = {c: Path(tmpdir) / f"chunk_{c:04d}.csv" for c in sorted(chunks)}
+    files, writers = {}, {}
+    try:
+        for header, row in _rows(path):
+            c = _chunk_of(key(dict(zip(header, row))), n)
+            if c not in chunks:
+                continue
+            if c not in writers:
+                files[c] = open(paths[c], "w", encoding="utf-8", newline="")
+                writers[c] = csv.writer(files[c])
+                writers[c].writerow(header)
+            writers[c].writerow(row)
+    finally:
+        for f in files.values():
+            f.close()
+    return {c: p for c, p in paths.items() if c in writers}
+
+
+def _record_file(cur, name, size, digest, n):
+    cur.execute(
+        """INSERT INTO LoadManifest (FileName, FileSize, FileHash, ChunkCount, LoadedAt)
+           VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+           ON CONFLICT (FileName) DO UPDATE SET FileSize = EXCLUDED.FileSize, FileHash = EXCLUDED.FileHash,
+               ChunkCount = EXCLUDED.ChunkCount, LoadedAt = EXCLUDED.LoadedAt""",
+        (name, size, digest, n),
+    )
+
+
+def _record_chunk(cur, name, chunk, digest):
+    cur.execute(
+        """INSERT INTO LoadManifestChunk (FileName, ChunkNo, ChunkHash) VALUES (%s, %s, %s)
+           ON CONFLICT (FileName, ChunkNo) DO UPDATE SET ChunkHash = EXCLUDED.ChunkHash""",
+        (name, chunk, digest),
+    )
+
+
+def record(conn, path, key, n=MANIFEST_CHUNKS):
+    """Record path as fully loaded: file digest and every chunk hash. Commits."""
+    path = Path(path)
+    if not path.exists():
+        return
+    size, digest = file_digest(path)
+    hashes = chunk_hashes(path, key, n)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM LoadManifestChunk WHERE FileName = %s", (path.name,))
+    for chunk, h in enumerate(hashes):
+        _record_chunk(cur, path.name, chunk, h)
+    _record_file(cur, path.name, size, digest, n)
+    cur.close()
+    conn.commit()
+
+
+def load_changed(conn, path, key, load_full, load_chunk, n=MANIFEST_CHUNKS):
+    """Load path according to its manifest.
+
+    load_full() loads the whole file; load_chunk(chunk_path) loads a CSV holding
+    some of its rows. Both may commit. Returns the number of chunks loaded
+    (n for a full load, 0 if the file is unchanged).
+    """
+    path = Path(path)
+    if not path.exists():
+        load_full()
+        return n
+
+    cur = conn.cursor()
+    cur.execute("SELECT FileSize, FileHash, ChunkCount FROM LoadManifest WHERE FileName = %s", (path.name,))
+    previous = cur.fetchone()
+    size, digest = file_digest(path)
+    if previous is not None and tuple(previous) == (size, digest, n):
+        cur.close()
+        return 0
+
+    cur.execute("SELECT ChunkNo, ChunkHash FROM LoadManifestChunk WHERE FileName = %s", (path.name,))
+    stored = dict(cur.fetchall())
+    if previous is None and not stored:
+        cur.close()
+        load_full()
+        record(conn, path, key, n)
+        return n
+
+    if previous is not None and previous[2] != n:
+        stored = {}  # chunk numbering changed with MANIFEST_CHUNKS
+        cur.execute("DELETE FROM LoadManifestChunk WHERE FileName = %s", (path.name,))
+        conn.commit()
+    hashes = chunk_hashes(path, key, n)
+    changed = [c for c, h in enumerate(hashes) if stored.get(c) != h]
+    with tempfile.TemporaryDirectory(prefix="manifest_") as tmp:
+        chunk_paths = spill(path, key, n, changed, tmp)
+        for c in changed:
+            if c in chunk_paths:
+                load_chunk(chunk_paths[c])
+            _record_chunk(cur, path.name, c, hashes[c])
+            conn.commit()
+    _record_file(cur, path.name, size, digest, n)
+    cur.close()
+    conn.commit()
+    print(f"  {path.name}: {len(changed)}/{n} chunks changed")
+    return len(changed)
@@ -0,0 +1,147 @@
+"""
+Dependency-aware parallel stage executor for the BiDibiKala population scripts.
+
+A Stage names a function f(conn, **kwargs) with the tables it reads and
+writes. Stage B depends on an earlier stage A when A writes a table B reads
+or writes, or when B writes a table A reads, so the declaration order is kept
+wherever two stages touch the same table and everything else may overlap.
+
+Ready stages run in a process pool; every worker keeps one connection for its
+lifetime and commits after each stage. On the first failure no further stages
+are started, the running ones are allowed to finish, and run_pipeline returns
+False.
+
+Every successful stage is recorded in PipelineStage with a signature over its
+input files and the signatures of the stages it depends on. With incremental,
+a stage whose signature is unchanged is skipped, as is a once stage (generated
+data) that has run before, so an interrupted or repeated run resumes after the
+last stage that committed.
+"""
+import hashlib
+import os
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.util import Finalize
+
+from dotenv import load_dotenv
+
+import manifest
+
+load_dotenv()
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "0")) or os.cpu_count() or 1
+
+Stage = namedtuple("Stage", "name func reads writes kwargs inputs once", defaults=((), (), None, (), False))
+
+_conn = None  # this worker's connection
+
+
+def build_dag(stages):
+    """Stage name -> set of stage names it must wait for."""
+    deps = {}
+    for i, stage in enumerate(stages):
+        touched = set(stage.reads) | set(stage.writes)
+        deps[stage.name] = {
+            prev.name for prev in stages[:i]
+            if set(prev.writes) & touched or set(prev.reads) & set(stage.writes)
+        }
+    return deps
+
+
+def _plan(stages, deps, stored, incremental):
+    """(stage name -> signature, names of stages to skip).
+
+    A signature hashes the stage name, the size and SHA-256 of its input files and
+    the signatures of its dependencies. A skipped stage keeps its stored
+    signature, since its tables still hold that run's rows.
+    """
+    sigs, skip = {}, set()
+    for stage in stages:
+        h = hashlib.sha256(stage.name.encode("utf-8"))
+        for path in stage.inputs:
+            size, digest = manifest.file_digest(path) if os.path.exists(path) else (0, "")
+            h.update(f"|{os.path.basename(path)}:{size}:{digest}".encode("utf-8"))
+        for dep in sorted(deps[stage.name]):
+            h.update(f"|{dep}:{sigs[dep]}".encode("utf-8"))
+        sig = h.hexdigest()
+        if incremental and stage.name in stored and (stage.once or stored[stage.name] == sig):
+            skip.add(stage.name)
+            sig = stored[stage.name]
+        sigs[stage.name] = sig
+    return sigs, skip
+
+
+def _init_worker(connect):
+    global _conn
+    _conn = connect()
+    Finalize(_conn, _conn.close, exitpriority=10)
+
+
+def _run_stage(stage, signature):
+    """Run one stage on this worker's connection and record it. Returns (elapsed seconds, traceback text or None)."""
+    start = time.perf_counter()
+    try:
+        stage.func(_conn, **(stage.kwargs or {}))
+        with _conn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO PipelineStage (StageName, Signature, CompletedAt) VALUES (%s, %s, CURRENT_TIMESTAMP)
+                   ON CONFLICT (StageName) DO UPDATE SET Signature = EXCLUDED.Signature, CompletedAt = EXCLUDED.CompletedAt""",
+                (stage.name, signature),
+            )
+        _conn.commit()
+    except Exception:
+        _conn.rollback()
+        return time.perf_counter() - start, traceback.format_exc()
+    return time.perf_counter() - start, None
+
+
+def run_pipeline(stages, connect, workers=None, incremental=False):
+    """Run stages as their dependencies allow on up to workers processes. Returns True if all succeeded.
+    With incremental, stages recorded with the current signature (or once stages run before) are skipped."""
+    deps = build_dag(stages)
+    workers = workers or PIPELINE_WORKERS
+
+    conn = connect()
+    try:
+        manifest.ensure_tables(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT StageName, Signature FROM PipelineStage")
+            stored = dict(cur.fetchall())
+    finally:
+        conn.close()
+    sigs, skip = _plan(stages, deps, stored, incremental)
+    for stage in stages:
+        if stage.name in skip:
+            print(f"[pipeline] skip  {stage.name} (unchanged)")
+
+    done, started, running = set(skip), set(skip), {}
+    failed = None
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(connect,)) as pool:
+        while True:
+            if failed is None:
+                for stage in stages:
+                    if stage.name not in started and deps[stage.name] <= done:
+                        started.add(stage.name)
+                        print(f"[pipeline] start {stage.name}")
+                        running[pool.submit(_run_stage, stage, sigs[stage.name])] = stage
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                elapsed, error = future.result()
+                if error is None:
+                    done.add(stage.name)
+                    print(f"[pipeline] done  {stage.name} ({elapsed:.1f}s)")
+                else:
+                    print(f"[pipeline] FAILED {stage.name} ({elapsed:.1f}s)\n{error}")
+                    failed = failed or stage.name
+
+    if failed is not None:
+        skipped = [s.name for s in stages if s.name not in started]
+        print(f"[pipeline] stopped after {failed} failed; not run: {', '.join(skipped) or 'none'}")
+        return False
+    return True
@@ -13,28 +13,42 @@ Methodology:
 - Therefore: sum(Deposits) = final_balance + sum(Payments)
 - We create Payment transactions for each wallet order, then Deposit
   transactions (one or more) that sum to the required total.
+
+Usage:
+  python scripts/reconstruct_wallet.py                          # reconstruct, then verify
+  python scripts/reconstruct_wallet.py --incremental            # only customers whose inputs changed
+  python scripts/reconstruct_wallet.py --verify [--incremental] # verify only
 """
 import os
+import sys
 from datetime import datetime, timedelta
 from decimal import Decimal
+from pathlib import Path
 
-import psycopg2
 from dotenv import load_dotenv
 
+import db
+
 load_dotenv()
 
+VERIFY_SQL_PATH = Path(__file__).resolve().parent.parent / "init" / "05-wallet-verify.sql"
+STATE_SQL_PATH = Path(__file__).resolve().parent.parent / "init" / "06-wallet-reconstruct-state.sql"
+# "sql": build the history with one INSERT ... SELECT in the database; "python": in this process
+WALLET_RECONSTRUCT = os.getenv("WALLET_RECONSTRUCT", "sql").lower()
+TRANSACTION_COLUMNS = ("TransactionID", "CustomerID", "Type", "Amount", "Date")
 
-def get_conn():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "bdbkala"),
-        user=os.getenv("PGUSER", "admin"),
-        password=os.getenv("PGPASSWORD", "admin"),
-    )
+
+def reconstruct(conn, engine=None):
+    """Rebuild WalletTransaction from Wallet and wallet-paid orders. Returns the number of transactions."""
+    if (engine or WALLET_RECONSTRUCT) == "sql":
+        n = reconstruct_sql(conn)
+    else:
+        n = reconstruct_python(conn)
+    _save_state(conn)
+    return n
 
 
-def reconstruct(conn):
+def reconstruct_python(conn):
     cur = conn.cursor()
 
     # Get all wallets with final balance
@@ -45,7 +59,8 @@ def reconstruct(conn):
     cur.execute(
         """SELECT CustomerID, OrderID, TotalAmount, OrderDate
            FROM Order_Header
-           WHERE PaymentMethod = 'wallet' AND TotalAmount > 0"""
+           WHERE PaymentMethod = 'wallet' AND TotalAmount > 0
+           ORDER BY OrderID"""
     )
     wallet_orders = cur.fetchall()
 
@@ -128,18 +143,135 @@ def reconstruct(conn):
 
     # Sort by (CustomerID, Date) so deposits come before payments chronologically per customer
     transactions.sort(key=lambda t: (t[1], t[4]))
-    for i, (_, cid, ttype, amount, tdate) in enumerate(transactions):
-        tid = i + 1
-        cur.execute(
-            "INSERT INTO WalletTransaction (TransactionID, CustomerID, Type, Amount, Date) VALUES (%s, %s, %s, %s, %s)",
-            (tid, cid, ttype, amount, tdate),
-        )
+    db.copy_rows(conn, "WalletTransaction", TRANSACTION_COLUMNS,
+                 ((i + 1, cid, ttype, amount, tdate) for i, (_, cid, ttype, amount, tdate) in enumerate(transactions)))
 
     conn.commit()
     cur.close()
     return len(transactions)
 
 
+# Same history as reconstruct_python, set-based. Rows are numbered in the order the Python
+# path sorts them: customer, date, then payments (by OrderID) before deposits. Deposits
+# above 10,000 always split in five (min(5, int(required / 1000) + 1) is 5 there), and
+# required / 5 never ends in a half cent, so round() agrees with Decimal's half-even.
+# {wallets} is Wallet or a subset of it; new TransactionIDs start after {base}.
+_RECONSTRUCT_SQL = """
+    WITH pay AS (
+        SELECT o.CustomerID, o.OrderID, o.TotalAmount, o.OrderDate
+        FROM Order_Header o
+        JOIN {wallets} w ON w.CustomerID = o.CustomerID
+        WHERE o.PaymentMethod = 'wallet' AND o.TotalAmount > 0
+    ),
+    need AS (
+        SELECT w.CustomerID,
+               w.Balance + COALESCE(p.Total, 0) AS Required,
+               COALESCE(date_trunc('day', p.Earliest), TIMESTAMP '2020-01-01') AS Earliest
+        FROM {wallets} w
+        LEFT JOIN (
+            SELECT CustomerID, SUM(TotalAmount) AS Total, MIN(OrderDate) AS Earliest FROM pay GROUP BY CustomerID
+        ) p ON p.CustomerID = w.CustomerID
+    ),
+    tx AS (
+        SELECT CustomerID, 'Payment' AS Type, -TotalAmount AS Amount, OrderDate AS Date, 0 AS Kind, OrderID AS Seq
+        FROM pay
+        UNION ALL
+        SELECT CustomerID, 'Deposit', Required, Earliest - INTERVAL '7 days', 1, 0
+        FROM need
+        WHERE Required > 0 AND Required <= 10000
+        UNION ALL
+        SELECT n.CustomerID, 'Deposit',
+               CASE WHEN i < 4 THEN round(n.Required / 5, 2) ELSE n.Required - 4 * round(n.Required / 5, 2) END,
+               n.Earliest - (30 * (5 - i)) * INTERVAL '1 day', 1, i
+        FROM need n
+        CROSS JOIN generate_series(0, 4) AS i
+        WHERE n.Required > 10000
+    )
+    SELECT {base} + row_number() OVER (ORDER BY CustomerID, Date, Kind, Seq), CustomerID, Type, Amount, Date
+    FROM tx"""
+
+
+def reconstruct_sql(conn):
+    """reconstruct_python in one statement, without moving rows to the client."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM WalletTransaction")
+    n = db.insert_select(conn, "WalletTransaction", TRANSACTION_COLUMNS, _RECONSTRUCT_SQL.format(wallets="Wallet", base=0))
+    conn.commit()
+    cur.close()
+    return n
+
+
+# Per-wallet digest of everything the history is derived from: balance and wallet-paid orders
+_INPUT_DIGEST_SQL = """
+    SELECT w.CustomerID,
+           md5(COALESCE(w.Balance::text, '') || '|' || COALESCE(string_agg(
+               o.OrderID || ':' || o.TotalAmount || ':' || o.OrderDate, ',' ORDER BY o.OrderID), '')) AS Digest
+    FROM Wallet w
+    LEFT JOIN Order_Header o
+      ON o.CustomerID = w.CustomerID AND o.PaymentMethod = 'wallet' AND o.TotalAmount > 0
+    GROUP BY w.CustomerID, w.Balance"""
+
+
+def _ensure_state(conn):
+    """Create WalletReconstructState (init/06-wallet-reconstruct-state.sql). Returns True if it was missing."""
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('walletreconstructstate') IS NULL")
+    missing = cur.fetchone()[0]
+    if missing:
+        cur.execute(STATE_SQL_PATH.read_text())
+        conn.commit()
+    cur.close()
+    return missing
+
+
+def _save_state(conn):
+    """Record the input digest of every wallet after a full reconstruction."""
+    _ensure_state(conn)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM WalletReconstructState")
+    cur.execute(f"INSERT INTO WalletReconstructState (CustomerID, Digest) SELECT CustomerID, Digest FROM ({_INPUT_DIGEST_SQL}) d")
+    conn.commit()
+    cur.close()
+
+
+def reconstruct_incremental(conn):
+    """Rebuild history only for customers whose balance or wallet orders changed since the last run.
+
+    Changed customers are found by comparing per-wallet input digests with
+    WalletReconstructState. Their transactions are replaced with ones numbered
+    after the current maximum TransactionID; everyone else keeps theirs. Customers
+    without a wallet lose their history. Falls back to a full rebuild when no
+    state was recorded yet. Returns (customers rebuilt, transactions written).
+    """
+    if _ensure_state(conn):
+        n = reconstruct(conn)
+        return None, n
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS _wallet_changed")
+    cur.execute(
+        f"""CREATE TEMP TABLE _wallet_changed AS
+            SELECT COALESCE(d.CustomerID, s.CustomerID) AS CustomerID, d.Digest
+            FROM ({_INPUT_DIGEST_SQL}) d
+            FULL JOIN WalletReconstructState s ON s.CustomerID = d.CustomerID
+            WHERE d.Digest IS DISTINCT FROM s.Digest"""
+    )
+    cur.execute("ALTER TABLE _wallet_changed ADD PRIMARY KEY (CustomerID)")
+    cur.execute("DELETE FROM WalletTransaction t USING _wallet_changed c WHERE t.CustomerID = c.CustomerID")
+    cur.execute("SELECT COALESCE(MAX(TransactionID), 0) FROM WalletTransaction")
+    base = cur.fetchone()[0]
+    n = db.insert_select(conn, "WalletTransaction", TRANSACTION_COLUMNS, _RECONSTRUCT_SQL.format(
+        wallets="(SELECT w.* FROM Wallet w JOIN _wallet_changed c ON c.CustomerID = w.CustomerID)", base=base,
+    ))
+    cur.execute("DELETE FROM WalletReconstructState s USING _wallet_changed c WHERE s.CustomerID = c.CustomerID")
+    cur.execute("INSERT INTO WalletReconstructState (CustomerID, Digest) SELECT CustomerID, Digest FROM _wallet_changed WHERE Digest IS NOT NULL")
+    cur.execute("SELECT COUNT(*) FROM _wallet_changed")
+    changed = cur.fetchone()[0]
+    cur.execute("DROP TABLE _wallet_changed")
+    conn.commit()
+    cur.close()
+    return changed, n
+
+
 def _earliest_date(payments_list):
     if not payments_list:
         return datetime(2020, 1, 1)
@@ -150,42 +282,91 @@ def _earliest_date(payments_list):
     return datetime(2020, 1, 1)
 
 
-def verify(conn):
-    """Verify reconstruction: for each customer, sum(Deposits)-sum(Payments) should equal Wallet.Balance"""
+# Customers whose transactions do not add up to Wallet.Balance; {scope} narrows both sides
+_MISMATCH_SQL = """
+    SELECT w.CustomerID, COALESCE(t.Balance, 0), w.Balance
+    FROM Wallet w
+    LEFT JOIN (
+        SELECT CustomerID, SUM(CASE WHEN Type = 'Deposit' THEN Amount ELSE -ABS(Amount) END) AS Balance
+        FROM WalletTransaction
+        WHERE TRUE {scope}
+        GROUP BY CustomerID
+    ) t ON t.CustomerID = w.CustomerID
+    WHERE ABS(COALESCE(t.Balance, 0) - w.Balance) > 0.01 {scope_w}
+    ORDER BY w.CustomerID"""
+
+
+def ensure_verify_tracking(conn):
+    """Create WalletVerifyPending and its triggers (init/05-wallet-verify.sql). Returns True if they were missing."""
     cur = conn.cursor()
-    cur.execute("SELECT CustomerID, Balance FROM Wallet")
-    errors = []
-    for cid, expected in cur.fetchall():
-        cur.execute(
-            """SELECT Type, Amount FROM WalletTransaction WHERE CustomerID = %s""",
-            (cid,),
-        )
-        balance = Decimal("0")
-        for ttype, amount in cur.fetchall():
-            amt = Decimal(str(amount))
-            if ttype == "Deposit":
-                balance += amt
-            else:
-                balance -= abs(amt)
-        expected = Decimal(str(expected))
-        if abs(balance - expected) > Decimal("0.01"):
-            errors.append((cid, float(balance), float(expected)))
+    cur.execute("SELECT to_regclass('walletverifypending') IS NULL")
+    missing = cur.fetchone()[0]
+    if missing:
+        cur.execute(VERIFY_SQL_PATH.read_text())
+        conn.commit()
+    cur.close()
+    return missing
+
+
+def verify(conn, incremental=False):
+    """Verify reconstruction: for each customer, sum(Deposits)-sum(Payments) should equal Wallet.Balance.
+
+    One aggregated join returns only the mismatching customers. With incremental, only
+    customers in WalletVerifyPending (touched since they last passed) are checked; the
+    first incremental run sets up the tracking and checks everyone.
+    """
+    if incremental and ensure_verify_tracking(conn):
+        incremental = False
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('walletverifypending') IS NOT NULL")
+    tracked = cur.fetchone()[0]
+    if tracked:
+        # Writers touching a wallet wait until the pending set below is settled
+        cur.execute("LOCK TABLE WalletVerifyPending IN EXCLUSIVE MODE")
+    if incremental:
+        pending = "CustomerID IN (SELECT CustomerID FROM WalletVerifyPending)"
+        cur.execute(_MISMATCH_SQL.format(scope="AND " + pending, scope_w="AND w." + pending))
+    else:
+        cur.execute(_MISMATCH_SQL.format(scope="", scope_w=""))
+    errors = [(cid, float(balance), float(expected)) for cid, balance, expected in cur.fetchall()]
+    if tracked:
+        bad = [cid for cid, _, _ in errors]
+        cur.execute("DELETE FROM WalletVerifyPending WHERE NOT (CustomerID = ANY(%s))", (bad,))
+        cur.execute("INSERT INTO WalletVerifyPending (CustomerID) SELECT unnest(%s::int[]) ON CONFLICT DO NOTHING", (bad,))
+    conn.commit()
     cur.close()
     return errors
 
 
-def main():
-    conn = get_conn()
-    try:
+def reconstruct_and_verify(conn, incremental=False):
+    if incremental:
+        changed, n = reconstruct_incremental(conn)
+        if changed is None:
+            print(f"Created {n} wallet transactions (no previous run recorded).")
+        else:
+            print(f"Rebuilt history for {changed} changed customers ({n} wallet transactions).")
+    else:
         n = reconstruct(conn)
         print(f"Created {n} wallet transactions.")
-        errs = verify(conn)
-        if errs:
-            print(f"WARNING: {len(errs)} customers have balance mismatch: {errs[:5]}...")
+    verify_and_report(conn, incremental=incremental)
+
+
+def verify_and_report(conn, incremental=False):
+    errs = verify(conn, incremental=incremental)
+    if errs:
+        print(f"WARNING: {len(errs)} customers have balance mismatch: {errs[:5]}...")
+    else:
+        print("Verification passed: all wallet balances consistent.")
+
+
+def main():
+    args = sys.argv[1:]
+    with db.connection() as conn:
+        if "--verify" in args:
+            verify_and_report(conn, incremental="--incremental" in args)
         else:
-            print("Verification passed: all wallet balances consistent.")
-    finally:
-        conn.close()
+            reconstruct_and_verify(conn, incremental="--incremental" in args)
+            db.analyze_loaded(conn, ("WalletTransaction",))
 
 
 if __name__ == "__main__":
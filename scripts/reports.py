@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Run the prepared reports in queries/*.sql with a result cache.
+
+Each report is PREPAREd once per pooled connection (db.connection()) and then
+only EXECUTEd. Results are cached by (report, parameters) for REPORT_CACHE_TTL
+seconds, at most REPORT_CACHE_SIZE of them (least recently used are evicted).
+
+The tables a report reads are looked up in the catalog from the names in its
+SQL, with views expanded to their tables. --install-triggers gives those tables
+(and only those) the trigger of init/08-report-cache.sql, which makes every
+write to them NOTIFY report_cache at commit; a ReportRunner refuses to start
+while one of the tables its reports read lacks it. A runner LISTENs on its own
+connection and drops the cached results of the reports that read a changed
+table. Every lookup first makes a round trip on the listener, so it sees the
+notifications of everything committed before it. With REPORT_CACHE_SYNC=0 a
+lookup only reads those already on the listener's socket: a hit then costs no
+round trip but may miss a change committed in the last moments. A miss always
+makes the round trip after running the report, and a result computed while
+one of its tables changed is not cached. Tables read only inside functions a
+report calls are not tracked.
+
+run_batch() runs a list of (report, params) jobs concurrently with asyncio on
+up to REPORT_POOL_SIZE asynchronous connections of its own (not cached). Each
+job's query is cancelled on the server after REPORT_TIMEOUT seconds or when the
+batch is cancelled; results come back in job order, failed jobs as their
+exception. --pack runs every report with the arguments of its EXECUTE.
+
+    python scripts/reports.py category_popularity Electronics --repeat 3
+    python scripts/reports.py 12 NULL 10
+    python scripts/reports.py --pack
+    python scripts/reports.py --install-triggers
+"""
+import argparse
+import asyncio
+import os
+import re
+import select
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+import db
+from sql_files import load_reports, strip_comments
+
+load_dotenv()
+
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "300"))
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_SYNC = os.getenv("REPORT_CACHE_SYNC", "1").lower() in ("1", "true", "yes")
+REPORT_POOL_SIZE = int(os.getenv("REPORT_POOL_SIZE", "4"))
+REPORT_TIMEOUT = float(os.getenv("REPORT_TIMEOUT", "60"))
+CHANNEL = "report_cache"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SQL_PATH = PROJECT_ROOT / "init" / "08-report-cache.sql"
+
+
+class Result(namedtuple("Result", "columns rows")):
+    # short: asyncio.run reprs its finished main task, and with it the results it returned
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"Result(columns={self.columns!r}, rows=<{len(self.rows)} rows>)"
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# Tables and materialized views among the given names, with views replaced by what they read
+_TABLES_SQL = """
+WITH RECURSIVE rels(oid) AS (
+    SELECT c.oid FROM pg_class c
+    WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p', 'v', 'm')
+      AND c.relname = ANY(%s)
+    UNION
+    SELECT d.refobjid
+    FROM rels
+    JOIN pg_rewrite r ON r.ev_class = rels.oid
+    JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+     AND d.refclassid = 'pg_class'::regclass AND d.refobjid <> rels.oid
+)
+SELECT DISTINCT c.relname FROM rels JOIN pg_class c ON c.oid = rels.oid WHERE c.relkind IN ('r', 'p', 'm')
+"""
+
+
+def _read_tables(cur, report):
+    """Tables and materialized views a report reads."""
+    names = {m.lower() for m in _IDENTIFIER.findall(strip_comments(report["prepare"]))}
+    cur.execute(_TABLES_SQL, (sorted(names),))
+    return frozenset(r[0] for r in cur.fetchall())
+
+
+def missing_notify_triggers(cur, tables):
+    """The tables among tables (materialized views aside) without the report cache trigger, sorted."""
+    cur.execute(
+        """SELECT c.relname FROM pg_class c
+           WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p') AND c.relname = ANY(%s)
+             AND NOT EXISTS (SELECT 1 FROM pg_trigger t WHERE t.tgrelid = c.oid AND t.tgname = 'trg_report_cache_notify')
+           ORDER BY 1""",
+        (sorted(tables),),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def install_notify_triggers(conn):
+    """Apply init/08-report-cache.sql and give its trigger to the tables the reports read, and only to them.
+
+    Returns the number of tables whose trigger was added or dropped.
+    """
+    cur = conn.cursor()
+    cur.execute(SQL_PATH.read_text())
+    tables = set()
+    for report in load_reports():
+        tables |= _read_tables(cur, report)
+    cur.execute("SELECT set_report_cache_triggers(%s)", (sorted(tables),))
+    changed = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return changed
+
+
+def report_index(selected=None):
+    """Reports of queries/*.sql by lower-case PREPARE name and by file number."""
+    index = {}
+    for report in load_reports(selected):
+        index[report["name"].lower()] = report
+        index[report["file"].rsplit(".", 1)[0]] = report
+    return index
+
+
+def _find(reports, name):
+    report = reports.get(str(name).lower())
+    if report is None:
+        raise KeyError(f"unknown report {name!r}")
+    return report
+
+
+class ReportRunner:
+    """Cached, prepared execution of the queries/*.sql reports. Safe to share between threads."""
+
+    def __init__(self, ttl=REPORT_CACHE_TTL, max_entries=REPORT_CACHE_SIZE, selected=None, sync=REPORT_CACHE_SYNC):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sync = sync
+        self.reports = report_index(selected)
+        self.hits = self.misses = 0
+        self._cache = OrderedDict()  # (report name, params) -> (expires at, result)
+        self._tables = {}  # report name -> tables it reads
+        self._versions = {}  # table -> number of changes seen
+        self._lock = threading.Lock()
+        self._listener = None
+        with db.connection() as conn, conn.cursor() as cur:
+            for report in self.reports.values():
+                self._tables[report["name"].lower()] = _read_tables(cur, report)
+            missing = missing_notify_triggers(cur, set().union(*self._tables.values()))
+        if missing:
+            raise RuntimeError(f"report cache trigger missing on {', '.join(missing)}; "
+                               "run python scripts/reports.py --install-triggers")
+        self._listen()
+
+    def _listen(self):
+        self._listener = db.connect()
+        self._listener.autocommit = True
+        with self._listener.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+
+    def _drain(self, sync=True):
+        """Apply the change notifications received so far (call with the lock held).
+
+        sync makes a round trip first, so that the notifications of every transaction
+        committed before it are read; otherwise only those already on the socket are.
+        """
+        try:
+            if sync:
+                with self._listener.cursor() as cur:
+                    cur.execute("SELECT 1")
+                self._listener.poll()
+            elif select.select([self._listener], [], [], 0)[0]:
+                self._listener.poll()
+        except psycopg2.Error:
+            # notifications may have been lost with the connection
+            self._listener.close()
+            self._cache.clear()
+            self._listen()
+            return
+        while self._listener.notifies:
+            table = self._listener.notifies.pop(0).payload
+            self._versions[table] = self._versions.get(table, 0) + 1
+            for key in [k for k in self._cache if table in self._tables.get(k[0], ())]:
+                del self._cache[key]
+
+    def _execute(self, report, params):
+        with db.connection() as conn, conn.cursor() as cur:
+            prepared = getattr(conn, "reports", None)
+            if prepared is None:
+                conn.reports = prepared = set()
+            name = report["name"]
+            if name not in prepared:
+                cur.execute(report["prepare"])
+                prepared.add(name)
+            if params:
+                cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+            else:
+                cur.execute(f"EXECUTE {name}")
+            return Result([d[0] for d in cur.description], cur.fetchall())
+
+    def run(self, name, *params):
+        """Result(columns, rows) of a report (PREPARE name or file number), from the cache when still valid."""
+        report = _find(self.reports, name)
+        key = (report["name"].lower(), params)
+        with self._lock:
+            self._drain(self.sync)
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            seen = dict(self._versions)
+
+        result = self._execute(report, params)
+
+        with self._lock:
+            self._drain()
+            tables = self._tables[key[0]]
+            if all(self._versions.get(t, 0) == seen.get(t, 0) for t in tables):
+                self._cache[key] = (time.monotonic() + self.ttl, result)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return result
+
+    def invalidate(self, name=None):
+        """Drop the cached results of one report, or all."""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+                return
+            report = _find(self.reports, name)["name"].lower()
+            for key in [k for k in self._cache if k[0] == report]:
+                del self._cache[key]
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+
+async def _wait(conn):
+    """Wait until an asynchronous psycopg2 connection has finished its current operation."""
+    loop = asyncio.get_running_loop()
+    fd = conn.fileno()
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+        if state == psycopg2.extensions.POLL_READ:
+            add, remove = loop.add_reader, loop.remove_reader
+        else:
+            add, remove = loop.add_writer, loop.remove_writer
+        ready = loop.create_future()
+        add(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            remove(fd)
+
+
+class _AsyncPool:
+    """Up to size asynchronous connections, opened on demand."""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._open = []
+        self.prepared = {}  # connection -> report names PREPAREd on it
+
+    async def acquire(self):
+        if self._idle.empty() and len(self._open) < self.size:
+            conn = psycopg2.connect(async_=1, **db._params())
+            self._open.append(conn)
+            try:
+                await _wait(conn)
+            except BaseException:
+                self._open.remove(conn)
+                conn.close()
+                raise
+            self.prepared[conn] = set()
+            return conn
+        return await self._idle.get()
+
+    def release(self, conn):
+        if conn.closed:
+            self._open.remove(conn)
+            del self.prepared[conn]
+        else:
+            self._idle.put_nowait(conn)
+
+    def close(self):
+        for conn in self._open:
+            conn.close()
+
+
+async def _query(conn, sql, params=None):
+    """Run sql on an asynchronous connection; cancelled on the server if the awaiting task is."""
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    try:
+        await _wait(conn)
+    except asyncio.CancelledError:
+        conn.cancel()
+        try:
+            await _wait(conn)
+        except psycopg2.Error:
+            pass  # QueryCanceledError, the connection stays usable
+        raise
+    return cur
+
+
+async def _run_job(pool, report, params, timeout, timings, i):
+    conn = await pool.acquire()
+    started = time.perf_counter()
+    try:
+        async def run():
+            name = report["name"]
+            if name not in pool.prepared[conn]:
+                await _query(conn, report["prepare"])
+                pool.prepared[conn].add(name)
+            if params is None:
+                call = f"EXECUTE {name}({report['args']})" if report["args"] else f"EXECUTE {name}"
+                cur = await _query(conn, call)
+            elif params:
+                cur = await _query(conn, f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+            else:
+                cur = await _query(conn, f"EXECUTE {name}")
+            return Result([d[0] for d in cur.description], cur.fetchall())
+
+        return await asyncio.wait_for(run(), timeout)
+    finally:
+        timings[i] = time.perf_counter() - started
+        pool.release(conn)
+
+
+async def run_batch(jobs, pool_size=REPORT_POOL_SIZE, timeout=REPORT_TIMEOUT, timings=None):
+    """Run [(report, params), ...] concurrently; params None uses the arguments of the report's EXECUTE.
+
+    Returns one entry per job in job order: its Result, or the exception it failed with
+    (TimeoutError after timeout seconds of execution, not counting the wait for a
+    connection). A timings list is filled with each job's execution seconds.
+    """
+    reports = report_index()
+    timings = timings if timings is not None else []
+    timings[:] = [0.0] * len(jobs)
+    pool = _AsyncPool(pool_size)
+
+    async def job(i, name, params):
+        report = _find(reports, name)
+        return await _run_job(pool, report, None if params is None else tuple(params), timeout, timings, i)
+
+    try:
+        return await asyncio.gather(*(job(i, n, p) for i, (n, p) in enumerate(jobs)), return_exceptions=True)
+    finally:
+        pool.close()
+
+
+def run_pack(pool_size=REPORT_POOL_SIZE, timeout=REPORT_TIMEOUT):
+    """Run every report with the arguments of its EXECUTE concurrently and print the timings."""
+    reports = load_reports()
+    timings = []
+    started = time.perf_counter()
+    results = asyncio.run(run_batch([(r["name"], None) for r in reports], pool_size, timeout, timings))
+    wall = time.perf_counter() - started
+    for report, result, seconds in zip(reports, results, timings):
+        outcome = f"{len(result.rows)} rows" if isinstance(result, Result) else f"FAILED {type(result).__name__}: {result}"
+        print(f"  {report['file']:>7} {report['name']}: {outcome} [{seconds * 1000:.0f} ms]")
+    print(f"{len(reports)} reports in {wall:.2f}s (queries took {sum(timings):.2f}s in total)")
+    return results
+
+
+def _arg(text):
+    return None if text.upper() == "NULL" else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a report of queries/*.sql through the result cache")
+    parser.add_argument("report", nargs="?", help="PREPARE name or file number, e.g. customer_value or 12")
+    parser.add_argument("params", nargs="*", help="report parameters (NULL for null)")
+    parser.add_argument("--repeat", type=int, default=1, help="run this many times (later runs hit the cache)")
+    parser.add_argument("--pack", action="store_true", help="run all reports concurrently (no cache)")
+    parser.add_argument("--pool", type=int, default=REPORT_POOL_SIZE, help="connections for --pack")
+    parser.add_argument("--timeout", type=float, default=REPORT_TIMEOUT, help="seconds per report for --pack")
+    parser.add_argument("--install-triggers", action="store_true",
+                        help="put the cache's change trigger on the tables the reports read")
+    args = parser.parse_args()
+
+    if args.install_triggers:
+        with db.connection() as conn:
+            changed = install_notify_triggers(conn)
+        print(f"Report cache triggers: {changed} tables changed")
+        return
+    if args.pack:
+        results = run_pack(args.pool, args.timeout)
+        sys.exit(0 if all(isinstance(r, Result) for r in results) else 1)
+    if not args.report:
+        parser.error("a report (or --pack) is required")
+
+    runner = ReportRunner()
+    try:
+        params = tuple(_arg(p) for p in args.params)
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = runner.run(args.report, *params)
+            print(f"{len(result.rows)} rows in {(time.perf_counter() - started) * 1000:.2f} ms")
+        print("\t".join(result.columns))
+        for row in result.rows:
+            print("\t".join("NULL" if v is None else str(v) for v in row))
+        print(f"cache: {runner.hits} hits, {runner.misses} misses")
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    main()
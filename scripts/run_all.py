@@ -5,19 +5,34 @@ Run all database population scripts in order:
 1. load_dataset.py - Import provided data
 2. generate_extra_data.py - Generate missing data with Faker
 3. reconstruct_wallet.py - Reconstruct wallet transaction history
+4. summaries.py - Refresh the incrementally maintained report tables
+
+By default the stages of all four scripts run through pipeline.py, in parallel
+where their tables allow (PIPELINE_WORKERS processes). --serial runs the four
+scripts one after another as separate processes instead.
+
+With LOAD_INCREMENTAL=1 only stages whose input files (or upstream stages)
+changed since their last successful run are executed, the loaders reload only
+the changed chunks of each file, and generated data is created once.
 """
-import os
 import subprocess
 import sys
 from pathlib import Path
 
-import psycopg2
 from dotenv import load_dotenv
 
+import db
+import generate_extra_data
+import load_dataset
+import reconstruct_wallet
+import summaries
+from pipeline import Stage, run_pipeline
+
 load_dotenv()
 
 SCRIPTS_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPTS_DIR.parent
+DATASET_DIR = PROJECT_ROOT / "dataset"
 
 
 def apply_constraints():
@@ -26,20 +41,9 @@ def apply_constraints():
     if not path.exists():
         return
     print(f"\n{'='*60}\nApplying constraints and triggers\n{'='*60}")
-    conn = psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "bdbkala"),
-        user=os.getenv("PGUSER", "admin"),
-        password=os.getenv("PGPASSWORD", "admin"),
-    )
-    try:
-        with conn.cursor() as cur:
-            cur.execute(path.read_text())
-        conn.commit()
-        print("Constraints and triggers applied successfully.")
-    finally:
-        conn.close()
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(path.read_text())
+    print("Constraints and triggers applied successfully.")
 
 
 def run(script_name):
@@ -52,11 +56,78 @@ def run(script_name):
         sys.exit(result.returncode)
 
 
+# Tables the triggers on a table write to (init/02-views.sql, 03, 05 and 07). A stage that
+# writes the table writes these too, so the pipeline never runs two stages that update the
+# same trigger-maintained rows at once.
+TRIGGER_WRITES = {
+    "BranchSupplyOffer": ("BranchProductBestOffer", "DailySalesProfitDirty"),
+    "Customer": ("CustomerLedger",),
+    "Order_Header": ("DailySalesProfitDirty", "CustomerBranchActivity", "CustomerLedger", "Customer"),
+    "OrderItem": ("DailySalesProfitDirty", "CategoryCooccurrence", "ProductCooccurrence", "CustomerLedger"),
+    "Product": ("CategoryCooccurrence", "ProductCooccurrence", "CustomerLedger", "ProductAttributeFacet"),
+    "RepaymentHistory": ("CustomerLedger",),
+    "ReturnRequest": ("CustomerLedger",),
+    "Wallet": ("WalletVerifyPending",),
+    "WalletTransaction": ("WalletTurnoverYearly", "WalletVerifyPending"),
+}
+
+
+def _writes(*tables):
+    """tables plus the tables their triggers write to."""
+    return tables + tuple(sorted({t for table in tables for t in TRIGGER_WRITES.get(table, ())} - set(tables)))
+
+
+STAGES = [
+    # load_dataset.py
+    Stage("branch_product_suppliers", load_dataset.stage_branch_product_suppliers,
+          reads=(), writes=_writes("Manager", "Branch", "Product", "Supplier", "BranchSupplyOffer"),
+          inputs=(DATASET_DIR / "branch_product_suppliers.csv",)),
+    Stage("products_properties", load_dataset.stage_products_properties,
+          reads=("Product",), writes=_writes("Product"), inputs=(DATASET_DIR / "products_properties.csv",)),
+    Stage("bdbkala_full", load_dataset.stage_bdbkala,
+          reads=("Branch", "Product", "Customer"),
+          writes=_writes("Product", "Customer", "Order_Header", "OrderItem", "Shipment"),
+          inputs=(DATASET_DIR / "BDBKala_full.csv",)),
+    Stage("wallet_balances", load_dataset.stage_wallet_balances,
+          reads=("Customer",), writes=_writes("Customer", "Wallet"), inputs=(DATASET_DIR / "wallet_balances.csv",)),
+    Stage("reviews", load_dataset.stage_reviews,
+          reads=("Order_Header", "Product"), writes=_writes("ProductReview"), inputs=(DATASET_DIR / "reviews.csv",)),
+    # generate_extra_data.py (random data, generated once)
+    Stage("warehouses", generate_extra_data.create_warehouses,
+          reads=("Branch",), writes=_writes("Warehouse"), once=True),
+    Stage("warehouse_inventory", generate_extra_data.create_warehouse_inventory,
+          reads=("Warehouse", "BranchSupplyOffer"), writes=_writes("WarehouseInventory"), once=True),
+    Stage("additional_orders", generate_extra_data.create_additional_orders,
+          reads=("Customer", "Branch", "Product", "Order_Header", "Shipment"),
+          writes=_writes("Order_Header", "OrderItem", "Shipment"), kwargs={"count": 300}, once=True),
+    Stage("repayment_history", generate_extra_data.create_repayment_history,
+          reads=("Order_Header",), writes=_writes("RepaymentHistory"), once=True),
+    Stage("return_requests", generate_extra_data.create_return_requests,
+          reads=("OrderItem", "ReturnRequest"), writes=_writes("ReturnRequest"), kwargs={"count": 50}, once=True),
+    # reconstruct_wallet.py
+    Stage("reconstruct_wallet", reconstruct_wallet.reconstruct_and_verify,
+          reads=("Wallet", "Order_Header"), writes=_writes("WalletTransaction"),
+          kwargs={"incremental": load_dataset.LOAD_INCREMENTAL}),
+    # summaries.py
+    Stage("summaries", summaries.refresh_all,
+          reads=("Order_Header", "OrderItem", "BranchSupplyOffer"),
+          writes=_writes("DailySalesProfit", "DailySalesProfitDirty")),
+]
+
+
 def main():
     #apply_constraints()
-    run("load_dataset.py")
-    run("generate_extra_data.py")
-    run("reconstruct_wallet.py")
+    if "--serial" in sys.argv[1:]:
+        run("load_dataset.py")
+        run("generate_extra_data.py")
+        run("reconstruct_wallet.py")
+        run("summaries.py")
+    elif not run_pipeline(STAGES, db.connect, incremental=load_dataset.LOAD_INCREMENTAL):
+        sys.exit(1)
+    else:
+        with db.connection() as conn:
+            maintained = {t for tables in TRIGGER_WRITES.values() for t in tables} - TRIGGER_WRITES.keys()
+            db.analyze_loaded(conn, sorted({t for stage in STAGES for t in stage.writes} - maintained))
     print("\n" + "=" * 60)
     print("All scripts completed successfully.")
     print("=" * 60)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic load-test dataset of a given scale factor from a seed.
+
+SF=1 is 10,000 orders and 2,000 new customers with empty wallets (SF=100: 1M orders). Orders
+reuse the loaded branches and products; customers, orders, items, shipments,
+BNPL repayments and return requests are generated column-wise with numpy and
+written with COPY, GEN_CHUNK_ORDERS orders per transaction. Names and
+addresses come from pools built once with a seeded Faker, so the same seed,
+scale factor and chunk size give the same rows (IDs continue after the
+current maximums).
+
+The rows satisfy init/03-constraints-triggers.sql: OrderDate is set to the
+transaction time by trg_order_date_now, so each chunk reads LOCALTIMESTAMP
+first and ships/repays on or after it; highest priority is never given to
+corporate customers with low income; boxes never go by ground and large
+envelopes never by air; items are inserted in statuses the insert trigger
+accepts, returned ones in the status matching the review result.
+
+    python scripts/scale_data.py --scale 10 --seed 42
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from faker import Faker
+
+import db
+from key_registry import KeyRegistry
+
+load_dotenv()
+
+ORDERS_PER_SF = 10_000
+CUSTOMERS_PER_SF = 2_000
+GEN_CHUNK_ORDERS = int(os.getenv("GEN_CHUNK_ORDERS", "50000"))
+POOL_SIZE = 5_000
+
+PAYMENTS = np.array(["credit card", "debit card", "cash", "wallet", "BNPL"])
+PRIORITIES = np.array(["lowest", "low", "medium", "high", "highest"])
+INCOME_LEVELS = np.array(["35000", "59999.5", "80000", None], dtype=object)
+ITEM_STATUSES = np.array(["item procurement", "awaiting payment", "shipped", "received"])
+RETURN_REASONS = np.array(["Defective product", "Wrong size", "Changed mind", "Received damaged"])
+REVIEW_RESULTS = np.array(["Approved", "Rejected", None], dtype=object)
+RETURN_STATUS = {"Approved": "Return Approved", "Rejected": "Return Rejected", None: "Pending Return Review"}
+REPAY_METHODS = np.array(["credit card", "debit card", "wallet"])
+# (PackType, PackSize, allowed TransportMethods): boxes not by ground, large envelopes not by air
+PACKS = [
+    ("box", "small", ["airmail", "air freight"]),
+    ("box", "medium", ["airmail", "air freight"]),
+    ("box", "large", ["airmail", "air freight"]),
+    ("envelope", "small-regular", ["ground", "airmail", "air freight"]),
+    ("envelope", "small-bubble", ["ground", "airmail", "air freight"]),
+    ("envelope", "large-regular", ["ground"]),
+    ("envelope", "large-bubble", ["ground"]),
+]
+MAX_ITEMS = 5
+RETURN_RATE = 0.01
+
+
+def build_pools(seed, size=POOL_SIZE):
+    """Names, phones, addresses, cities and zip codes from a seeded Faker, sampled by index later."""
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        "name": np.array([fake.name() for _ in range(size)], dtype=object),
+        "phone": np.array([fake.numerify("09#########") for _ in range(size)], dtype=object),
+        "address": np.array([fake.street_address() for _ in range(size)], dtype=object),
+        "city": np.array([fake.city() for _ in range(size)], dtype=object),
+        "zip": np.array([fake.zipcode() for _ in range(size)], dtype=object),
+    }
+
+
+def _next_id(cur, table, column):
+    cur.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+    return cur.fetchone()[0]
+
+
+def _is_low_income(income):
+    """Same test as fn_order_priority_small_business for the generated income levels."""
+    return np.array([v is not None and float(v) < 60000 for v in income])
+
+
+def generate_customers(rng, pools, n, first_id):
+    ids = np.arange(first_id, first_id + n)
+    pick = rng.integers(0, len(pools["name"]), n)
+    income = INCOME_LEVELS[rng.integers(0, len(INCOME_LEVELS), n)]
+    has_credit = rng.random(n) < 0.3
+    return pd.DataFrame({
+        "CustomerID": ids,
+        "Name": pools["name"][pick],
+        "Phone": pools["phone"][rng.integers(0, len(pools["phone"]), n)],
+        "Email": [f"sf.customer{i}@example.com" for i in ids],
+        "Age": rng.integers(18, 80, n),
+        "Gender": np.where(rng.random(n) < 0.5, "M", "F"),
+        "IncomeLevel": income,
+        "Nature": np.where(rng.random(n) < 0.15, "corporate", "consumer"),
+        "Tier": np.array(["new", "regular", "special"])[rng.integers(0, 3, n)],
+        "CreditLimit": np.where(has_credit, rng.integers(1_000, 50_000, n) * 1000, np.nan),
+        "Debt": 0,
+    })
+
+
+def generate_orders(rng, pools, customers, branches, products, n, first_order, first_shipment, first_return, now):
+    """DataFrames for n orders with their items, shipments, repayments and returns, dated from now."""
+    oids = np.arange(first_order, first_order + n)
+    cust = rng.integers(0, len(customers), n)
+    cids = customers["CustomerID"].to_numpy()[cust]
+    no_highest = (customers["Nature"].to_numpy()[cust] == "corporate") & customers["LowIncome"].to_numpy()[cust]
+    priority = rng.integers(0, len(PRIORITIES), n)
+    priority = np.where(no_highest & (priority == 4), rng.integers(0, 4, n), priority)
+    payment = PAYMENTS[rng.integers(0, len(PAYMENTS), n)]
+
+    # items: up to MAX_ITEMS draws per order, repeated products dropped
+    per_order = rng.integers(1, MAX_ITEMS + 1, n)
+    item_order = np.repeat(np.arange(n), per_order)
+    items = pd.DataFrame({
+        "order": item_order,
+        "ProductID": products[rng.integers(0, len(products), len(item_order))],
+    }).drop_duplicates(["order", "ProductID"])
+    m = len(items)
+    qty = rng.integers(1, 4, m)
+    unit_cents = rng.integers(1_000, 20_000, m)
+    items["OrderID"] = oids[items["order"].to_numpy()]
+    items["OrderDate"] = now
+    items["Quantity"] = qty
+    items["CalculatedItemPrice"] = unit_cents * qty / 100
+    status = ITEM_STATUSES[rng.integers(0, len(ITEM_STATUSES), m)].astype(object)
+
+    returned = np.flatnonzero(rng.random(m) < RETURN_RATE)
+    result = REVIEW_RESULTS[rng.integers(0, len(REVIEW_RESULTS), len(returned))]
+    status[returned] = [RETURN_STATUS[r] for r in result]
+    items["ItemStatus"] = status
+
+    ship_cents = rng.integers(500, 3_000, n)
+    item_cents = np.bincount(items["order"].to_numpy(), weights=unit_cents * qty, minlength=n)
+    total = (item_cents + ship_cents) / 100
+    orders = pd.DataFrame({
+        "OrderID": oids,
+        "OrderDate": now,
+        "Priority": PRIORITIES[priority],
+        "TotalAmount": total,
+        "PaymentMethod": payment,
+        "LoyaltyDiscount": 0,
+        "CustomerID": cids,
+        "BranchID": branches[rng.integers(0, len(branches), n)],
+    })
+
+    pack = rng.integers(0, len(PACKS), n)
+    transport = np.array([PACKS[p][2][k % len(PACKS[p][2])] for p, k in zip(pack, rng.integers(0, 6, n))])
+    ship_type = np.array(["standard", "same-day", "custom"])[rng.choice(3, n, p=[0.8, 0.15, 0.05])]
+    ship_days = np.where(ship_type == "same-day", 0, rng.integers(1, 8, n))
+    pool = rng.integers(0, len(pools["address"]), n)
+    shipments = pd.DataFrame({
+        "ShipmentID": np.arange(first_shipment, first_shipment + n),
+        "TrackingCode": [f"SF{oid:010d}" for oid in oids],
+        "ShipDate": now + pd.to_timedelta(ship_days, unit="D"),
+        "RecipientAddress": pools["address"][pool],
+        "City": pools["city"][pool],
+        "ZipCode": pools["zip"][pool],
+        "Type": ship_type,
+        "TransportMethod": transport,
+        "Cost": ship_cents / 100,
+        "PackType": [PACKS[p][0] for p in pack],
+        "PackSize": [PACKS[p][1] for p in pack],
+        "OrderID": oids,
+    })
+
+    bnpl = np.flatnonzero(payment == "BNPL")
+    installments = rng.integers(2, 5, len(bnpl))
+    rep_order = np.repeat(bnpl, installments)
+    rep_no = np.concatenate([np.arange(1, k + 1) for k in installments]) if len(bnpl) else np.array([], dtype=int)
+    repayments = pd.DataFrame({
+        "OrderID": oids[rep_order],
+        "PaymentDate": now + pd.to_timedelta(30 * rep_no, unit="D"),
+        "Amount": np.round(total[rep_order] / np.repeat(installments, installments), 2),
+        "PaymentMethod": REPAY_METHODS[rng.integers(0, len(REPAY_METHODS), len(rep_order))],
+    })
+
+    ret = items.iloc[returned]
+    request_days = rng.integers(1, 30, len(returned))
+    returns = pd.DataFrame({
+        "ReturnID": np.arange(first_return, first_return + len(returned)),
+        "RequestDate": now + pd.to_timedelta(request_days, unit="D"),
+        "Reason": RETURN_REASONS[rng.integers(0, len(RETURN_REASONS), len(returned))],
+        "ReviewResult": result,
+        "DecisionDate": pd.Series(now + pd.to_timedelta(request_days + rng.integers(1, 15, len(returned)), unit="D"))
+                        .where(pd.notna(result)),
+        "OrderID": ret["OrderID"].to_numpy(),
+        "ProductID": ret["ProductID"].to_numpy(),
+    })
+    return orders, items.drop(columns="order"), shipments, repayments, returns
+
+
+def _copy(conn, table, frame):
+    return db.copy_rows(conn, table, list(frame.columns), frame)
+
+
+def generate(conn, scale, seed=0, chunk_orders=None):
+    """Add scale * ORDERS_PER_SF orders (and scale * CUSTOMERS_PER_SF customers). Commits per chunk."""
+    chunk_orders = chunk_orders or GEN_CHUNK_ORDERS
+    n_orders = int(round(scale * ORDERS_PER_SF))
+    n_customers = max(1, int(round(scale * CUSTOMERS_PER_SF)))
+    registry = KeyRegistry.open(conn)
+    branches = np.array(sorted(registry.branch_ids()))
+    products = np.array(sorted(registry.products.values()))
+    if not len(branches) or not len(products):
+        raise RuntimeError("scale_data needs branches and products; run load_dataset.py first")
+
+    pools = build_pools(seed)
+    cur = conn.cursor()
+    rng = np.random.default_rng([seed, 0])
+    customers = generate_customers(rng, pools, n_customers, _next_id(cur, "Customer", "CustomerID"))
+    _copy(conn, "Customer", customers)
+    _copy(conn, "Wallet", pd.DataFrame({"CustomerID": customers["CustomerID"], "Balance": 0}))  # every customer has one
+    conn.commit()
+    customers["LowIncome"] = _is_low_income(customers["IncomeLevel"])
+    print(f"Created {len(customers)} customers")
+
+    totals = dict.fromkeys(("orders", "items", "shipments", "repayments", "returns"), 0)
+    for chunk, start in enumerate(range(0, n_orders, chunk_orders), start=1):
+        n = min(chunk_orders, n_orders - start)
+        rng = np.random.default_rng([seed, chunk])
+        cur.execute("SELECT LOCALTIMESTAMP")  # the OrderDate trg_order_date_now gives this transaction's orders
+        now = pd.Timestamp(cur.fetchone()[0])
+        frames = generate_orders(
+            rng, pools, customers, branches, products, n,
+            _next_id(cur, "Order_Header", "OrderID"), _next_id(cur, "Shipment", "ShipmentID"),
+            _next_id(cur, "ReturnRequest", "ReturnID"), now,
+        )
+        for key, table, frame in zip(totals, ("Order_Header", "OrderItem", "Shipment", "RepaymentHistory", "ReturnRequest"), frames):
+            totals[key] += _copy(conn, table, frame)
+        conn.commit()
+        print(f"  chunk {chunk}: {start + n}/{n_orders} orders")
+    cur.close()
+    print("Created " + ", ".join(f"{v} {k}" for k, v in totals.items()))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset of a given scale factor")
+    parser.add_argument("--scale", type=float, default=1.0, help=f"scale factor (1 = {ORDERS_PER_SF} orders)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=GEN_CHUNK_ORDERS, help="orders per transaction")
+    args = parser.parse_args()
+    with db.connection() as conn:
+        generate(conn, args.scale, args.seed, args.chunk)
+        db.analyze_loaded(conn, ("Customer", "Wallet", "Order_Header", "OrderItem", "Shipment", "RepaymentHistory", "ReturnRequest"))
+
+
+if __name__ == "__main__":
+    main()
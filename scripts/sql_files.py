@@ -0,0 +1,86 @@
+"""
+Reading the SQL files of the project: statements, comments and the prepared
+reports of queries/<N>.sql (one PREPARE and one EXECUTE per file), shared by
+bench_queries.py, reports.py and export.py.
+"""
+import re
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+QUERIES_DIR = PROJECT_ROOT / "queries"
+
+_PREPARE = re.compile(r"^\s*PREPARE\s+(\w+)", re.I)
+_EXECUTE = re.compile(r"\bEXECUTE\s+(\w+)\s*(?:\((.*)\))?\s*$", re.I | re.S)
+
+
+def split_statements(text):
+    """Split SQL text on semicolons outside quotes and comments; comment-only statements are dropped."""
+    statements, buf = [], []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "-" and text.startswith("--", i):
+            end = text.find("\n", i)
+            end = n if end < 0 else end
+            buf.append(text[i:end])
+            i = end
+            continue
+        if ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            buf.append(text[i:end])
+            i = end
+            continue
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if text[end] == ch:
+                    if end + 1 < n and text[end + 1] == ch:  # doubled quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+            buf.append(text[i:end + 1])
+            i = end + 1
+            continue
+        if ch == ";":
+            statements.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+        i += 1
+    statements.append("".join(buf))
+    return [s.strip() for s in statements if strip_comments(s).strip()]
+
+
+def strip_comments(sql):
+    """sql without its -- and /* */ comments."""
+    return re.sub(r"--[^\n]*|/\*.*?\*/", "", sql, flags=re.S)
+
+
+def load_report(path):
+    """{"file", "name", "prepare", "args"} for a report file; args is the SQL text inside EXECUTE (...)."""
+    prepare = name = args = None
+    for stmt in split_statements(Path(path).read_text(encoding="utf-8")):
+        body = strip_comments(stmt).strip()
+        m = _PREPARE.match(body)
+        if m:
+            name, prepare = m.group(1), stmt
+            continue
+        m = _EXECUTE.search(body)
+        if m and name and m.group(1).lower() == name.lower():
+            args = (m.group(2) or "").strip()
+    if prepare is None:
+        return None
+    return {"file": Path(path).name, "name": name, "prepare": prepare, "args": args or ""}
+
+
+def load_reports(selected=None):
+    """Reports of queries/<N>.sql in numeric order, optionally only the given file stems."""
+    paths = sorted(
+        (p for p in QUERIES_DIR.glob("*.sql") if p.stem.isdigit()),
+        key=lambda p: int(p.stem),
+    )
+    if selected:
+        paths = [p for p in paths if p.stem in selected]
+    return [r for r in (load_report(p) for p in paths) if r is not None]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Refresh the incrementally maintained report tables (init/02-views.sql).
+
+Triggers record which parts of a summary are stale; refreshing re-aggregates
+only those parts, so it is cheap to run after every load or at end of day.
+- DailySalesProfit (mv_daily_sales_profit): dates marked in DailySalesProfitDirty
+
+Tables maintained directly by triggers need no refresh; --check compares them with
+the query they replace:
+- CustomerLedger (queries/12.sql): against the per-customer CTE query; --repair
+  recomputes the mismatching customers
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+import db
+
+load_dotenv()
+
+
+def refresh_daily_sales_profit(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT refresh_daily_sales_profit()")
+    n = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    print(f"Refreshed daily sales/profit for {n} dates")
+
+
+# queries/12.sql before CustomerLedger, used as the reference by check_customer_ledger
+CUSTOMER_VALUE_SQL = """
+WITH direct_payments AS (
+    SELECT oh.CustomerID, SUM(oh.TotalAmount) AS TotalOrderPayments
+    FROM Order_Header oh
+    WHERE oh.PaymentMethod IN ('credit card', 'debit card', 'cash', 'wallet')
+    GROUP BY oh.CustomerID
+),
+bnpl_repayments AS (
+    SELECT oh.CustomerID, SUM(rh.Amount) AS TotalBNPLRepaid
+    FROM RepaymentHistory rh
+    JOIN Order_Header oh ON oh.OrderID = rh.OrderID
+    GROUP BY oh.CustomerID
+),
+approved_returns AS (
+    SELECT oh.CustomerID, SUM(oi.CalculatedItemPrice) AS TotalRefunded
+    FROM ReturnRequest rr
+    JOIN OrderItem oi ON oi.OrderID = rr.OrderID AND oi.ProductID = rr.ProductID
+    JOIN Order_Header oh ON oh.OrderID = rr.OrderID
+    WHERE rr.ReviewResult = 'Approved'
+    GROUP BY oh.CustomerID
+),
+tax_paid AS (
+    SELECT oh.CustomerID, SUM(oi.CalculatedItemPrice * p.TaxAmount) AS TotalTaxPaid
+    FROM OrderItem oi
+    JOIN Order_Header oh ON oh.OrderID = oi.OrderID
+    JOIN Product p ON p.ProductID = oi.ProductID
+    WHERE NOT EXISTS (
+        SELECT 1 FROM ReturnRequest rr
+        WHERE rr.OrderID = oi.OrderID AND rr.ProductID = oi.ProductID AND rr.ReviewResult = 'Approved'
+    )
+    GROUP BY oh.CustomerID
+)
+SELECT
+    c.CustomerID,
+    COALESCE(dp.TotalOrderPayments, 0) AS DirectPayments,
+    COALESCE(bp.TotalBNPLRepaid, 0) AS BNPLRepayments,
+    COALESCE(ar.TotalRefunded, 0) AS ApprovedReturnRefunds,
+    COALESCE(tp.TotalTaxPaid, 0) AS TotalTaxPaid
+FROM Customer c
+LEFT JOIN direct_payments dp ON dp.CustomerID = c.CustomerID
+LEFT JOIN bnpl_repayments bp ON bp.CustomerID = c.CustomerID
+LEFT JOIN approved_returns ar ON ar.CustomerID = c.CustomerID
+LEFT JOIN tax_paid tp ON tp.CustomerID = c.CustomerID
+"""
+
+
+def check_customer_ledger(conn, repair=False, show=10):
+    """Compare CustomerLedger with CUSTOMER_VALUE_SQL; returns the mismatching customer IDs."""
+    cur = conn.cursor()
+    cur.execute(
+        f"""WITH expected AS ({CUSTOMER_VALUE_SQL})
+            SELECT COALESCE(e.CustomerID, l.CustomerID),
+                   e.DirectPayments, e.BNPLRepayments, e.ApprovedReturnRefunds, e.TotalTaxPaid,
+                   l.DirectPayments, l.BNPLRepayments, l.ApprovedReturnRefunds, l.TotalTaxPaid
+            FROM expected e
+            FULL JOIN CustomerLedger l ON l.CustomerID = e.CustomerID
+            WHERE (e.DirectPayments, e.BNPLRepayments, e.ApprovedReturnRefunds, e.TotalTaxPaid)
+                  IS DISTINCT FROM
+                  (l.DirectPayments, l.BNPLRepayments, l.ApprovedReturnRefunds, l.TotalTaxPaid)
+            ORDER BY 1"""
+    )
+    rows = cur.fetchall()
+    for r in rows[:show]:
+        print(f"  customer {r[0]}: expected {r[1:5]}, ledger {r[5:9]}")
+    bad = [r[0] for r in rows]
+    print(f"Customer ledger: {len(bad)} mismatching customers")
+    if bad and repair:
+        # customers gone from Customer are dropped, the rest recomputed
+        cur.execute(
+            "DELETE FROM CustomerLedger l WHERE l.CustomerID = ANY(%s) "
+            "AND NOT EXISTS (SELECT 1 FROM Customer c WHERE c.CustomerID = l.CustomerID)",
+            (bad,),
+        )
+        cur.execute("SELECT fn_customer_ledger_recompute(%s)", (bad,))
+        conn.commit()
+        print(f"Recomputed {len(bad)} customers")
+    cur.close()
+    return bad
+
+
+def check_all(conn, repair=False):
+    """True when every trigger-maintained table matches its reference query."""
+    return not check_customer_ledger(conn, repair=repair)
+
+
+def refresh_all(conn):
+    refresh_daily_sales_profit(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="compare trigger-maintained tables with their queries")
+    parser.add_argument("--repair", action="store_true", help="with --check, recompute mismatching rows")
+    args = parser.parse_args()
+    with db.connection() as conn:
+        if args.check:
+            if not check_all(conn, repair=args.repair) and not args.repair:
+                raise SystemExit(1)
+            return
+        refresh_all(conn)
+
+
+if __name__ == "__main__":
+    main()